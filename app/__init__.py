@@ -1,25 +1,47 @@
 from flask_api import FlaskAPI
-from flask_sqlalchemy import SQLAlchemy
 
 # local import
 from instance.config import app_config
 from flask_cors import CORS
+from app.database import PooledSQLAlchemy
+from app.revocation import RevocationCache
+from app.tokens import TokenService
+from app.cache import ResponseCache
+from app.instrumentation import Metrics, start_request, finish_request
+from app.ratelimit import RateLimiter, ConcurrencyLimiter, admit_request, release_request
 
 # initialize sql-alchemy
-db = SQLAlchemy()
+db = PooledSQLAlchemy()
 
 def create_app(config_name):
     from app.models.category import Category
     from app.models.recipe import Recipe
     from app.models.recipeAuth import RecipeApp
+    from app.models.outbox import OutboxMessage
+    from app.models.ingredient import Ingredient, RecipeIngredient
+    from app.models.changelog import ChangeLog
+    from app.models.stats import UserStats
     app = FlaskAPI(__name__, instance_relative_config=True)
     app.config.from_object(app_config[config_name]) #app.config.from_object(app_config['development'])
     app.config.from_pyfile('config.py')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # the schema is managed by migrations (python manage.py db upgrade),
+    # so starting the app never runs DDL
     db.init_app(app)
     CORS(app)
-    with app.app_context():
-        db.create_all()
+    app.extensions['token_service'] = TokenService.from_config(app.config)
+    app.extensions['revocation_cache'] = RevocationCache(
+        sync_interval=app.config['REVOCATION_SYNC_INTERVAL'],
+        overlap=app.config['REVOCATION_SYNC_OVERLAP_SECONDS'])
+    app.extensions['response_cache'] = ResponseCache.from_config(app.config)
+    # registered first so shed and throttled requests are measured too
+    app.extensions['metrics'] = Metrics()
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.extensions['rate_limiter'] = RateLimiter.from_config(app.config)
+    app.extensions['concurrency_limiter'] = ConcurrencyLimiter.from_config(app.config)
+    app.before_request(admit_request)
+    app.teardown_request(release_request)
 
     # Blueprints
     # import the authentication blueprint and register it on the app
@@ -34,4 +56,24 @@ def create_app(config_name):
     from .recipes import recipe_api
     app.register_blueprint(recipe_api)
 
+    # import the export blueprint and register it on the app
+    from .export import export_api
+    app.register_blueprint(export_api)
+
+    # import the health blueprint and register it on the app
+    from .health import health_api
+    app.register_blueprint(health_api)
+
+    # import the metrics blueprint and register it on the app
+    from .metrics import metrics_api
+    app.register_blueprint(metrics_api)
+
+    # import the batch blueprint and register it on the app
+    from .batch import batch_api
+    app.register_blueprint(batch_api)
+
+    # import the sync blueprint and register it on the app
+    from .sync import sync_api
+    app.register_blueprint(sync_api)
+
     return app
@@ -0,0 +1,69 @@
+"""Async (ASGI) serving mode for the category and recipe endpoints.
+
+The category and recipe routes run as coroutines on an async engine
+(asyncpg for PostgreSQL, aiosqlite for SQLite), so a request waiting on the
+database no longer holds a whole worker. Every other route (auth, export,
+health, metrics, bulk import) is answered by the regular Flask app mounted
+behind them, in a thread pool. Both share the models, validation,
+serializers, token service and caches, so a request gets the same answer
+from either mode.
+
+It needs the packages in requirements-async.txt and is served with e.g.
+
+    uvicorn asgi:app --workers 4
+"""
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.routing import Mount
+
+from app import create_app
+
+# sync database uri schemes and the async driver used for them instead
+ASYNC_DRIVERS = {
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_url(uri):
+    """The database uri with the sync driver swapped for its async one"""
+    scheme, separator, rest = uri.partition('://')
+    if scheme not in ASYNC_DRIVERS:
+        raise ValueError('No async driver for {} databases'.format(scheme))
+    return ASYNC_DRIVERS[scheme] + separator + rest
+
+
+def create_engine(config):
+    """An async engine pooled with the same SQLALCHEMY_POOL_* settings as the sync one"""
+    url = async_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.startswith('sqlite'):
+        return create_async_engine(url)
+    if config.get('SQLALCHEMY_PGBOUNCER'):
+        # PgBouncer in transaction mode can't keep asyncpg's prepared statements
+        return create_async_engine(url, poolclass=NullPool,
+                                   connect_args={'statement_cache_size': 0})
+    return create_async_engine(
+        url, pool_size=config['SQLALCHEMY_POOL_SIZE'], max_overflow=config['SQLALCHEMY_MAX_OVERFLOW'],
+        pool_timeout=config['SQLALCHEMY_POOL_TIMEOUT'], pool_recycle=config['SQLALCHEMY_POOL_RECYCLE'],
+        pool_pre_ping=config.get('SQLALCHEMY_POOL_PRE_PING', False))
+
+
+def create_asgi_app(config_name):
+    """The async app, with the Flask app from create_app mounted behind it"""
+    from .views import routes, http_error
+    flask_app = create_app(config_name)
+    engine = create_engine(flask_app.config)
+    app = Starlette(routes=routes + [Mount('', app=WSGIMiddleware(flask_app))],
+                    exception_handlers={HTTPException: http_error},
+                    on_shutdown=[engine.dispose])
+    # the token service, caches and rate limiter live on the Flask app
+    app.state.flask = flask_app
+    app.state.engine = engine
+    app.state.sessions = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    return app
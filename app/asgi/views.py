@@ -0,0 +1,487 @@
+import json
+import math
+from functools import wraps
+
+from flask_sqlalchemy import Pagination
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.routing import Route
+
+from app import search, tokens, multiget
+from app.cache import LRUBackend
+from app.models.category import Category
+from app.models.recipe import Recipe
+from app.models.recipeAuth import RecipeApp, TOKEN_REVOKED
+from app.models.ingredient import Ingredient, RecipeIngredient, parse_ingredients
+from app.models.changelog import ChangeLog
+from app.models.stats import UserStats
+from app.pagination import KeysetPage, page_args, seek
+from app.ratelimit import MemoryBackend
+from app.serializers import (category_serializer, categories_with_links, dumps,
+                             recipe_listing_serializer, recipe_serializer)
+import validate
+
+
+def json_response(obj, status=200):
+    return Response(dumps(obj), status_code=status, media_type='application/json')
+
+
+def message(text, status):
+    return json_response({'message': text}, status)
+
+
+async def http_error(request, exc):
+    # errors go out as JSON, the way Flask-API renders them
+    return message(exc.detail, exc.status_code)
+
+
+async def request_data(request):
+    """The JSON or form body, like Flask-API's request.data"""
+    if request.headers.get('content-type', '').startswith('application/json'):
+        try:
+            data = json.loads(await request.body() or b'{}')
+        except ValueError as e:
+            raise HTTPException(400, 'JSON parse error - {}'.format(e))
+        return data if isinstance(data, dict) else {}
+    return await request.form()
+
+
+async def offload(backend, func, *args):
+    """Calls func, in the thread pool unless `backend` is in this process's memory"""
+    if isinstance(backend, (MemoryBackend, LRUBackend)):
+        return func(*args)
+    return await run_in_threadpool(func, *args)
+
+
+async def invalidate(request, *namespaces):
+    """Drops cached responses of the mounted Flask app, see app.cache.invalidate"""
+    cache = request.app.state.flask.extensions.get('response_cache')
+    if cache is not None:
+        await offload(cache.backend, cache.invalidate, *namespaces)
+
+
+async def token_claims(request, session, token):
+    """RecipeApp.token_claims for access tokens, syncing revocations on the async session"""
+    extensions = request.app.state.flask.extensions
+    claims = RecipeApp.verified_claims(extensions['token_service'], token, tokens.ACCESS)
+    if isinstance(claims, str):
+        return claims
+    revocations = extensions['revocation_cache']
+    if revocations.sync_due():
+        await session.run_sync(revocations.sync)
+    if revocations.is_revoked(claims['jti']):
+        return TOKEN_REVOKED
+    return claims
+
+
+def login_required(endpoint):
+    """Checks the access token and the api rate limit, and opens the request's session.
+
+    `endpoint` is the matching Flask endpoint, so both modes share rate limit buckets.
+    """
+    def decorator(func):
+        @wraps(func)
+        async def auth(request):
+            auth_header = request.headers.get('Authorization')
+            if auth_header is None:
+                return message('No token provided. Please provide a valid token.', 401)
+            async with request.app.state.sessions() as session:
+                claims = await token_claims(request, session, auth_header.split(" ")[-1])
+                if isinstance(claims, str):
+                    return message(claims, 401)
+                user_id = claims['sub']
+                limiter = request.app.state.flask.extensions.get('rate_limiter')
+                if limiter is not None:
+                    wait = await offload(limiter.backend, limiter.check, 'api',
+                                         '{}:{}'.format(user_id, endpoint))
+                    if wait:
+                        retry_after = str(int(math.ceil(wait)))
+                        response = message('Too many requests. Try again in {} seconds.'.format(
+                            retry_after), 429)
+                        response.headers['Retry-After'] = retry_after
+                        return response
+                return await func(request, session, user_id, **request.path_params)
+        return auth
+    return decorator
+
+
+def dialect(session):
+    return session.bind.dialect.name
+
+
+async def count_rows(session, query):
+    return await session.scalar(select(func.count()).select_from(query.order_by(None).subquery()))
+
+
+async def paginate(session, query, page, per_page, error_out=True, count=None):
+    """app.pagination.paginate for a select(), count is a coroutine function"""
+    if error_out and page < 1:
+        raise HTTPException(404, 'Not found.')
+    items = (await session.execute(query.limit(per_page).offset((page - 1) * per_page))).all()
+    if error_out and not items and page != 1:
+        raise HTTPException(404, 'Not found.')
+    # no need to count when the first page isn't full
+    if page == 1 and len(items) < per_page:
+        total = len(items)
+    else:
+        total = await count() if count is not None else None
+        if total is None:
+            total = await count_rows(session, query)
+    return Pagination(None, page, per_page, total, items)
+
+
+async def keyset_page(session, query, key_column, cursor, per_page, with_total=False, count=None):
+    """KeysetPage for a select()"""
+    total = None
+    if with_total:
+        total = await count() if count is not None else None
+        if total is None:
+            total = await count_rows(session, query)
+    rows = (await session.execute(seek(query, key_column, cursor, per_page))).all()
+    return KeysetPage.from_rows(rows, key_column, per_page, total)
+
+
+def recipes_url_template(request):
+    return str(request.url_for('view_categories')) + '{}/recipes/'
+
+
+async def category_json(request, session, user_id, category_id):
+    row = (await session.execute(select(*category_serializer.columns).where(
+        Category.user_id == user_id).where(Category.category_id == category_id))).first()
+    if row is None:
+        return None
+    return categories_with_links([row], recipes_url_template(request))[0]
+
+
+async def recipe_json(session, user_id, category_id, recipe_id):
+    row = (await session.execute(select(*recipe_serializer.columns).where(
+        Recipe.user_id == user_id).where(Recipe.category_id == category_id).where(
+        Recipe.recipe_id == recipe_id))).first()
+    return recipe_serializer.row(row) if row is not None else None
+
+
+@login_required('category_api.create_categories')
+async def create_categories(request, session, user_id):
+    """Adds categories to the database"""
+    data = await request_data(request)
+    category_name = str(data.get('category_name', ''))
+    if category_name and validate.validate_name(category_name) == "True":
+        try:
+            # the unique (user_id, category_name) index rejects duplicates
+            result = await session.execute(Category.__table__.insert().values(
+                category_name=category_name, user_id=user_id))
+            await session.run_sync(lambda sync_session: UserStats.add(
+                user_id, categories=1, session=sync_session))
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            return message('Category already exists.', 409)
+        category_id = result.inserted_primary_key[0]
+        await invalidate(request, 'categories:{}'.format(user_id),
+                         'category:{}:{}'.format(user_id, category_id))
+        return json_response(await category_json(request, session, user_id, category_id), 201)
+    return message('Category name required.', 422)
+
+
+@login_required('category_api.view_categories')
+async def view_categories(request, session, user_id):
+    """Retrieves categories from the database"""
+    try:
+        page, per_page = page_args(request.query_params, 9, request.app.state.flask.config['MAX_PER_PAGE'])
+    except ValueError as e:
+        return message(str(e), 400)
+    q = str(request.query_params.get('q', ''))
+    query = select(*category_serializer.columns).where(Category.user_id == user_id)
+    # unless searching, the total is the user's category counter
+    count = None if q else lambda: session.scalar(
+        select(UserStats.category_count).where(UserStats.user_id == user_id))
+    if 'ids' in request.query_params:
+        # a multi-get, every category asked for in one IN query
+        try:
+            ids = multiget.parse_ids(request.query_params['ids'],
+                                     request.app.state.flask.config['BATCH_MAX_IDS'])
+        except ValueError as e:
+            return message(str(e), 400)
+        rows = (await session.execute(query.where(Category.category_id.in_(ids)))).all()
+        return json_response(multiget.ordered(
+            ids, categories_with_links(rows, recipes_url_template(request)), 'category_id'))
+    if 'cursor' in request.query_params:
+        # keyset pagination, seeks past the last category_id seen
+        cursor = request.query_params['cursor']
+        query = search.search(query, Category, q, ranked=False, dialect=dialect(session))
+        try:
+            categories = await keyset_page(session, query, Category.category_id, cursor, per_page,
+                                           request.query_params.get('include_total') == 'true', count)
+        except ValueError as e:
+            return message(str(e), 400)
+        if not categories.items and not cursor:
+            return message('no categories found', 404)
+        return json_response(categories.response(
+            categories_with_links(categories.items, recipes_url_template(request))))
+    categories = await paginate(session, search.search(query, Category, q, dialect=dialect(session)),
+                                page, per_page, False, count)
+    if categories.total <= 0:
+        return message('no categories found', 404)
+    if categories.items:
+        results = categories_with_links(categories.items, recipes_url_template(request))
+        return json_response({'results': results, 'page': categories.page, 'total': categories.total,
+                              'per_page': categories.per_page, 'next_page': categories.next_num})
+    return json_response({'msg': 'Page not found'}, 422)
+
+
+@login_required('category_api.view_one_category')
+async def view_one_category(request, session, user_id, category_id):
+    """Retrieve a category using it's ID"""
+    category = await category_json(request, session, user_id, category_id)
+    if category is None:
+        return message('No category found', 404)
+    return json_response(category, 201)
+
+
+@login_required('category_api.edit_category')
+async def edit_category(request, session, user_id, category_id):
+    """Edit a category using it's ID"""
+    data = await request_data(request)
+    try:
+        result = await session.execute(Category.__table__.update().where(
+            Category.user_id == user_id).where(Category.category_id == category_id).values(
+            category_name=str(data.get('category_name', ''))))
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        return message('Category already exists.', 409)
+    if not result.rowcount:
+        return message('No category found to edit', 404)
+    await invalidate(request, 'categories:{}'.format(user_id), 'category:{}:{}'.format(user_id, category_id))
+    return json_response(await category_json(request, session, user_id, category_id), 201)
+
+
+@login_required('category_api.delete_category')
+async def delete_category(request, session, user_id, category_id):
+    """Delete a category using it's ID"""
+    deleted = await session.run_sync(
+        lambda sync_session: Category.bulk_delete(user_id, [category_id], session=sync_session))
+    if not deleted:
+        return message('No category found to delete', 404)
+    await session.commit()
+    # the category namespace also covers every recipe view under it
+    await invalidate(request, 'categories:{}'.format(user_id), 'category:{}:{}'.format(user_id, category_id))
+    return message('category {} deleted successfully'.format(category_id), 200)
+
+
+@login_required('category_api.delete_categories')
+async def delete_categories(request, session, user_id):
+    """Deletes many categories, and all their recipes, by ID in one transaction"""
+    try:
+        ids = multiget.parse_ids(request.query_params.get('ids', ''),
+                                 request.app.state.flask.config['BATCH_MAX_IDS'])
+    except ValueError as e:
+        return message(str(e), 400)
+    deleted = await session.run_sync(
+        lambda sync_session: Category.bulk_delete(user_id, ids, session=sync_session))
+    await session.commit()
+    if deleted:
+        await invalidate(request, 'categories:{}'.format(user_id),
+                         *['category:{}:{}'.format(user_id, category_id) for category_id in deleted])
+    return json_response(multiget.deleted(ids, deleted))
+
+
+@login_required('category_api.get_username')
+async def get_username(request, session, user_id):
+    username = await session.scalar(select(RecipeApp.username).where(RecipeApp.user_id == user_id))
+    return json_response({'username': username})
+
+
+@login_required('recipe_api.create_recipes')
+async def create_recipes(request, session, user_id, category_id):
+    """Create recipes in an existing category"""
+    category = await session.scalar(select(Category.category_id).where(
+        Category.user_id == user_id).where(Category.category_id == category_id))
+    if category is None:
+        return message('Category doesnt exist.', 404)
+    data = await request_data(request)
+    recipe_name = str(data.get('recipe_name', ''))
+    ingredients = str(data.get('ingredients', ''))
+    directions = str(data.get('directions', ''))
+    if recipe_name and validate.validate_name(recipe_name) == "True":
+        try:
+            # the unique (user_id, recipe_name) index rejects duplicates
+            result = await session.execute(Recipe.__table__.insert().values(
+                recipe_name=recipe_name.title(), ingredients=ingredients, directions=directions,
+                user_id=user_id, category_id=category_id))
+            recipe_id = result.inserted_primary_key[0]
+
+            def link_and_count(sync_session):
+                RecipeIngredient.link([(recipe_id, user_id, ingredients)], replace=False,
+                                      session=sync_session)
+                UserStats.add(user_id, recipes=1, session=sync_session)
+                UserStats.add_recipes({category_id: 1}, session=sync_session)
+            await session.run_sync(link_and_count)
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            return message('Recipe already exists.', 409)
+        await invalidate(request, 'recipes:{}:{}'.format(user_id, category_id),
+                         'recipe:{}:{}'.format(user_id, recipe_id))
+        return json_response(await recipe_json(session, user_id, category_id, recipe_id), 201)
+    return message('Recipe name required.', 400)
+
+
+@login_required('recipe_api.view_recipes')
+async def view_recipes(request, session, user_id, category_id):
+    """View recipes in an existing category"""
+    try:
+        page, per_page = page_args(request.query_params, 6, request.app.state.flask.config['MAX_PER_PAGE'])
+    except ValueError as e:
+        return message(str(e), 400)
+    q = str(request.query_params.get('q', ''))
+    try:
+        serializer = recipe_listing_serializer(request.query_params.get('fields', ''))
+    except ValueError as e:
+        return message(str(e), 400)
+    query = select(*serializer.columns).where(Recipe.user_id == user_id).where(
+        Recipe.category_id == category_id)
+    # unless searching, the total is the category's recipe counter
+    count = None if q else lambda: session.scalar(select(Category.recipe_count).where(
+        Category.user_id == user_id).where(Category.category_id == category_id))
+    if 'cursor' in request.query_params:
+        # keyset pagination, seeks past the last recipe_id seen
+        cursor = request.query_params['cursor']
+        query = search.search(query, Recipe, q, ranked=False, dialect=dialect(session))
+        try:
+            recipes = await keyset_page(session, query, Recipe.recipe_id, cursor, per_page,
+                                        request.query_params.get('include_total') == 'true', count)
+        except ValueError as e:
+            return message(str(e), 400)
+        if not recipes.items and not cursor:
+            return message('No recipes found', 422)
+        return json_response(recipes.response(serializer.rows(recipes.items)))
+    recipes = await paginate(session, search.search(query, Recipe, q, dialect=dialect(session)),
+                             page, per_page, count=count)
+    results = serializer.rows(recipes.items)
+    if results:
+        return json_response({'results': results, 'page': recipes.page, 'total': recipes.total,
+                              'per_page': recipes.per_page, 'next_page': recipes.next_num})
+    return message('No recipes found', 422)
+
+
+@login_required('recipe_api.cook')
+async def cook(request, session, user_id):
+    """Ranks the user's recipes by how much of them the pantry covers"""
+    pantry = parse_ingredients(request.query_params.get('pantry', ''))
+    if not pantry:
+        return message('Pantry ingredients required.', 400)
+    try:
+        limit = min(int(request.query_params.get('limit', 20)), 100)
+    except ValueError:
+        return message('Invalid limit.', 400)
+    pantry_ids = list((await session.run_sync(
+        lambda sync_session: Ingredient.ids_for(pantry, session=sync_session))).values())
+    if not pantry_ids:
+        return message('No recipes found', 422)
+    # the same two statements as the sync view, see app.recipes.views.cook
+    have = func.count(RecipeIngredient.ingredient_id).label('have')
+    matches = select(RecipeIngredient.recipe_id, have).where(
+        RecipeIngredient.user_id == user_id).where(
+        RecipeIngredient.ingredient_id.in_(pantry_ids)).group_by(RecipeIngredient.recipe_id).subquery()
+    missing = (Recipe.ingredient_count - matches.c.have).label('missing')
+    rows = (await session.execute(select(
+        Recipe.recipe_id, Recipe.recipe_name, Recipe.category_id, Recipe.ingredient_count,
+        matches.c.have, missing).join(matches, matches.c.recipe_id == Recipe.recipe_id).order_by(
+        (matches.c.have * 1.0 / Recipe.ingredient_count).desc(), missing,
+        Recipe.recipe_id).limit(limit))).all()
+    if not rows:
+        return message('No recipes found', 422)
+    missing_names = {}
+    for recipe_id, name in await session.execute(select(RecipeIngredient.recipe_id, Ingredient.name).join(
+            Ingredient, Ingredient.ingredient_id == RecipeIngredient.ingredient_id).where(
+            RecipeIngredient.recipe_id.in_([row.recipe_id for row in rows])).where(
+            ~RecipeIngredient.ingredient_id.in_(pantry_ids)).order_by(Ingredient.name)):
+        missing_names.setdefault(recipe_id, []).append(name)
+    results = [{'recipe_id': row.recipe_id, 'recipe_name': row.recipe_name,
+                'category_id': row.category_id, 'ingredient_count': row.ingredient_count,
+                'have': row.have, 'missing': missing_names.get(row.recipe_id, []),
+                'coverage': round(float(row.have) / row.ingredient_count, 4)}
+               for row in rows]
+    return json_response({'pantry': pantry, 'results': results})
+
+
+@login_required('recipe_api.view_one_recipe')
+async def view_one_recipe(request, session, user_id, category_id, recipe_id):
+    """View one recipe in an existing category"""
+    recipe = await recipe_json(session, user_id, category_id, recipe_id)
+    if recipe is None:
+        return message('No recipe found', 404)
+    return json_response(recipe)
+
+
+@login_required('recipe_api.edit_recipe')
+async def edit_recipe(request, session, user_id, category_id, recipe_id):
+    """Edit a recipe in an existing category"""
+    where = (Recipe.user_id == user_id, Recipe.category_id == category_id, Recipe.recipe_id == recipe_id)
+    row = (await session.execute(select(Recipe.ingredients).where(*where))).first()
+    if row is None:
+        return message('No recipe found to edit', 404)
+    data = await request_data(request)
+    ingredients = str(data.get('ingredients', ''))
+    try:
+        await session.execute(Recipe.__table__.update().where(*where).values(
+            recipe_name=str(data.get('recipe_name', '')), ingredients=ingredients,
+            directions=str(data.get('directions', ''))))
+        if ingredients != row.ingredients:
+            await session.run_sync(lambda sync_session: RecipeIngredient.link(
+                [(recipe_id, user_id, ingredients)], session=sync_session))
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        return message('Recipe already exists.', 409)
+    await invalidate(request, 'recipes:{}:{}'.format(user_id, category_id),
+                     'recipe:{}:{}'.format(user_id, recipe_id))
+    return json_response(await recipe_json(session, user_id, category_id, recipe_id))
+
+
+@login_required('recipe_api.delete_recipe')
+async def delete_recipe(request, session, user_id, category_id, recipe_id):
+    """Delete a recipe in an existing category"""
+    await session.run_sync(lambda sync_session: RecipeIngredient.unlink([recipe_id], session=sync_session))
+    result = await session.execute(Recipe.__table__.delete().where(Recipe.user_id == user_id).where(
+        Recipe.category_id == category_id).where(Recipe.recipe_id == recipe_id))
+    if not result.rowcount:
+        # not the user's recipe, keep its links
+        await session.rollback()
+        return message('No recipe found to delete', 404)
+
+    def record_and_count(sync_session):
+        ChangeLog.record(user_id, recipes=[recipe_id], session=sync_session)
+        UserStats.add(user_id, recipes=-1, session=sync_session)
+        UserStats.add_recipes({category_id: -1}, session=sync_session)
+    await session.run_sync(record_and_count)
+    await session.commit()
+    await invalidate(request, 'recipes:{}:{}'.format(user_id, category_id),
+                     'recipe:{}:{}'.format(user_id, recipe_id))
+    return message('recipe {} deleted successfully'.format(recipe_id), 200)
+
+
+CATEGORY = '/api-v1/categories/{category_id:int}'
+RECIPE = CATEGORY + '/recipes/{recipe_id:int}'
+
+# the category_api and recipe_api routes, except bulk import which streams
+# its body through the mounted Flask app
+routes = [
+    Route('/api-v1/categories/', create_categories, methods=['POST']),
+    Route('/api-v1/categories/', view_categories, methods=['GET']),
+    Route('/api-v1/categories/', delete_categories, methods=['DELETE']),
+    Route(CATEGORY, view_one_category, methods=['GET']),
+    Route(CATEGORY, edit_category, methods=['PUT']),
+    Route(CATEGORY, delete_category, methods=['DELETE']),
+    Route('/api-v1/username', get_username, methods=['GET']),
+    Route(CATEGORY + '/recipes/', create_recipes, methods=['POST']),
+    Route(CATEGORY + '/recipes/', view_recipes, methods=['GET']),
+    Route('/api-v1/recipes/cook', cook, methods=['GET']),
+    Route(RECIPE, view_one_recipe, methods=['GET']),
+    Route(RECIPE, edit_recipe, methods=['PUT']),
+    Route(RECIPE, delete_recipe, methods=['DELETE']),
+]
@@ -1,32 +1,19 @@
-import os
-
-from flask import Blueprint, make_response, request, jsonify, Flask
+from flask import Blueprint, make_response, request, jsonify
 from flask.views import MethodView
-from flask_bcrypt import Bcrypt
 from flasgger import swag_from
-import jwt
-import datetime
-from flask_mail import Mail, Message
+from sqlalchemy.exc import IntegrityError
 
-from app.models.recipeAuth import RecipeApp, ExpiredToken
+from app.models.recipeAuth import RecipeApp, ExpiredToken, TOKEN_REVOKED
+from app import outbox, tokens
+from app.ratelimit import limit, shed
 from . import auth_blueprint
 import validate
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.secret_key = os.environ.get('SECRET')
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 465
-app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
-app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
-app.config['MAIL_USE_TLS'] = False
-app.config['MAIL_USE_SSL'] = True
-mail = Mail(app)
-
-recipients = []
 
 class RegistrationView(MethodView):
     """This class registers a new user."""
+    @limit('register')
+    @shed('password_hash')
     @swag_from('/app/docs/register.yml')
     def post(self):
         user = RecipeApp.query.filter_by(email=request.data['email']).first()
@@ -56,6 +43,8 @@ class RegistrationView(MethodView):
 
 class LoginView(MethodView):
     """This class-based view handles user login and access token generation."""
+    @limit('login')
+    @shed('password_hash')
     @swag_from('/app/docs/login.yml')
     def post(self):
         email = request.data['email']
@@ -68,51 +57,102 @@ class LoginView(MethodView):
                 return make_response(jsonify(response)), 400
             # Try to authenticate the found user using their password
             if user and user.password_is_valid(password):
-            # Generate the access token. This will be used as the authorization header
-                access_token = user.generate_token(user.user_id)
-                if access_token:
-                    response = {
-                        'message': 'You logged in successfully.',
-                        'access_token': access_token.decode(),
-                        'username':user.username}
-                    return make_response(jsonify(response)), 200
+                if user.password_needs_rehash():
+                    # the work factor changed, upgrade the hash while we have the password
+                    user.set_password(password)
+                    user.save()
+            # Generate the access token. This will be used as the authorization header,
+            # and the refresh token that gets new ones once it expires
+                response = {
+                    'message': 'You logged in successfully.',
+                    'username':user.username}
+                response.update(token_pair(user))
+                return make_response(jsonify(response)), 200
             return make_response(jsonify({'message': 'Invalid email or password, Please try again'})), 403
         except Exception as e:
             # Create a response containing an string error message
             return make_response(jsonify({'message': str(e)})), 500
 
 
+def token_pair(user):
+    """A new access token and refresh token for user"""
+    service = tokens.service()
+    return {'access_token': user.generate_token(tokens.ACCESS),
+            'refresh_token': user.generate_token(tokens.REFRESH),
+            'expires_in': service.lifetime(tokens.ACCESS)}
+
+
+class RefreshView(MethodView):
+    """This class exchanges a refresh token for a new access and refresh token."""
+    @limit('refresh')
+    @swag_from('/app/docs/refresh.yml')
+    def post(self):
+        claims = RecipeApp.token_claims(str(request.data.get('refresh_token', '')), tokens.REFRESH)
+        if isinstance(claims, str):
+            return make_response(jsonify({'message': claims})), 401
+        user = RecipeApp.query.filter_by(user_id=claims['sub']).first()
+        if not user:
+            return make_response(jsonify({'message': 'User does not exist!'})), 401
+        if not user.token_is_current(claims):
+            # issued before a password reset
+            return make_response(jsonify({'message': TOKEN_REVOKED})), 401
+        # refresh tokens are single use, a replayed one is refused, also when
+        # it's replayed to a worker that hasn't synced the revocation yet
+        try:
+            ExpiredToken(claims).save()
+        except IntegrityError:
+            return make_response(jsonify({'message': TOKEN_REVOKED})), 401
+        response = {'message': 'Token refreshed.'}
+        response.update(token_pair(user))
+        return make_response(jsonify(response)), 200
+
+
 class LogoutView(MethodView):
     @swag_from('/app/docs/logout.yml')
     def post(self):
         if request.method == "POST":
             auth_header = request.headers.get('Authorization')
-            access_token = auth_header.split(" ")[1]
+            access_token = auth_header.split(" ")[1] if auth_header else None
             if access_token:
-                # Attempt to decode the token and get the User ID
-                user_id = RecipeApp.decode_token(access_token)
-                if not isinstance(user_id, str):
+                # Attempt to decode the token and get its claims
+                claims = RecipeApp.token_claims(access_token)
+                if not isinstance(claims, str):
                     # Handle the request if the user is authenticated"""
-                    expired_token = ExpiredToken(token=access_token)
-                    expired_token.save()
+                    try:
+                        ExpiredToken(claims).save()
+                    except IntegrityError:
+                        # logged out on another worker already
+                        return make_response(jsonify({'message': TOKEN_REVOKED})), 401
+                    # revoke the refresh token as well when the client sends it
+                    refresh = RecipeApp.token_claims(
+                        str(request.data.get('refresh_token', '')), tokens.REFRESH)
+                    if not isinstance(refresh, str) and refresh['sub'] == claims['sub']:
+                        try:
+                            ExpiredToken(refresh).save()
+                        except IntegrityError:
+                            # revoked already, which is all logging out asks
+                            pass
                     return jsonify({'message': 'You have been logged out.'}),200
                 else:
-                    message = user_id
+                    message = claims
                     response = {'message': message}
                     return make_response(jsonify(response)), 401
             else:
-                return jsonify({'message': 'please provide a  valid token'})
+                return make_response(jsonify({'message': 'please provide a  valid token'})), 401
 
 
 class ResetPasswordView(MethodView):
+    @limit('reset_password')
+    @shed('password_hash')
     def post(self):
         auth_header = request.headers.get('Authorization')
         if auth_header is None:
             response = {
                 'message': 'No token provided. Please provide a valid token.'}
             return make_response(jsonify(response)), 401
-        access_token = auth_header.split(" ")[1]
-        if access_token:
+        # the reset token from the emailed link, only good for one reset
+        claims = RecipeApp.token_claims(auth_header.split(" ")[-1], tokens.RESET)
+        if not isinstance(claims, str):
             #register user
             email = request.data['email'].strip()
             new_password = request.data['new_password'].strip()
@@ -130,9 +170,16 @@ class ResetPasswordView(MethodView):
             if new_password != confirm_new_password:
                 return make_response(jsonify({'message': 'Password mismatch'}))
 
-            user = RecipeApp.query.filter_by(email=email).first()
-            if user:
-                user.password = Bcrypt().generate_password_hash(new_password).decode()
+            user = RecipeApp.query.filter_by(user_id=claims['sub']).first()
+            if user and user.email == email:
+                # used up first, so a replay on another worker can't reset again
+                try:
+                    ExpiredToken(claims).save()
+                except IntegrityError:
+                    return make_response(jsonify({'message': 'Invalid token'})), 401
+                user.set_password(new_password)
+                # whoever knew the old password may hold a refresh token
+                user.revoke_tokens()
                 user.save()
                 response = {'message': 'Your password has been reset'}
                 return make_response(jsonify(response)), 201
@@ -142,10 +189,11 @@ class ResetPasswordView(MethodView):
 
 class SendEmailView(MethodView):
     """ This will send an email with the token to reset password."""
+    @limit('send_email')
+    @limit('send_email_to', key=lambda: str(request.data.get('email', '')).strip().lower())
     def post(self):
-    # This method will edit the already existing password
+    # This method queues the reset password email, the outbox worker sends it
         email = request.data['email'].strip()
-        print(email)
         user = RecipeApp.query.filter_by(email=email).first()
         if not email:
             return make_response(jsonify({'message': 'Please input the email'})), 412
@@ -155,19 +203,13 @@ class SendEmailView(MethodView):
         if not user:
             return make_response(jsonify({'message': 'User does not exist!'})), 404
         try:
-            access_token = jwt.encode({'id': user.user_id, 'expiry_time': str(datetime.datetime.utcnow() +
-            datetime.timedelta(minutes=30))},
-            os.getenv('SECRET', '$#%^%$^%@@@@@56634@@@'))
-            print(access_token)
+            # signed with the same keys as every other token, and only
+            # accepted by the reset password endpoint
+            reset_token = user.generate_token(tokens.RESET)
             subject = "Yummy Recipes Reset Password"
-            recipients.append(email)
-            msg = Message(subject, sender="Admin", recipients=recipients)
             styles = "background-color:blue; color:white; padding: 5px 10px; border-radius:3px; text-decoration: none;"
-            msg.html = f"Click the link to reset password:\n \n<h3><a href='http://localhost:3000/resetpassword?tk={access_token.decode()}' style='{styles}'>Reset Password</a></h3>"
-            print(msg.html)
-            with app.app_context():
-                
-                mail.send(msg)
+            html = f"Click the link to reset password:\n \n<h3><a href='http://localhost:3000/resetpassword?tk={reset_token}' style='{styles}'>Reset Password</a></h3>"
+            outbox.enqueue(email, subject, html)
             return make_response(jsonify({'message': 'Password Reset link sent successfully to '+email+''})), 201
         except Exception as e:
             return make_response(jsonify({'message': 'Invalid request sent.'})), 400
@@ -177,6 +219,7 @@ registration_view = RegistrationView.as_view('registration_view')
 login_view = LoginView.as_view('login_view')
 logout_view = LogoutView.as_view('logout_view')
 reset_password_view = ResetPasswordView.as_view('reset_password_view')
+refresh_view = RefreshView.as_view('refresh_view')
 send_email_view = SendEmailView.as_view('send_email_view')
 
 
@@ -195,6 +238,14 @@ auth_blueprint.add_url_rule(
     methods=['POST']
 )
 
+# Define the rule for the refresh url --->  /auth/refresh
+# Then add the rule to the blueprint
+auth_blueprint.add_url_rule(
+    '/auth/refresh',
+    view_func=refresh_view,
+    methods=['POST']
+)
+
 # Define the rule for the logout url --->  /auth/logout
 # Then add the rule to the blueprint
 auth_blueprint.add_url_rule(
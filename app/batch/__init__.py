@@ -0,0 +1,6 @@
+from flask import Blueprint
+
+# This is the instance of a Blueprint that represents the batch blueprint
+batch_api = Blueprint('batch_api', __name__, url_prefix='/api-v1')
+
+from . import views
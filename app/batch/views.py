@@ -0,0 +1,139 @@
+import json
+from urllib.parse import urlsplit
+
+from flask import make_response, request, jsonify, current_app, g
+from flasgger import swag_from
+from werkzeug.exceptions import HTTPException
+
+from app import db, ratelimit
+from app.models.category import Category
+from app.models.recipe import Recipe
+from app.categories.views import login_required, SUBREQUEST_USER
+from app.serializers import json_response
+from . import batch_api
+
+
+def resolve_categories(user_id, view_args):
+    """Answers many view_one_category sub-requests with one IN query"""
+    ids = [args['category_id'] for args in view_args]
+    categories = dict((category.category_id, category) for category in Category.query.filter(
+        Category.user_id == user_id).filter(Category.category_id.in_(ids)))
+    for args in view_args:
+        category = categories.get(args['category_id'])
+        if category is None:
+            yield 404, {'message': 'No category found'}
+        else:
+            # the status view_one_category answers with
+            yield 201, category.category_json()
+
+
+def resolve_recipes(user_id, view_args):
+    """Answers many view_one_recipe sub-requests with one IN query"""
+    ids = [args['recipe_id'] for args in view_args]
+    recipes = dict((recipe.recipe_id, recipe) for recipe in Recipe.query.options(
+        db.undefer_group('body')).filter(Recipe.user_id == user_id).filter(
+        Recipe.recipe_id.in_(ids)))
+    for args in view_args:
+        recipe = recipes.get(args['recipe_id'])
+        if recipe is None or recipe.category_id != args['category_id']:
+            yield 404, {'message': 'No recipe found'}
+        else:
+            yield 200, recipe.recipe_json()
+
+
+# endpoints whose sub-requests are grouped and answered by one query per model
+RESOLVERS = {
+    'category_api.view_one_category': resolve_categories,
+    'recipe_api.view_one_recipe': resolve_recipes,
+}
+
+# the endpoints a batch may call, each answered with a bounded page or a
+# single row; exports, sync rounds and pantry rankings have to be asked for
+# on their own
+BATCHABLE = set(RESOLVERS) | {
+    'category_api.view_categories',
+    'category_api.get_stats',
+    'category_api.get_username',
+    'recipe_api.view_recipes',
+    'recipe_api.view_recipes_by_id',
+}
+
+
+def dispatch(user_id, path):
+    """Runs a GET sub-request through its view as the already authenticated user.
+
+    The request hooks are skipped, the batch itself was admitted and
+    measured, and the sub-request charged to the user's rate limit.
+    """
+    # the sub-request shares the batch's g, keep its teardown from freeing
+    # the batch's MAX_CONCURRENT_REQUESTS slot
+    admitted = g.pop('admitted', None)
+    try:
+        return run_subrequest(user_id, path)
+    finally:
+        if admitted is not None:
+            g.admitted = admitted
+
+
+def run_subrequest(user_id, path):
+    with current_app.test_request_context(
+            path, base_url=request.host_url, headers={'Accept': 'application/json'},
+            environ_base={SUBREQUEST_USER: user_id}):
+        try:
+            response = current_app.make_response(current_app.dispatch_request())
+        except Exception as e:
+            response = current_app.make_response(current_app.handle_user_exception(e))
+        body = response.get_data(as_text=True)
+    if response.mimetype == 'application/json' and body:
+        body = json.loads(body)
+    return response.status_code, body
+
+
+@batch_api.route('/batch', methods=['POST'])
+@login_required
+@swag_from('/app/docs/batch.yml')
+def batch(user_id):
+    """Runs many GET requests under one authentication check"""
+    subrequests = request.data.get('requests') if isinstance(request.data, dict) else None
+    if not isinstance(subrequests, list) or not subrequests:
+        return make_response(jsonify({'message': 'A list of requests is required.'})), 400
+    if len(subrequests) > current_app.config['BATCH_MAX_REQUESTS']:
+        response = {'message': 'At most {} requests per batch.'.format(
+            current_app.config['BATCH_MAX_REQUESTS'])}
+        return make_response(jsonify(response)), 413
+    adapter = current_app.url_map.bind_to_environ(request.environ)
+    results = [None] * len(subrequests)
+    grouped = {}
+    for index, subrequest in enumerate(subrequests):
+        path = subrequest.get('path') if isinstance(subrequest, dict) else None
+        if not isinstance(path, str) or not path.startswith('/'):
+            results[index] = 400, {'message': 'Each request needs a path.'}
+            continue
+        if str(subrequest.get('method', 'GET')).upper() != 'GET':
+            results[index] = 405, {'message': 'Only GET requests can be batched.'}
+            continue
+        try:
+            endpoint, view_args = adapter.match(urlsplit(path).path, method='GET')
+        except HTTPException:
+            # unknown paths and redirects are answered the way the app would
+            results[index] = dispatch(user_id, path)
+            continue
+        if endpoint not in BATCHABLE:
+            results[index] = 400, {'message': 'This endpoint can\'t be batched.'}
+            continue
+        # charged like the request on its own would be
+        wait = ratelimit.wait('api', '{}:{}'.format(user_id, endpoint))
+        if wait:
+            results[index] = 429, ratelimit.too_many_requests_message(wait)
+        elif endpoint in RESOLVERS:
+            grouped.setdefault(endpoint, []).append((index, view_args))
+        else:
+            results[index] = dispatch(user_id, path)
+    for endpoint, entries in grouped.items():
+        answers = RESOLVERS[endpoint](user_id, [view_args for index, view_args in entries])
+        for (index, view_args), answer in zip(entries, answers):
+            results[index] = answer
+    return json_response({'responses': [
+        {'path': subrequest.get('path') if isinstance(subrequest, dict) else None,
+         'status': status, 'body': body}
+        for subrequest, (status, body) in zip(subrequests, results)]})
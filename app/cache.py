@@ -0,0 +1,157 @@
+import hashlib
+import itertools
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request
+
+
+class LRUBackend(object):
+    """In-process backend, keeps the most recently used `max_entries` responses."""
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.versions = OrderedDict()
+        self.lock = threading.Lock()
+        # a namespace that was evicted from self.versions restarts at a value
+        # it has never had, so entries keyed on its old versions stay dead
+        self.counter = itertools.count(1)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_versions(self, namespaces):
+        with self.lock:
+            versions = []
+            for namespace in namespaces:
+                if namespace not in self.versions:
+                    self.versions[namespace] = next(self.counter)
+                self.versions.move_to_end(namespace)
+                versions.append(self.versions[namespace])
+            while len(self.versions) > self.max_entries:
+                self.versions.popitem(last=False)
+            return versions
+
+    def bump(self, namespaces):
+        with self.lock:
+            for namespace in namespaces:
+                self.versions[namespace] = next(self.counter)
+
+
+class RedisBackend(object):
+    """Backend shared by all workers, for any server speaking the Redis protocol."""
+
+    def __init__(self, url, ttl=300, prefix='yummy:'):
+        # redis is only needed when this backend is configured
+        import redis
+        self.client = redis.StrictRedis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value.decode()) if value is not None else None
+
+    def set(self, key, value):
+        self.client.setex(self.prefix + key, self.ttl, json.dumps(value))
+
+    def get_versions(self, namespaces):
+        values = self.client.mget([self.prefix + 'v:' + ns for ns in namespaces])
+        return [int(value) if value is not None else 0 for value in values]
+
+    def bump(self, namespaces):
+        pipe = self.client.pipeline()
+        for namespace in namespaces:
+            pipe.incr(self.prefix + 'v:' + namespace)
+        pipe.execute()
+
+
+class ResponseCache(object):
+    """Caches rendered GET responses per (user_id, route, query args).
+
+    Every cached response depends on a few namespaces such as
+    'categories:<user_id>'. Namespace versions are part of the cache key, so
+    invalidating a namespace is a single version bump and the stale entries
+    simply age out of the backend.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def from_config(config):
+        backend = config.get('RESPONSE_CACHE_BACKEND')
+        if backend == 'memory':
+            return ResponseCache(LRUBackend(config['RESPONSE_CACHE_SIZE'], config['RESPONSE_CACHE_TTL']))
+        if backend == 'redis':
+            return ResponseCache(RedisBackend(config['RESPONSE_CACHE_REDIS_URL'], config['RESPONSE_CACHE_TTL']))
+        return None
+
+    def key(self, user_id, namespaces):
+        versions = self.backend.get_versions(namespaces)
+        parts = [str(user_id), request.path, sorted(request.args.items(multi=True)),
+                 request.headers.get('Accept', ''), list(zip(namespaces, versions))]
+        return hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+    def invalidate(self, *namespaces):
+        self.backend.bump(namespaces)
+
+
+def invalidate(*namespaces):
+    """Drops every cached response depending on any of `namespaces`"""
+    cache = current_app.extensions.get('response_cache')
+    if cache is not None:
+        cache.invalidate(*namespaces)
+
+
+def cached(*namespaces):
+    """Caches a login_required GET view and answers If-None-Match with a 304.
+
+    `namespaces` are formatted with the user_id and the view's url arguments,
+    e.g. 'recipes:{user_id}:{category_id}'.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(user_id, *args, **kwargs):
+            cache = current_app.extensions.get('response_cache')
+            if cache is None:
+                response = current_app.make_response(func(user_id, *args, **kwargs))
+            else:
+                key = cache.key(user_id, [ns.format(user_id=user_id, **kwargs) for ns in namespaces])
+                entry = cache.backend.get(key)
+                if entry is None:
+                    response = current_app.make_response(func(user_id, *args, **kwargs))
+                    if response.status_code < 300:
+                        cache.backend.set(key, {'status': response.status_code,
+                                                'content_type': response.content_type,
+                                                'body': response.get_data(as_text=True)})
+                else:
+                    response = current_app.response_class(
+                        entry['body'], status=entry['status'], content_type=entry['content_type'])
+            if response.status_code < 300:
+                response.add_etag()
+                response = response.make_conditional(request)
+            return response
+        return wrapper
+    return decorator
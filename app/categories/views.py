@@ -1,19 +1,33 @@
-from flask import Blueprint, make_response, request, jsonify, url_for
+from flask import Blueprint, make_response, request, jsonify, url_for, current_app
 from functools import wraps
 from flasgger import swag_from
+from sqlalchemy.exc import IntegrityError
 
 from app.models.category import Category
 from app.models.recipe import Recipe
-from app.models.recipeAuth import RecipeApp, ExpiredToken
+from app.models.recipeAuth import RecipeApp
+from app import db, search, ratelimit, multiget, cache
+from app.cache import cached
+from app.models.stats import UserStats
+from app.pagination import KeysetPage, page_args, paginate
+from app.serializers import category_serializer, categories_with_links, json_response
 from . import category_api
 import validate
 
+# environ key a batch sets on its sub-requests to the user it authenticated;
+# only the server can set environ keys, clients can't send one
+SUBREQUEST_USER = 'yummy.subrequest_user_id'
+
 
 def login_required(func):
     """Function to check if user is logged in"""
     @wraps(func)
     def auth(*args, **kwargs):
         """Get the access token from the header"""
+        user_id = request.environ.get(SUBREQUEST_USER)
+        if user_id is not None:
+            # a sub-request of a batch, which authenticated it and charged its rate limit
+            return func(user_id, *args, **kwargs)
         auth_header = request.headers.get('Authorization')
         if auth_header is None:
             response = {
@@ -21,15 +35,16 @@ def login_required(func):
             return make_response(jsonify(response)), 401
         access_token = auth_header.split(" ")[1]
 
-        if ExpiredToken.check_expired_token(access_token) is False:
-            # Attempt to decode the token and get the User ID
-            user_id = RecipeApp.decode_token(access_token)
-            if not isinstance(user_id, str):
-                # Handle the request if the user is authenticated"""
-                return func(user_id, *args, **kwargs)
-            return jsonify({'message': user_id}), 401
-        response = {'message': 'Please login'}
-        return make_response(jsonify(response)), 401
+        # Attempt to decode the token and get the User ID, this also checks
+        # whether the token has been revoked
+        user_id = RecipeApp.decode_token(access_token)
+        if not isinstance(user_id, str):
+            # Handle the request if the user is authenticated"""
+            response = ratelimit.check('api', '{}:{}'.format(user_id, request.endpoint))
+            if response is not None:
+                return response
+            return func(user_id, *args, **kwargs)
+        return jsonify({'message': user_id}), 401
     return auth
 
 
@@ -38,60 +53,83 @@ def login_required(func):
 @swag_from('/app/docs/create_category.yml')
 def create_categories(user_id):
     """Adds categories to the database"""
-    category = Category.query.filter(Category.user_id == user_id).filter_by(
-        category_name=request.data['category_name']).first()
-    if not category:
-        if request.method == "POST":
-            category_name = str(request.data.get('category_name', ''))
-            if category_name is None:
-                response = {'message': 'No content provided.'}
-                return make_response(jsonify(response)), 400
-            category_name.strip()
-            if category_name:
-                if validate.validate_name(category_name) == "True":
-                    category = Category(
-                        category_name=category_name, user_id=user_id)
+    if request.method == "POST":
+        category_name = str(request.data.get('category_name', ''))
+        if category_name is None:
+            response = {'message': 'No content provided.'}
+            return make_response(jsonify(response)), 400
+        category_name.strip()
+        if category_name:
+            if validate.validate_name(category_name) == "True":
+                category = Category(
+                    category_name=category_name, user_id=user_id)
+                try:
+                    # the unique (user_id, category_name) index rejects duplicates
                     category.save()
-                    response = jsonify(category.category_json())
-                    return make_response(response), 201
-            response = {'message': 'Category name required.'}
-            return make_response(jsonify(response)), 422
-    # There is an existing category.
-    response = {'message': 'Category already exists.'}
-    return make_response(jsonify(response)), 409
+                except IntegrityError:
+                    # There is an existing category.
+                    response = {'message': 'Category already exists.'}
+                    return make_response(jsonify(response)), 409
+                response = jsonify(category.category_json())
+                return make_response(response), 201
+        response = {'message': 'Category name required.'}
+        return make_response(jsonify(response)), 422
 
 
 @category_api.route('/categories/', methods=['GET'])
 @login_required
+@cached('categories:{user_id}')
 @swag_from('/app/docs/view_categories.yml')
 def view_categories(user_id):
     """Retrieves categories from the database"""
     if request.method == "GET":
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 9))
+        try:
+            page, per_page = page_args(request.args, 9, current_app.config['MAX_PER_PAGE'])
+        except ValueError as e:
+            return make_response(jsonify({'message': str(e)})), 400
         q = str(request.args.get('q', ''))
+        # unless searching, the total is the user's category counter
+        count = None if q else lambda: UserStats.category_total(user_id)
+        if 'ids' in request.args:
+            # a multi-get, every category asked for in one IN query
+            try:
+                ids = multiget.parse_ids(request.args['ids'], current_app.config['BATCH_MAX_IDS'])
+            except ValueError as e:
+                return make_response(jsonify({'message': str(e)})), 400
+            rows = Category.query.filter(Category.user_id == user_id).filter(
+                Category.category_id.in_(ids)).with_entities(*category_serializer.columns)
+            return json_response(multiget.ordered(ids, categories_with_links(rows), 'category_id'))
+        if 'cursor' in request.args:
+            # keyset pagination, seeks past the last category_id seen
+            query = search.search(Category.query.filter(Category.user_id == user_id).with_entities(
+                *category_serializer.columns), Category, q, ranked=False)
+            try:
+                categories = KeysetPage(query, Category.category_id, request.args['cursor'],
+                                        per_page, request.args.get('include_total') == 'true', count)
+            except ValueError as e:
+                return make_response(jsonify({'message': str(e)})), 400
+            if not categories.items and not request.args['cursor']:
+                return make_response(jsonify({'message': 'no categories found'})), 404
+            return json_response(categories.response(categories_with_links(categories.items)))
         # GET all the categories created by this user
-        categories = Category.query.filter(Category.user_id == user_id).filter(
-            Category.category_name.ilike('%' + q + '%')).paginate(page, per_page, False)
+        categories = paginate(search.search(Category.query.filter(Category.user_id == user_id).with_entities(
+            *category_serializer.columns), Category, q), page, per_page, False, count)
         if categories.total <= 0:
             return make_response(jsonify({'message': 'no categories found'})), 404
         if categories.items:
-            results = []
-            for category in categories.items:
-                obj = category.category_json()
-                results.append(obj)
-            return ({'results':results, 'page':categories.page, 'total':categories.total, 'per_page':categories.per_page, 'next_page':categories.next_num}), 200
+            results = categories_with_links(categories.items)
+            return json_response({'results':results, 'page':categories.page, 'total':categories.total, 'per_page':categories.per_page, 'next_page':categories.next_num})
             # return make_response(results), 200
         return make_response(jsonify({'msg': 'Page not found'})), 422
 
 
 @category_api.route('/categories/<int:category_id>', methods=['GET'])
 @login_required
+@cached('category:{user_id}:{category_id}')
 @swag_from('/app/docs/view_one_category.yml')
 def view_one_category(user_id, category_id, **kwargs):
     """Retrieve a category using it's ID"""
-    user = RecipeApp.query.filter_by(user_id=user_id).first()
-    category = user.categories.filter_by(category_id=category_id).first()
+    category = Category.query.filter_by(user_id=user_id, category_id=category_id).first()
     if not category:
         # Raise an HTTPException with a 404 not found status code
         return {
@@ -109,8 +147,7 @@ def view_one_category(user_id, category_id, **kwargs):
 @swag_from('/app/docs/edit_category.yml')
 def edit_category(user_id, category_id, **kwargs):
     """Edit a category using it's ID"""
-    user = RecipeApp.query.filter_by(user_id=user_id).first()
-    category = user.categories.filter_by(category_id=category_id).first()
+    category = Category.query.filter_by(user_id=user_id, category_id=category_id).first()
     if not category:
         # Raise an HTTPException with a 404 not found status code
         return {
@@ -120,7 +157,10 @@ def edit_category(user_id, category_id, **kwargs):
         # EDIT a category
         category_name = str(request.data.get('category_name', ''))
         category.category_name = category_name
-        category.save()
+        try:
+            category.save()
+        except IntegrityError:
+            return make_response(jsonify({'message': 'Category already exists.'})), 409
         response = jsonify(category.category_json())
         response.status_code = 201
         return response
@@ -131,8 +171,7 @@ def edit_category(user_id, category_id, **kwargs):
 @swag_from('/app/docs/delete_category.yml')
 def delete_category(user_id, category_id, **kwargs):
     """Delete a category using it's ID"""
-    user = RecipeApp.query.filter_by(user_id=user_id).first()
-    category = user.categories.filter_by(category_id=category_id).first()
+    category = Category.query.filter_by(user_id=user_id, category_id=category_id).first()
     if not category:
         # Raise an HTTPException with a 404 not found status code
         return {
@@ -146,6 +185,34 @@ def delete_category(user_id, category_id, **kwargs):
         }, 200
 
 
+@category_api.route('/categories/', methods=['DELETE'])
+@login_required
+@swag_from('/app/docs/delete_categories.yml')
+def delete_categories(user_id):
+    """Deletes many categories, and all their recipes, by ID in one transaction"""
+    try:
+        ids = multiget.parse_ids(request.args.get('ids', ''), current_app.config['BATCH_MAX_IDS'])
+    except ValueError as e:
+        return make_response(jsonify({'message': str(e)})), 400
+    deleted = Category.bulk_delete(user_id, ids)
+    db.session.commit()
+    if deleted:
+        cache.invalidate('categories:{}'.format(user_id),
+                         *['category:{}:{}'.format(user_id, category_id) for category_id in deleted])
+    return json_response(multiget.deleted(ids, deleted))
+
+
+@category_api.route('/stats', methods=['GET'])
+@login_required
+@swag_from('/app/docs/stats.yml')
+def get_stats(user_id):
+    """Returns how many categories and recipes the user has"""
+    stats = UserStats.query.get(user_id)
+    if stats is None:
+        return make_response(jsonify({'message': 'No stats found'})), 404
+    return json_response(stats.stats_json())
+
+
 @category_api.route('/username', methods=['GET'])
 @login_required
 def get_username(user_id):
@@ -0,0 +1,120 @@
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, exc, select
+from sqlalchemy.pool import NullPool
+
+from app import instrumentation
+
+POOL_OPTIONS = ('pool_size', 'pool_timeout', 'pool_recycle', 'max_overflow')
+
+
+class PooledSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy with the pool settings from the app config applied.
+
+    Adds what Flask-SQLAlchemy's own SQLALCHEMY_POOL_* settings don't cover:
+    pre-ping (SQLALCHEMY_POOL_PRE_PING), PgBouncer friendly pooling
+    (SQLALCHEMY_PGBOUNCER), per worker pool counters for /health and the
+    statement timings reported at /metrics.
+    """
+
+    def apply_driver_hacks(self, app, info, options):
+        # Flask-SQLAlchemy 2.5 (needed with SQLAlchemy 1.4, see
+        # requirements-async.txt) returns the url and options, 2.3 returns None
+        rv = super(PooledSQLAlchemy, self).apply_driver_hacks(app, info, options)
+        if info.drivername.startswith('sqlite'):
+            # sqlite's pools take none of the sizing options
+            for option in POOL_OPTIONS:
+                options.pop(option, None)
+        elif app.config.get('SQLALCHEMY_PGBOUNCER'):
+            # PgBouncer in transaction mode already pools server connections,
+            # a second pool in every worker would only pin them
+            for option in POOL_OPTIONS:
+                options.pop(option, None)
+            options['poolclass'] = NullPool
+        return rv
+
+    def get_engine(self, app=None, bind=None):
+        engine = super(PooledSQLAlchemy, self).get_engine(app, bind)
+        if not event.contains(engine.pool, 'checkout', pool_stats.on_checkout):
+            pool_stats.instrument(engine)
+            instrumentation.instrument(engine)
+            # there's no server to lose the connection to with sqlite
+            if (self.get_app(app).config.get('SQLALCHEMY_POOL_PRE_PING')
+                    and engine.dialect.name != 'sqlite'):
+                event.listen(engine, 'engine_connect', ping_connection)
+        return engine
+
+    def now(self):
+        """The database's clock, the one server side timestamp defaults are set by"""
+        now = self.session.query(self.func.current_timestamp()).scalar()
+        if isinstance(now, str):
+            now = datetime.strptime(now, '%Y-%m-%d %H:%M:%S')
+        # DateTime columns store the session's local time without a zone
+        return now.replace(tzinfo=None)
+
+
+def ping_connection(connection, branch):
+    """Checks a pooled connection is alive before it's used.
+
+    This is SQLAlchemy's pessimistic disconnect handling recipe, so stale
+    connections left over from a database restart or failover are replaced
+    instead of failing the request.
+    """
+    if branch:
+        return
+    save_should_close_with_result = connection.should_close_with_result
+    connection.should_close_with_result = False
+    # tagged so statement counters can tell pings from application queries
+    ping = connection.execution_options(pre_ping=True)
+    try:
+        ping.scalar(select([1]))
+    except exc.DBAPIError as err:
+        if err.connection_invalidated:
+            pool_stats.count('stale')
+            ping.scalar(select([1]))
+        else:
+            raise
+    finally:
+        connection.should_close_with_result = save_should_close_with_result
+
+
+class PoolStats(object):
+    """Counts pool events in this worker process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = Counter()
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def on_connect(self, dbapi_connection, connection_record):
+        self.count('connects')
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.count('checkouts')
+
+    def on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.count('invalidations')
+
+    def instrument(self, engine):
+        event.listen(engine.pool, 'connect', self.on_connect)
+        event.listen(engine.pool, 'checkout', self.on_checkout)
+        event.listen(engine.pool, 'invalidate', self.on_invalidate)
+
+    def status(self, engine):
+        pool = engine.pool
+        status = {'pid': os.getpid(), 'pool': type(pool).__name__}
+        for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+            if hasattr(pool, name):
+                status[name] = getattr(pool, name)()
+        status.update(self.counters)
+        return status
+
+
+pool_stats = PoolStats()
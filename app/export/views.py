@@ -0,0 +1,75 @@
+from flask import Response, request, make_response, jsonify, current_app, stream_with_context
+from flasgger import swag_from
+
+from app import db
+from app.models.category import Category
+from app.models.recipe import Recipe
+from app.categories.views import login_required
+from app.serializers import category_serializer, recipe_serializer, dumps
+from . import export_api
+
+
+def stream(query):
+    """Reads a query through a server-side cursor, batch by batch"""
+    return query.execution_options(stream_results=True).yield_per(
+        current_app.config['EXPORT_BATCH_SIZE'])
+
+
+def recipe_book(user_id):
+    """Yields (category, recipes) pairs for a user from two ordered cursors.
+
+    Categories are read in id order and recipes in (category_id, recipe_id)
+    order, so the two streams can be merged without a query per category.
+    """
+    categories = stream(db.session.query(*category_serializer.columns).filter(
+        Category.user_id == user_id).order_by(Category.category_id))
+    recipes = iter(stream(db.session.query(*recipe_serializer.columns).filter(
+        Recipe.user_id == user_id).filter(Recipe.category_id.isnot(None)).order_by(
+        Recipe.category_id, Recipe.recipe_id)))
+    pending = next(recipes, None)
+    for category in categories:
+        # skip recipes pointing at categories the user doesn't own
+        while pending is not None and pending.category_id < category.category_id:
+            pending = next(recipes, None)
+
+        def category_recipes():
+            nonlocal pending
+            while pending is not None and pending.category_id == category.category_id:
+                yield pending
+                pending = next(recipes, None)
+        yield category, category_recipes()
+
+
+def export_ndjson(user_id):
+    for category, recipes in recipe_book(user_id):
+        yield dumps(dict(category_serializer.row(category), type='category')) + b'\n'
+        for recipe in recipes:
+            yield dumps(dict(recipe_serializer.row(recipe), type='recipe')) + b'\n'
+
+
+def export_json(user_id):
+    yield b'{"categories":['
+    for number, (category, recipes) in enumerate(recipe_book(user_id)):
+        obj = dumps(category_serializer.row(category))
+        yield (b',' if number else b'') + obj[:-1] + b',"recipes":['
+        for index, recipe in enumerate(recipes):
+            yield (b',' if index else b'') + dumps(recipe_serializer.row(recipe))
+        yield b']}'
+    yield b']}'
+
+
+@export_api.route('/export', methods=['GET'])
+@login_required
+@swag_from('/app/docs/export.yml')
+def export(user_id):
+    """Streams all of a user's categories and recipes"""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format == 'ndjson':
+        body, mimetype = export_ndjson(user_id), 'application/x-ndjson'
+    elif export_format == 'json':
+        body, mimetype = export_json(user_id), 'application/json'
+    else:
+        return make_response(jsonify({'message': 'format should be ndjson or json'})), 400
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = 'attachment; filename=recipes.{}'.format(export_format)
+    return response
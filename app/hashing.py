@@ -0,0 +1,69 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from flask import current_app
+
+from app.instrumentation import timed
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+
+
+def executor():
+    """Returns this process's bounded pool of password hashing threads.
+
+    bcrypt releases the GIL while it works, so hashing on the pool lets other
+    requests in the same worker carry on, while the pool size caps how many
+    hashes run at once. That needs a worker serving requests on several
+    threads, gunicorn's gthread workers as in the Procfile; a sync worker
+    has only the one thread waiting on the hash. The pool is rebuilt after a
+    fork since threads don't survive it.
+    """
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config['PASSWORD_HASH_WORKERS'])
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _run(func, *args):
+    with timed('bcrypt'):
+        return executor().submit(func, *args).result(
+            timeout=current_app.config['PASSWORD_HASH_TIMEOUT'])
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+
+
+def _check(pw_hash, password):
+    return bcrypt.checkpw(password.encode(), pw_hash.encode())
+
+
+def hash_password(password):
+    """Hashes a password with the configured work factor"""
+    return _run(_hash, password, current_app.config['BCRYPT_LOG_ROUNDS'])
+
+
+def check_password(pw_hash, password):
+    """Checks a password against a stored bcrypt hash"""
+    try:
+        return _run(_check, pw_hash, password)
+    except ValueError:
+        # not a bcrypt hash
+        return False
+
+
+def needs_rehash(pw_hash):
+    """Checks if a hash was made with a different work factor than configured"""
+    # bcrypt hashes look like $2b$12$<salt and digest>
+    try:
+        rounds = int(pw_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return True
+    return rounds != current_app.config['BCRYPT_LOG_ROUNDS']
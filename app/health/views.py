@@ -0,0 +1,23 @@
+from flask import make_response, jsonify, current_app
+from flasgger import swag_from
+from sqlalchemy import exc, select
+
+from app import db
+from app.database import pool_stats
+from . import health_api
+
+
+@health_api.route('/health', methods=['GET'])
+@swag_from('/app/docs/health.yml')
+def health():
+    """Checks the database is reachable and reports this worker's pool"""
+    try:
+        db.session.execute(select([1]))
+        database = 'ok'
+    except exc.SQLAlchemyError:
+        # the driver's error can name the host, database and user, so it
+        # goes to the log rather than to this unauthenticated endpoint
+        current_app.logger.exception('health check query failed')
+        database = 'unavailable'
+    response = {'database': database, 'pool': pool_stats.status(db.engine)}
+    return make_response(jsonify(response)), 200 if database == 'ok' else 503
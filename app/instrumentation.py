@@ -0,0 +1,159 @@
+import bisect
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+# time spent in these is reported per route, besides the total latency
+PHASES = ('sql', 'bcrypt', 'jwt', 'serialize')
+
+
+class Histogram(object):
+    """A Prometheus style histogram with fixed upper bounds."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # one more slot for values above the last bound (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """Yields (le, cumulative count) pairs, ending with +Inf"""
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics(object):
+    """Request metrics of this worker process, by route.
+
+    Every request observes its latency and number of SQL statements, and
+    adds the time it spent in each of PHASES. Workers keep their own
+    numbers, so Prometheus should scrape each of them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.queries = {}
+        self.phases = Counter()
+
+    def observe(self, method, route, status, seconds, queries, timings):
+        with self.lock:
+            key = (method, route, str(status))
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+            self.latency[key].observe(seconds)
+            if (method, route) not in self.queries:
+                self.queries[(method, route)] = Histogram(QUERY_BUCKETS)
+            self.queries[(method, route)].observe(queries)
+            for phase, spent in timings.items():
+                self.phases[(method, route, phase)] += spent
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            lines.extend(render_histogram(
+                'yummy_http_request_duration_seconds', 'Request latency by route.',
+                ('method', 'route', 'status'), self.latency))
+            lines.extend(render_histogram(
+                'yummy_http_request_queries', 'SQL statements run per request by route.',
+                ('method', 'route'), self.queries))
+            lines.append('# HELP yummy_http_request_phase_seconds_total '
+                         'Time spent in SQL, bcrypt, JWT and serialization by route.')
+            lines.append('# TYPE yummy_http_request_phase_seconds_total counter')
+            for (method, route, phase), spent in sorted(self.phases.items()):
+                lines.append('yummy_http_request_phase_seconds_total{{{}}} {}'.format(
+                    labels(('method', 'route', 'phase'), (method, route, phase)), repr(spent)))
+        return '\n'.join(lines) + '\n'
+
+
+def labels(names, values):
+    return ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace(
+        '"', '\\"').replace('\n', '\\n')) for name, value in zip(names, values))
+
+
+def render_histogram(name, help, label_names, histograms):
+    yield '# HELP {} {}'.format(name, help)
+    yield '# TYPE {} histogram'.format(name)
+    for key, histogram in sorted(histograms.items()):
+        base = labels(label_names, key)
+        for bound, count in histogram.samples():
+            yield '{}_bucket{{{},le="{}"}} {}'.format(name, base, bound, count)
+        yield '{}_sum{{{}}} {}'.format(name, base, repr(histogram.sum))
+        yield '{}_count{{{}}} {}'.format(name, base, histogram.count)
+
+
+@contextmanager
+def timed(phase):
+    """Adds the time spent in the block to the current request's `phase`"""
+    start = time.time()
+    try:
+        yield
+    finally:
+        if has_request_context() and 'metrics_timings' in g:
+            g.metrics_timings[phase] += time.time() - start
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.metrics_start = time.time()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is None or context.execution_options.get('pre_ping'):
+        return
+    if has_request_context() and 'metrics_timings' in g:
+        g.metrics_timings['sql'] += time.time() - context.metrics_start
+        g.metrics_queries += 1
+
+
+def instrument(engine):
+    """Times the statements run on engine, pool pre-pings excepted"""
+    if not event.contains(engine, 'after_cursor_execute', after_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+
+def start_request():
+    """before_request hook, starts the request's clock and counters"""
+    g.metrics_start = time.time()
+    g.metrics_timings = Counter()
+    g.metrics_queries = 0
+
+
+def finish_request(response):
+    """after_request hook, records the request and adds the Server-Timing header"""
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return response
+    seconds = time.time() - start
+    timings = g.pop('metrics_timings')
+    queries = g.pop('metrics_queries')
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    current_app.extensions['metrics'].observe(
+        request.method, route, response.status_code, seconds, queries, timings)
+    if current_app.config.get('METRICS_SERVER_TIMING'):
+        entries = []
+        for phase in PHASES:
+            if phase in timings:
+                entry = '{};dur={:.2f}'.format(phase, timings[phase] * 1000)
+                if phase == 'sql':
+                    entry += ';desc="{} queries"'.format(queries)
+                entries.append(entry)
+        entries.append('total;dur={:.2f}'.format(seconds * 1000))
+        response.headers['Server-Timing'] = ', '.join(entries)
+    return response
@@ -0,0 +1,6 @@
+from flask import Blueprint
+
+# This is the instance of a Blueprint that represents the metrics blueprint
+metrics_api = Blueprint('metrics_api', __name__)
+
+from . import views
@@ -0,0 +1,18 @@
+import hmac
+
+from flask import current_app, make_response, jsonify, request
+from flasgger import swag_from
+
+from . import metrics_api
+
+
+@metrics_api.route('/metrics', methods=['GET'])
+@swag_from('/app/docs/metrics.yml')
+def metrics():
+    """Reports this worker's request metrics in the Prometheus text format"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(
+            request.headers.get('Authorization', ''), 'Bearer ' + token):
+        return make_response(jsonify({'message': 'Invalid metrics token.'})), 401
+    return current_app.response_class(current_app.extensions['metrics'].render(),
+                                      mimetype='text/plain; version=0.0.4')
@@ -1,8 +1,12 @@
 from sqlalchemy import Integer, ForeignKey, String, Column
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
 from flask import url_for
 
 from .recipeAuth import RecipeApp
-from app import db
+from .ingredient import RecipeIngredient
+from .stats import UserStats
+from app import db, search, cache
 
 
 class Category(db.Model):
@@ -17,9 +21,18 @@ class Category(db.Model):
         db.DateTime, default=db.func.current_timestamp(),
         onupdate=db.func.current_timestamp())
     user_id = db.Column(db.Integer, db.ForeignKey(RecipeApp.user_id))
+    # kept in step with the category's recipes, see UserStats
+    recipe_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     recipes = db.relationship(
         'Recipe', order_by='Recipe.recipe_id', cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # also serves every lookup by user_id alone
+        db.Index('ix_category_user_id_category_name', 'user_id', 'category_name', unique=True),
+        # rows changed since a sync token
+        db.Index('ix_category_user_id_date_modified', 'user_id', 'date_modified'),
+    )
+
     def __init__(self, category_name, user_id, category_id=None, recipe_name=None):
         """initialize"""
         self.category_name = category_name
@@ -29,25 +42,77 @@ class Category(db.Model):
 
     def category_json(self):
         """This method jsonifies the recipe model"""
-        return {'category_id': self.category_id,
-                'category_name': self.category_name,
-                'date_created': self.date_created,
-                'date_modified': self.date_modified,
-                'recipes': url_for('recipe_api.create_recipes', category_id=self.category_id, _external=True),
-                'created_by': self.user_id
-                }
+        from app.serializers import category_serializer
+        obj = category_serializer.entity(self)
+        obj['recipes'] = url_for('recipe_api.create_recipes', category_id=self.category_id, _external=True)
+        return obj
 
     def save(self):
+        state = inspect(self)
+        is_new = state.transient or state.pending
         db.session.add(self)
-        db.session.commit()
+        try:
+            if is_new:
+                # a duplicate name fails the insert before the count is touched
+                db.session.flush()
+                UserStats.add(self.user_id, categories=1)
+            db.session.commit()
+        except IntegrityError:
+            # leave the session usable for the caller handling the duplicate
+            db.session.rollback()
+            raise
+        cache.invalidate('categories:{}'.format(self.user_id),
+                         'category:{}:{}'.format(self.user_id, self.category_id))
 
     @staticmethod
     def get_all():
         return Category.query.all()
 
     def delete(self):
-        db.session.delete(self)
+        Category.delete_rows(self.user_id, [self.category_id])
+        # deleted behind the session's back, keep the loaded attributes
+        db.session.expunge(self)
         db.session.commit()
+        # the category namespace also covers every recipe view under it
+        cache.invalidate('categories:{}'.format(self.user_id),
+                         'category:{}:{}'.format(self.user_id, self.category_id))
+
+    @staticmethod
+    def bulk_delete(user_id, category_ids, session=None):
+        """Deletes the user's categories with these ids, returns the ids deleted.
+
+        The caller commits, and invalidates the cache for the ids returned.
+        """
+        session = session or db.session
+        # locked, so a concurrent delete of the same ids waits and then finds them gone
+        found = [category_id for category_id, in session.query(Category.category_id).filter(
+            Category.user_id == user_id).filter(Category.category_id.in_(category_ids)).with_for_update()]
+        if found:
+            Category.delete_rows(user_id, found, session)
+        return found
+
+    @staticmethod
+    def delete_rows(user_id, category_ids, session=None):
+        """Deletes categories and their recipes with a few set based statements.
+
+        However many recipes the categories have, none of them is loaded:
+        their tombstones, ingredient links and rows each go in one statement.
+        """
+        from .recipe import Recipe
+        from .changelog import ChangeLog
+        session = session or db.session
+        recipes = session.query(Recipe.recipe_id).filter(Recipe.category_id.in_(category_ids))
+        ChangeLog.record(user_id, categories=category_ids, recipes=recipes, session=session)
+        RecipeIngredient.unlink(recipes, session=session)
+        deleted_recipes = session.query(Recipe).filter(Recipe.category_id.in_(category_ids)).delete(
+            synchronize_session=False)
+        deleted = session.query(Category).filter(Category.category_id.in_(category_ids)).delete(
+            synchronize_session=False)
+        # counted from the rows the statements removed, not the ids asked for
+        UserStats.add(user_id, categories=-deleted, recipes=-deleted_recipes, session=session)
 
     def __repr__(self):
         return "<Category: {}>".format(self.category_name)
+
+
+search.register(Category, Category.category_id, [Category.category_name])
@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from sqlalchemy import literal_column, select
+
+from app import db
+from .recipeAuth import RecipeApp
+
+
+class ChangeLog(db.Model):
+    """This class represents the change_log table, tombstones of deleted rows.
+
+    Changed rows are found by their own date_modified, deleted ones leave
+    a row here so GET /sync can tell clients to drop them.
+    """
+
+    __tablename__ = 'change_log'
+
+    CATEGORY = 'category'
+    RECIPE = 'recipe'
+
+    change_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey(RecipeApp.user_id), nullable=False)
+    entity = db.Column(db.String(16), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=db.func.current_timestamp(), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_change_log_user_id_deleted_at', 'user_id', 'deleted_at'),
+    )
+
+    @staticmethod
+    def record(user_id, categories=(), recipes=(), session=None):
+        """Leaves tombstones for deleted ids in the caller's transaction.
+
+        `recipes` may also be a query of recipe ids about to be deleted,
+        which is copied with one INSERT ... SELECT without fetching them.
+        """
+        session = session or db.session
+        table = ChangeLog.__table__
+        rows = [{'user_id': user_id, 'entity': ChangeLog.CATEGORY, 'entity_id': category_id}
+                for category_id in categories]
+        if isinstance(recipes, (list, tuple)):
+            rows.extend({'user_id': user_id, 'entity': ChangeLog.RECIPE, 'entity_id': recipe_id}
+                        for recipe_id in recipes)
+        else:
+            recipe_ids = recipes.subquery()
+            # inlined constants, so no driver has to guess a parameter's type
+            session.execute(table.insert().from_select(
+                ['user_id', 'entity', 'entity_id'],
+                select([literal_column(str(int(user_id))),
+                        literal_column("'{}'".format(ChangeLog.RECIPE)),
+                        recipe_ids.c.recipe_id])))
+        if rows:
+            session.execute(table.insert(), rows)
+
+    @staticmethod
+    def prune(days):
+        """Deletes the tombstones older than `days`, the oldest sync token accepted"""
+        before = db.now() - timedelta(days=days)
+        deleted = ChangeLog.query.filter(ChangeLog.deleted_at < before).delete(
+            synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def __repr__(self):
+        return '<ChangeLog: {} {}>'.format(self.entity, self.entity_id)
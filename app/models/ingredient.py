@@ -0,0 +1,146 @@
+import re
+
+from sqlalchemy import bindparam
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+
+# leading quantities and units, so '2 cups flour' and 'flour' are one ingredient
+QUANTITY = re.compile(
+    r'^(?:[\d/.,¼-¾-]+\s*|(?:a|an|cups?|tbsp|tsp|tablespoons?|teaspoons?|'
+    r'g|kg|grams?|ml|l|litres?|liters?|oz|ounces?|lbs?|pounds?|pinch|handful|of)\b\s*)+',
+    re.IGNORECASE)
+
+
+# the length of Ingredient.name, recipe text is unbounded but names are cut to fit
+MAX_NAME_LENGTH = 255
+
+
+def parse_ingredients(text):
+    """Splits a free text ingredient list into normalized ingredient names"""
+    names = []
+    for part in re.split(r'[,;\n]+', text or ''):
+        name = ' '.join(QUANTITY.sub('', part.strip()).lower().split())[:MAX_NAME_LENGTH].rstrip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+class Ingredient(db.Model):
+    """This class represents the ingredient table, one row per distinct name."""
+
+    __tablename__ = 'ingredient'
+
+    ingredient_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(MAX_NAME_LENGTH), nullable=False, unique=True)
+
+    @staticmethod
+    def ids_for(names, create=False, session=None):
+        """Maps ingredient names to ids, optionally adding the missing names"""
+        if not names:
+            return {}
+        session = session or db.session
+        ids = dict(session.query(Ingredient.name, Ingredient.ingredient_id).filter(
+            Ingredient.name.in_(names)))
+        missing = [name for name in names if name not in ids]
+        if missing and create:
+            Ingredient.insert(missing, session)
+            ids.update(session.query(Ingredient.name, Ingredient.ingredient_id).filter(
+                Ingredient.name.in_(missing)))
+        return ids
+
+    @staticmethod
+    def insert(names, session):
+        """Adds ingredient names, skipping those another request added first"""
+        table = Ingredient.__table__
+        dialect = session.bind.dialect.name
+        if dialect == 'postgresql':
+            session.execute(postgresql.insert(table).on_conflict_do_nothing(index_elements=['name']),
+                            [{'name': name} for name in names])
+        elif dialect == 'sqlite':
+            session.execute(table.insert().prefix_with('OR IGNORE'), [{'name': name} for name in names])
+        else:
+            # a savepoint per name, so one conflict doesn't undo the others
+            for name in names:
+                try:
+                    with session.begin_nested():
+                        session.execute(table.insert(), {'name': name})
+                except IntegrityError:
+                    # theirs is as good, unless it's a different conflict
+                    if session.query(Ingredient.ingredient_id).filter_by(name=name).first() is None:
+                        raise
+
+    def __repr__(self):
+        return "<Ingredient: {}>".format(self.name)
+
+
+class RecipeIngredient(db.Model):
+    """This class represents the recipe_ingredient table linking recipes to ingredients.
+
+    user_id is copied from the recipe so the (user_id, ingredient_id) index
+    works as a per user inverted index from ingredients to recipes.
+    """
+
+    __tablename__ = 'recipe_ingredient'
+
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipe.recipe_id', ondelete='CASCADE'),
+                          primary_key=True)
+    ingredient_id = db.Column(db.Integer, db.ForeignKey(Ingredient.ingredient_id), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_recipe_ingredient_user_id_ingredient_id', 'user_id', 'ingredient_id', 'recipe_id'),
+    )
+
+    @staticmethod
+    def link(recipes, replace=True, session=None):
+        """Replaces the ingredient links of many recipes at once.
+
+        `recipes` is a list of (recipe_id, user_id, ingredients text). Runs a
+        fixed number of statements however many recipes there are, and
+        leaves the commit to the caller. Pass replace=False for new recipes,
+        which have no links to replace yet.
+        """
+        from app.models.recipe import Recipe
+        if not recipes:
+            return
+        session = session or db.session
+        parsed = [(recipe_id, user_id, parse_ingredients(text)) for recipe_id, user_id, text in recipes]
+        ids = Ingredient.ids_for(sorted(set(name for _, _, names in parsed for name in names)),
+                                 create=True, session=session)
+        if replace:
+            RecipeIngredient.unlink([recipe_id for recipe_id, _, _ in parsed], session=session)
+        rows = [{'recipe_id': recipe_id, 'ingredient_id': ids[name], 'user_id': user_id}
+                for recipe_id, user_id, names in parsed for name in names]
+        if rows:
+            session.execute(RecipeIngredient.__table__.insert(), rows)
+        # new recipes already have the default count of 0
+        counts = [{'rid': recipe_id, 'count': len(names)}
+                  for recipe_id, _, names in parsed if replace or names]
+        if counts:
+            # date_modified is kept, so reindexing doesn't show up in GET /sync
+            session.execute(
+                Recipe.__table__.update().where(Recipe.recipe_id == bindparam('rid')).values(
+                    ingredient_count=bindparam('count'), date_modified=Recipe.__table__.c.date_modified),
+                counts)
+
+    @staticmethod
+    def reindex(chunk_size):
+        """Rebuilds every recipe's links from its ingredients text, a chunk per commit"""
+        from app.models.recipe import Recipe
+        last_id, total = 0, 0
+        while True:
+            chunk = db.session.query(Recipe.recipe_id, Recipe.user_id, Recipe.ingredients).filter(
+                Recipe.recipe_id > last_id).order_by(Recipe.recipe_id).limit(chunk_size).all()
+            if not chunk:
+                return total
+            RecipeIngredient.link(chunk)
+            db.session.commit()
+            last_id, total = chunk[-1].recipe_id, total + len(chunk)
+
+    @staticmethod
+    def unlink(recipe_ids, session=None):
+        """Deletes the ingredient links of the given recipes (ids or a subquery)"""
+        (session or db.session).query(RecipeIngredient).filter(
+            RecipeIngredient.recipe_id.in_(recipe_ids)).delete(synchronize_session=False)
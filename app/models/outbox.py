@@ -0,0 +1,45 @@
+from datetime import datetime
+
+from app import db
+
+
+class OutboxMessage(db.Model):
+    """This class represents the outbox table, emails waiting to be sent."""
+
+    __tablename__ = 'outbox'
+
+    message_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    recipient = db.Column(db.String(256), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    # pending -> sent, or failed once all attempts are used up
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    date_created = db.Column(db.DateTime, default=db.func.current_timestamp())
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    def __init__(self, recipient, subject, html):
+        self.recipient = recipient
+        self.subject = subject
+        self.html = html
+
+    def save(self):
+        db.session.add(self)
+        db.session.commit()
+
+    @staticmethod
+    def due(limit):
+        """Pending messages whose next attempt is due, oldest first"""
+        # skip_locked lets several workers drain the outbox side by side
+        return OutboxMessage.query.filter(OutboxMessage.status == 'pending').filter(
+            OutboxMessage.next_attempt_at <= datetime.utcnow()).order_by(
+            OutboxMessage.message_id).limit(limit).with_for_update(skip_locked=True).all()
+
+    def __repr__(self):
+        return "<OutboxMessage: {} to {}>".format(self.subject, self.recipient)
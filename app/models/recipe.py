@@ -1,8 +1,15 @@
+from collections import Counter
+
 from sqlalchemy import Integer, ForeignKey, String, Column
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
 
-from app import db
+from app import db, search, cache
 from .category import Category
 from .recipeAuth import RecipeApp
+from .ingredient import RecipeIngredient
+from .changelog import ChangeLog
+from .stats import UserStats
 
 class Recipe(db.Model):
     """This class represents the recipeApp table."""
@@ -11,14 +18,26 @@ class Recipe(db.Model):
 
     recipe_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     recipe_name = db.Column(db.String(255))
-    ingredients = db.Column(db.String(255))
-    directions = db.Column(db.String(255))
+    # unbounded, and only loaded when a single recipe is shown. PostgreSQL
+    # already compresses long values out of line (TOAST), so they stay
+    # searchable without compressing them here
+    ingredients = db.deferred(db.Column(db.Text), group='body')
+    directions = db.deferred(db.Column(db.Text), group='body')
     date_created = db.Column(db.DateTime, default=db.func.current_timestamp())
     date_modified = db.Column(
         db.DateTime, default=db.func.current_timestamp(),
         onupdate=db.func.current_timestamp())
     user_id = db.Column(db.Integer, db.ForeignKey(RecipeApp.user_id))
     category_id = db.Column(db.Integer, db.ForeignKey(Category.category_id))
+    # number of distinct parsed ingredients, kept in step with recipe_ingredient
+    ingredient_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        db.Index('ix_recipe_user_id_category_id', 'user_id', 'category_id'),
+        db.Index('ix_recipe_user_id_recipe_name', 'user_id', 'recipe_name', unique=True),
+        # rows changed since a sync token
+        db.Index('ix_recipe_user_id_date_modified', 'user_id', 'date_modified'),
+    )
 
 
     def __init__(self, recipe_name, category_id, user_id, ingredients=None, directions=None):
@@ -30,26 +49,77 @@ class Recipe(db.Model):
 
     def recipe_json(self):
         """This method jsonifies the recipe model"""
-        return {'recipe_id': self.recipe_id,
-                'recipe_name': self.recipe_name,
-                'ingredients': self.ingredients,
-                'directions': self.directions,
-                'date_created': self.date_created,
-                'date_modified': self.date_modified,
-                'created_by' : self.user_id, 
-                'category_id': self.category_id}
+        from app.serializers import recipe_serializer
+        return recipe_serializer.entity(self)
 
     def save(self):
+        state = inspect(self)
+        is_new = state.transient or state.pending
         db.session.add(self)
-        db.session.commit()
+        ingredients_changed = state.attrs.ingredients.history.has_changes()
+        try:
+            if is_new or ingredients_changed:
+                # the links and counts need the recipe_id, and a duplicate
+                # name should fail first, so insert the recipe
+                db.session.flush()
+            if ingredients_changed:
+                RecipeIngredient.link([(self.recipe_id, self.user_id, self.ingredients)],
+                                      replace=not is_new)
+            if is_new:
+                UserStats.add(self.user_id, recipes=1)
+                UserStats.add_recipes({self.category_id: 1})
+            db.session.commit()
+        except IntegrityError:
+            # leave the session usable for the caller handling the duplicate
+            db.session.rollback()
+            raise
+        # reload what the commit expired in one query, the deferred text
+        # included, which SQLAlchemy 1.4 would otherwise load in a second one
+        db.session.refresh(self, [attribute.key for attribute in state.mapper.column_attrs])
+        cache.invalidate('recipes:{}:{}'.format(self.user_id, self.category_id),
+                         'recipe:{}:{}'.format(self.user_id, self.recipe_id))
 
     @staticmethod
     def get_all():
         return Recipe.query.all()
 
     def delete(self):
+        RecipeIngredient.unlink([self.recipe_id])
+        ChangeLog.record(self.user_id, recipes=[self.recipe_id])
+        UserStats.add(self.user_id, recipes=-1)
+        UserStats.add_recipes({self.category_id: -1})
         db.session.delete(self)
         db.session.commit()
+        cache.invalidate('recipes:{}:{}'.format(self.user_id, self.category_id),
+                         'recipe:{}:{}'.format(self.user_id, self.recipe_id))
+
+    @staticmethod
+    def bulk_delete(user_id, recipe_ids, session=None):
+        """Deletes the user's recipes with these ids in one statement per table.
+
+        Returns the (recipe_id, category_id) of each recipe deleted; the
+        caller commits and invalidates the cache for them.
+        """
+        session = session or db.session
+        # locked, so the rows found are the rows deleted below, and a concurrent
+        # delete of the same ids waits and then finds them gone
+        found = session.query(Recipe.recipe_id, Recipe.category_id).filter(
+            Recipe.user_id == user_id).filter(Recipe.recipe_id.in_(recipe_ids)).with_for_update().all()
+        if found:
+            ids = [recipe_id for recipe_id, category_id in found]
+            RecipeIngredient.unlink(ids, session=session)
+            ChangeLog.record(user_id, recipes=ids, session=session)
+            deleted = session.query(Recipe).filter(Recipe.recipe_id.in_(ids)).delete(
+                synchronize_session=False)
+            UserStats.add(user_id, recipes=-deleted, session=session)
+            per_category = Counter(category_id for recipe_id, category_id in found)
+            UserStats.add_recipes(dict((category_id, -count) for category_id, count in per_category.items()),
+                                  session=session)
+        return found
 
     def __repr__(self):
-        return "<Recipe: {}>".format(self.name)
\ No newline at end of file
+        return "<Recipe: {}>".format(self.name)
+
+
+search.register(
+    Recipe, Recipe.recipe_id, [Recipe.recipe_name, Recipe.ingredients, Recipe.directions])
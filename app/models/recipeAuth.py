@@ -1,13 +1,14 @@
 from sqlalchemy import Integer, ForeignKey, String, Column
-from flask_bcrypt import Bcrypt
-from flask import make_response, jsonify
-from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+from calendar import timegm
 import jwt
 
-from instance.config import Config
-from app import db
+from app import db, hashing, tokens
+from .stats import UserStats
 
-config = Config()
+TOKEN_REVOKED = "Expired token. Please login."
 
 class RecipeApp(db.Model):
     """This class represents the recipeApp table."""
@@ -15,27 +16,39 @@ class RecipeApp(db.Model):
     __tablename__ = 'auth'
 
     user_id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(256), nullable=False, unique=True)
+    email = db.Column(db.String(256), nullable=False, unique=True, index=True)
     password = db.Column(db.String(256), nullable=False)
     username = db.Column(db.String(256), nullable=False)
     date_created = db.Column(db.DateTime, default=db.func.current_timestamp())
     date_modified = db.Column(
         db.DateTime, default=db.func.current_timestamp(),
         onupdate=db.func.current_timestamp())
+    # carried in the user's tokens, refresh tokens of an older epoch are refused
+    token_epoch = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     categories = db.relationship(
             'Category', order_by='Category.category_id',
             cascade="all, delete-orphan",
             lazy='dynamic'
         )
+    # inserted along with the user, so the counts always have a row
+    stats = db.relationship(UserStats, uselist=False, cascade="all, delete-orphan")
 
     def __init__(self, email, username, password):
         """initialize"""
         self.email = email
         self.username = username
-        self.password = Bcrypt().generate_password_hash(password).decode()
+        self.set_password(password)
+        self.stats = UserStats()
+
+    def set_password(self, password):
+        self.password = hashing.hash_password(password)
 
     def password_is_valid(self, password):
-        return Bcrypt().check_password_hash(self.password, password)
+        return hashing.check_password(self.password, password)
+
+    def password_needs_rehash(self):
+        """Checks if the password was hashed with an outdated work factor"""
+        return hashing.needs_rehash(self.password)
 
     def save(self):
         db.session.add(self)
@@ -45,41 +58,31 @@ class RecipeApp(db.Model):
         db.session.delete(self)
         db.session.commit()
 
-    def generate_token(self, user_id):
-        """ Generates the access token"""
-        try:
-            # set up a payload with an expiration time
-            payload = {
-                'exp': datetime.utcnow() + timedelta(minutes=1200),
-                'iat': datetime.utcnow(),
-                'sub': user_id
-            }
-            # create the byte string token using the payload and the SECRET key
-            jwt_string = jwt.encode(
-                payload,
-                config.SECRET,
-                algorithm='HS256'
-            )
-            return jwt_string
-
-        except Exception as e:
-            # return an error in string format if an exception occurs
-            return str(e)
+    def generate_token(self, token_type=tokens.ACCESS):
+        """Issues a signed token of `token_type` for this user"""
+        return tokens.service().issue(self.user_id, token_type, self.token_epoch or 0)
+
+    def revoke_tokens(self):
+        """Revokes every refresh token issued so far, once saved"""
+        self.token_epoch = (self.token_epoch or 0) + 1
+
+    def token_is_current(self, claims):
+        """Checks a token wasn't issued before the user's tokens were last revoked"""
+        return claims.get('epoch', 0) == (self.token_epoch or 0)
 
     @staticmethod
-    def decode_token(token):
-        """Decodes the access token from the Authorization header."""
+    def token_claims(token, token_type=tokens.ACCESS):
+        """Returns the claims of a valid, unrevoked token, else an error message"""
+        claims = RecipeApp.verified_claims(tokens.service(), token, token_type)
+        if not isinstance(claims, str) and ExpiredToken.is_revoked(claims['jti']):
+            return TOKEN_REVOKED
+        return claims
+
+    @staticmethod
+    def verified_claims(service, token, token_type):
+        """Returns the claims of a validly signed token, else an error message"""
         try:
-            # try to decode the token using our SECRET variable
-            payload = jwt.decode(token, config.SECRET)
-            token_is_expired = ExpiredToken.check_expired_token(auth_token=token)
-            if token_is_expired:
-                response = {
-                    'message': 'Expired token. Please login.'
-                }
-                return make_response(jsonify(response))
-            else:
-                return payload['sub']
+            return service.verify(token, token_type)
         except jwt.ExpiredSignatureError:
             # the token is expired, return an error string
             return "Expired token. Please login to get a new token"
@@ -87,6 +90,14 @@ class RecipeApp(db.Model):
             # the token is invalid, return an error string
             return "Invalid token. Please register or login"
 
+    @staticmethod
+    def decode_token(token):
+        """Decodes the access token from the Authorization header."""
+        claims = RecipeApp.token_claims(token)
+        if isinstance(claims, str):
+            return claims
+        return claims['sub']
+
 
 class ExpiredToken(db.Model):
     """This class represents the expired_tokens table"""
@@ -94,26 +105,48 @@ class ExpiredToken(db.Model):
     __tablename__ = 'expired_tokens'
 
     token_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    token = db.Column(db.String(500), unique=True, nullable=False)
-    expired_on = db.Column(db.DateTime, default=db.func.current_timestamp(), nullable=False)
+    # the token's random jti claim, revoking needs nothing else from it
+    jti = db.Column(db.String(32), unique=True, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    expired_on = db.Column(db.DateTime, default=db.func.current_timestamp(), nullable=False, index=True)
 
-    def __init__(self, token):
-        self.token = token
+    def __init__(self, claims):
+        # the claims of a verified token
+        self.jti = claims['jti']
+        self.expires_at = datetime.utcfromtimestamp(claims['exp'])
 
     def save(self):
-        """Save to expired_tokens table"""
+        """Save to expired_tokens table.
+
+        Raises IntegrityError if the token was revoked already, e.g. by
+        another worker this one hasn't synced with yet.
+        """
         db.session.add(self)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # leave the session usable for the caller refusing the token
+            db.session.rollback()
+            raise
+        finally:
+            current_app.extensions['revocation_cache'].revoke(
+                self.jti, timegm(self.expires_at.utctimetuple()))
+
+    @staticmethod
+    def is_revoked(jti):
+        """Checks if the token with this jti was revoked"""
+        # answered from the in-process cache, which syncs with the
+        # expired_tokens table at most every REVOCATION_SYNC_INTERVAL
+        return current_app.extensions['revocation_cache'].is_revoked(jti)
 
     @staticmethod
-    def check_expired_token(auth_token):
-        """Checks if token is expired"""
-        # check whether token has been revoked
-        res = ExpiredToken.query.filter_by(token=str(auth_token)).first()
-        if res:
-            return True
-        else:
-            return False
+    def prune():
+        """Deletes revoked tokens that have expired on their own"""
+        # an expired token fails signature checks anyway, so its row is dead
+        deleted = ExpiredToken.query.filter(
+            ExpiredToken.expires_at <= datetime.utcnow()).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
 
     def __repr__(self):
-        return '<id: token: {}'.format(self.token)
+        return '<id: token: {}'.format(self.jti)
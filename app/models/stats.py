@@ -0,0 +1,84 @@
+from sqlalchemy import bindparam, func, select
+
+from app import db
+
+
+class UserStats(db.Model):
+    """This class represents the user_stats table, per user counts of their rows.
+
+    The counts are adjusted in the same transaction as every insert and
+    delete of categories and recipes, so reading them is one primary key
+    lookup instead of a COUNT. `python manage.py reconcile_stats` rebuilds
+    them from the tables.
+    """
+
+    __tablename__ = 'user_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('auth.user_id'), primary_key=True)
+    category_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    recipe_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    @staticmethod
+    def add(user_id, categories=0, recipes=0, session=None):
+        """Adjusts the user's counts in the caller's transaction, with one UPDATE"""
+        if not categories and not recipes:
+            return
+        table = UserStats.__table__
+        (session or db.session).execute(table.update().where(table.c.user_id == user_id).values(
+            category_count=table.c.category_count + categories,
+            recipe_count=table.c.recipe_count + recipes))
+
+    @staticmethod
+    def add_recipes(category_counts, session=None):
+        """Adjusts categories' recipe counts, {category_id: change}, with one executemany"""
+        from .category import Category
+        table = Category.__table__
+        rows = [{'category': category_id, 'change': change}
+                for category_id, change in category_counts.items() if change]
+        if rows:
+            # date_modified is kept, to GET /sync the category itself hasn't changed
+            (session or db.session).execute(
+                table.update().where(table.c.category_id == bindparam('category')).values(
+                    recipe_count=table.c.recipe_count + bindparam('change'),
+                    date_modified=table.c.date_modified), rows)
+
+    @staticmethod
+    def category_total(user_id):
+        """The user's number of categories, None if it isn't counted"""
+        return db.session.query(UserStats.category_count).filter(UserStats.user_id == user_id).scalar()
+
+    @staticmethod
+    def recipe_total(user_id, category_id):
+        """The number of recipes in the user's category, None if there's no such category"""
+        from .category import Category
+        return db.session.query(Category.recipe_count).filter(Category.user_id == user_id).filter(
+            Category.category_id == category_id).scalar()
+
+    @staticmethod
+    def reconcile():
+        """Recounts every user's categories and recipes, and every category's recipes"""
+        from .category import Category
+        from .recipe import Recipe
+        from .recipeAuth import RecipeApp
+        stats = UserStats.__table__
+        missing = select([RecipeApp.user_id]).where(
+            ~RecipeApp.user_id.in_(select([stats.c.user_id])))
+        db.session.execute(stats.insert().from_select(['user_id'], missing))
+        db.session.execute(stats.update().values(
+            category_count=select([func.count(Category.category_id)]).where(
+                Category.user_id == stats.c.user_id).as_scalar(),
+            recipe_count=select([func.count(Recipe.recipe_id)]).where(
+                Recipe.user_id == stats.c.user_id).as_scalar()))
+        categories = Category.__table__
+        db.session.execute(categories.update().values(
+            recipe_count=select([func.count(Recipe.recipe_id)]).where(
+                Recipe.category_id == categories.c.category_id).as_scalar(),
+            date_modified=categories.c.date_modified))
+        db.session.commit()
+        return UserStats.query.count()
+
+    def stats_json(self):
+        return {'categories': self.category_count, 'recipes': self.recipe_count}
+
+    def __repr__(self):
+        return '<UserStats: {}>'.format(self.user_id)
@@ -0,0 +1,38 @@
+"""Multi-get helpers: fetching many rows by id with one IN query."""
+
+
+def parse_ids(value, limit):
+    """The distinct ids in a comma separated list, in the order given.
+
+    Raises ValueError for anything but positive integers, for no ids and
+    for more than `limit` of them.
+    """
+    ids, seen = [], set()
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if not part.isdigit():
+            raise ValueError('Invalid id: {}'.format(part))
+        if int(part) not in seen:
+            seen.add(int(part))
+            ids.append(int(part))
+    if not ids:
+        raise ValueError('ids required.')
+    if len(ids) > limit:
+        raise ValueError('At most {} ids per request.'.format(limit))
+    return ids
+
+
+def ordered(ids, results, key):
+    """The multi-get response: results in the order asked for and the ids not found"""
+    found = dict((result[key], result) for result in results)
+    return {'results': [found[id_] for id_ in ids if id_ in found],
+            'missing': [id_ for id_ in ids if id_ not in found]}
+
+
+def deleted(ids, deleted_ids):
+    """The bulk delete response: the ids deleted and the ids not found"""
+    deleted_ids = set(deleted_ids)
+    return {'deleted': [id_ for id_ in ids if id_ in deleted_ids],
+            'missing': [id_ for id_ in ids if id_ not in deleted_ids]}
@@ -0,0 +1,107 @@
+import smtplib
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from flask import current_app
+
+from app import db
+from app.models.outbox import OutboxMessage
+
+
+def enqueue(recipient, subject, html):
+    """Queues an email, the outbox worker sends it"""
+    message = OutboxMessage(recipient=recipient, subject=subject, html=html)
+    message.save()
+    return message
+
+
+class Mailer(object):
+    """Keeps one SMTP connection open and reuses it for every message."""
+
+    def __init__(self, config):
+        self.config = config
+        self.connection = None
+
+    def connect(self):
+        config = self.config
+        if config['MAIL_USE_SSL']:
+            connection = smtplib.SMTP_SSL(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=30)
+        else:
+            connection = smtplib.SMTP(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=30)
+            if config['MAIL_USE_TLS']:
+                connection.starttls()
+        if config['MAIL_USERNAME']:
+            connection.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+        self.connection = connection
+
+    def send(self, message):
+        msg = EmailMessage()
+        msg['Subject'] = message.subject
+        msg['From'] = self.config['MAIL_DEFAULT_SENDER']
+        msg['To'] = message.recipient
+        msg.set_content(message.html, subtype='html')
+        if self.connection is None:
+            self.connect()
+        try:
+            self.connection.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # the server dropped the idle connection, reconnect once
+            self.connect()
+            self.connection.send_message(msg)
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except smtplib.SMTPException:
+                pass
+            self.connection = None
+
+
+def deliver_pending(mailer):
+    """Sends up to OUTBOX_BATCH_SIZE due messages, returns how many were processed"""
+    config = current_app.config
+    processed = 0
+    while processed < config['OUTBOX_BATCH_SIZE']:
+        # claim one row at a time, a commit releases every lock the
+        # transaction holds and would hand the rest to other workers
+        messages = OutboxMessage.due(1)
+        if not messages:
+            break
+        message = messages[0]
+        try:
+            mailer.send(message)
+        except (smtplib.SMTPException, OSError) as e:
+            mailer.close()
+            message.attempts += 1
+            message.last_error = str(e)
+            if message.attempts >= config['OUTBOX_MAX_ATTEMPTS']:
+                message.status = 'failed'
+            else:
+                # back off exponentially between attempts
+                delay = config['OUTBOX_RETRY_DELAY'] * 2 ** (message.attempts - 1)
+                message.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        else:
+            message.attempts += 1
+            message.status = 'sent'
+            message.sent_at = datetime.utcnow()
+        # record each outcome right away, so a crash later in the batch
+        # doesn't send the messages before it again
+        db.session.commit()
+        processed += 1
+    return processed
+
+
+def run_worker(app):
+    """Drains the outbox forever, sleeping whenever it is empty"""
+    mailer = Mailer(app.config)
+    try:
+        while True:
+            with app.app_context():
+                processed = deliver_pending(mailer)
+            if not processed:
+                mailer.close()
+                time.sleep(app.config['OUTBOX_POLL_INTERVAL'])
+    finally:
+        mailer.close()
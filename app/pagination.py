@@ -0,0 +1,107 @@
+import base64
+import binascii
+
+from flask import abort
+from flask_sqlalchemy import Pagination
+
+
+def encode_cursor(last_id):
+    """Turns the id of the last row on a page into an opaque cursor"""
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns the id a cursor points after, raises ValueError if it's invalid"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+def page_args(args, per_page, max_per_page):
+    """The page and per_page query arguments, raises ValueError if they're invalid"""
+    try:
+        page = int(args.get('page', 1))
+        per_page = int(args.get('per_page', per_page))
+    except ValueError:
+        raise ValueError('page and per_page must be whole numbers.')
+    if page < 1:
+        raise ValueError('page must be 1 or more.')
+    if not 1 <= per_page <= max_per_page:
+        raise ValueError('per_page must be between 1 and {}.'.format(max_per_page))
+    return page, per_page
+
+
+def paginate(query, page, per_page, error_out=True, count=None):
+    """Flask-SQLAlchemy's Query.paginate, with the total from count() when given.
+
+    count returns a total kept elsewhere, e.g. by a counter, so the query
+    needn't be COUNTed; it may return None to count after all.
+    """
+    if count is None:
+        return query.paginate(page, per_page, error_out)
+    if error_out and page < 1:
+        abort(404)
+    items = query.limit(per_page).offset((page - 1) * per_page).all()
+    if error_out and not items and page != 1:
+        abort(404)
+    # no total needed when the first page isn't full
+    if page == 1 and len(items) < per_page:
+        total = len(items)
+    else:
+        total = count()
+        if total is None:
+            total = query.order_by(None).count()
+    return Pagination(query, page, per_page, total, items)
+
+
+def seek(query, key_column, cursor, per_page):
+    """Limits a query (or select()) to the page after cursor, plus one row"""
+    after = decode_cursor(cursor)
+    if after is not None:
+        query = query.filter(key_column > after)
+    return query.order_by(key_column).limit(per_page + 1)
+
+
+class KeysetPage(object):
+    """One page of a keyset (seek) paginated query.
+
+    Rows are read in primary key order starting after the cursor, one row
+    more than a page is fetched to find out whether there is a next page, and
+    the COUNT(*) is only run when the client asks for it.
+    """
+
+    def __init__(self, query, key_column, cursor, per_page, with_total=False, count=None):
+        self.per_page = per_page
+        self.key_column = key_column
+        # count, as for paginate(), saves the COUNT(*) when it knows the total
+        self.total = None
+        if with_total:
+            self.total = count() if count is not None else None
+            if self.total is None:
+                self.total = query.order_by(None).count()
+        self.set_rows(seek(query, key_column, cursor, per_page).all())
+
+    @classmethod
+    def from_rows(cls, rows, key_column, per_page, total=None):
+        """A page of the rows seek() fetched elsewhere, e.g. on an async session"""
+        page = cls.__new__(cls)
+        page.per_page, page.key_column, page.total = per_page, key_column, total
+        page.set_rows(rows)
+        return page
+
+    def set_rows(self, rows):
+        """Takes the rows fetched by seek(), one more than a page if there's a next page"""
+        self.items = rows[:self.per_page]
+        self.next_cursor = None
+        if len(rows) > self.per_page:
+            self.next_cursor = encode_cursor(getattr(self.items[-1], self.key_column.key))
+
+    def response(self, results):
+        response = {'results': results, 'per_page': self.per_page, 'next_cursor': self.next_cursor}
+        if self.total is not None:
+            response['total'] = self.total
+        return response
@@ -0,0 +1,198 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, jsonify, make_response, request
+
+
+class MemoryBackend(object):
+    """Token buckets in this worker's memory, the least recently used are dropped first."""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """Takes a token from the bucket, returns 0 or the seconds until one is available"""
+        now = time.time()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+            return wait
+
+
+class RedisBackend(object):
+    """Token buckets shared by all workers, for any server speaking the Redis protocol."""
+
+    # refills and takes in one round-trip, atomically; the clock is passed in
+    # so every worker's buckets agree with the same arithmetic
+    SCRIPT = """
+        local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(bucket[1]) or burst
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+        local wait = 0
+        if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+        redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+        return tostring(wait)
+    """
+
+    def __init__(self, url, prefix='yummy:rl:'):
+        # redis is only needed when this backend is configured
+        import redis
+        self.client = redis.StrictRedis.from_url(url)
+        self.script = self.client.register_script(self.SCRIPT)
+        self.prefix = prefix
+
+    def take(self, key, rate, burst):
+        return float(self.script(keys=[self.prefix + key], args=[rate, burst, time.time()]))
+
+
+class RateLimiter(object):
+    """Token bucket limits by name, e.g. 'login', each allowing `count` requests per `seconds`.
+
+    A bucket is kept per limit and identity (client IP, user or route and
+    user), holds up to `count` tokens and refills at count / seconds tokens a
+    second, so short bursts pass while the average rate is capped.
+    """
+
+    def __init__(self, backend, limits):
+        self.backend = backend
+        self.limits = dict(limits)
+
+    @staticmethod
+    def from_config(config):
+        backend = config.get('RATE_LIMIT_BACKEND')
+        if backend == 'memory':
+            return RateLimiter(MemoryBackend(), config['RATE_LIMITS'])
+        if backend == 'redis':
+            return RateLimiter(RedisBackend(config['RATE_LIMIT_REDIS_URL']), config['RATE_LIMITS'])
+        return None
+
+    def check(self, name, identity):
+        """Returns 0 if the request may go ahead, else the seconds to wait"""
+        if name not in self.limits:
+            return 0
+        count, seconds = self.limits[name]
+        return self.backend.take('{}:{}'.format(name, identity), float(count) / seconds, count)
+
+
+def client_ip():
+    """The client's address, taken from X-Forwarded-For behind RATE_LIMIT_PROXIES proxies"""
+    proxies = current_app.config.get('RATE_LIMIT_PROXIES', 0)
+    route = request.access_route
+    # each proxy appends the address it saw, so count from the right; the
+    # entries further left were sent by the client and can't be trusted
+    if proxies and len(route) >= proxies:
+        return route[-proxies]
+    return request.remote_addr
+
+
+def too_many_requests_message(wait):
+    return {'message': 'Too many requests. Try again in {} seconds.'.format(int(math.ceil(wait)))}
+
+
+def too_many_requests(wait):
+    retry_after = int(math.ceil(wait))
+    return make_response(jsonify(too_many_requests_message(wait))), 429, {'Retry-After': str(retry_after)}
+
+
+def wait(name, identity):
+    """Takes a token from the `name` limit of identity, returns the seconds to wait if there was none"""
+    limiter = current_app.extensions.get('rate_limiter')
+    if limiter is None:
+        return 0
+    return limiter.check(name, identity)
+
+
+def check(name, identity):
+    """Returns a 429 response if the `name` limit of identity is used up, else None"""
+    seconds = wait(name, identity)
+    if seconds:
+        return too_many_requests(seconds)
+    return None
+
+
+def limit(name, key=client_ip):
+    """Applies the `name` rate limit to a view, per client IP unless `key` says otherwise"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            response = check(name, key())
+            if response is not None:
+                return response
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ConcurrencyLimiter(object):
+    """Caps the requests a worker handles at once, in total and per expensive endpoint.
+
+    Requests over a cap are answered with a 503 straight away instead of
+    queueing for a thread or a database connection, so a flood on one slow
+    endpoint fails fast there and leaves capacity for the others.
+    """
+
+    def __init__(self, max_requests, limits):
+        self.total = threading.BoundedSemaphore(max_requests) if max_requests else None
+        self.slots = dict((name, threading.BoundedSemaphore(size)) for name, size in limits.items())
+
+    @staticmethod
+    def from_config(config):
+        return ConcurrencyLimiter(config.get('MAX_CONCURRENT_REQUESTS', 0),
+                                  config.get('CONCURRENCY_LIMITS', {}))
+
+
+def service_unavailable():
+    response = {'message': 'The server is busy. Please try again.'}
+    return make_response(jsonify(response)), 503, {'Retry-After': '1'}
+
+
+def admit_request():
+    """before_request hook, sheds the request if the worker is at MAX_CONCURRENT_REQUESTS"""
+    limiter = current_app.extensions.get('concurrency_limiter')
+    if limiter is None or limiter.total is None:
+        return None
+    if not limiter.total.acquire(False):
+        return service_unavailable()
+    g.admitted = limiter.total
+    return None
+
+
+def release_request(exc=None):
+    """teardown_request hook, frees the slot taken by admit_request"""
+    admitted = g.pop('admitted', None)
+    if admitted is not None:
+        admitted.release()
+
+
+def shed(name):
+    """Sheds a view's requests beyond its CONCURRENCY_LIMITS[name] slots with a 503"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            limiter = current_app.extensions.get('concurrency_limiter')
+            slot = limiter.slots.get(name) if limiter is not None else None
+            if slot is None:
+                return func(*args, **kwargs)
+            if not slot.acquire(False):
+                return service_unavailable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                slot.release()
+        return wrapper
+    return decorator
@@ -1,11 +1,23 @@
-from flask import Blueprint, make_response, request, jsonify
+import csv
+import json
+
+from flask import Blueprint, make_response, request, jsonify, current_app
 from functools import wraps
 from flasgger import swag_from
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 
 from app.models.recipe import Recipe
 from app.models.recipeAuth import RecipeApp
 from app.models.category import Category
+from app.models.ingredient import Ingredient, RecipeIngredient, parse_ingredients
+from app.models.stats import UserStats
 from app.categories.views import login_required
+from app import db, search, cache, multiget
+from app.cache import cached
+from app.ratelimit import shed
+from app.pagination import KeysetPage, page_args, paginate
+from app.serializers import recipe_serializer, recipe_listing_serializer, json_response
 from . import recipe_api
 import validate
 
@@ -19,63 +31,272 @@ def create_recipes(user_id, category_id):
         Category.category_id == category_id).first()
     if not category:
         return make_response(jsonify({'message': 'Category doesnt exist.'})), 404
-    recipe = Recipe.query.filter(Recipe.user_id == user_id).filter_by(recipe_name=request.data['recipe_name']).first()
-    if not recipe:
-        if request.method == "POST":
-            recipe_name = str(request.data.get('recipe_name', ''))
-            ingredients = str(request.data.get('ingredients', ''))
-            directions = str(request.data.get('directions', ''))
-            recipe_name.strip()
-            if recipe_name:
-                if validate.validate_name(recipe_name) == "True":
-                    recipe = Recipe(recipe_name=recipe_name,
-                                    user_id=user_id, category_id=category_id, ingredients=ingredients, directions=directions)
+    if request.method == "POST":
+        recipe_name = str(request.data.get('recipe_name', ''))
+        ingredients = str(request.data.get('ingredients', ''))
+        directions = str(request.data.get('directions', ''))
+        recipe_name.strip()
+        if recipe_name:
+            if validate.validate_name(recipe_name) == "True":
+                recipe = Recipe(recipe_name=recipe_name,
+                                user_id=user_id, category_id=category_id, ingredients=ingredients, directions=directions)
+                try:
+                    # the unique (user_id, recipe_name) index rejects duplicates
                     recipe.save()
-                    response = jsonify(recipe.recipe_json())
-                    return make_response(response), 201
-            return make_response(jsonify({'message': 'Recipe name required.'})), 400
-    return make_response(jsonify({'message': 'Recipe already exists.'})), 409
+                except IntegrityError:
+                    return make_response(jsonify({'message': 'Recipe already exists.'})), 409
+                response = jsonify(recipe.recipe_json())
+                return make_response(response), 201
+        return make_response(jsonify({'message': 'Recipe name required.'})), 400
+
+
+def read_import_rows():
+    """Yields recipe dicts from an NDJSON or CSV request body as it streams in.
+
+    A row that can't be read is yielded as the message to report it with.
+    """
+    if request.mimetype == 'text/csv':
+        try:
+            for row in csv.DictReader(line.decode('utf-8') for line in request.stream):
+                yield row
+        except (UnicodeDecodeError, csv.Error) as e:
+            # the reader can't find the next row after this, so stop here
+            yield 'Malformed CSV, the rest was skipped: {}'.format(e)
+        return
+    for line in request.stream:
+        try:
+            line = line.decode('utf-8')
+        except UnicodeDecodeError:
+            yield 'Row is not valid UTF-8.'
+            continue
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else None
+
+
+def import_chunk(user_id, category_id, chunk, seen, report):
+    """Inserts one chunk of rows with one duplicate query and one executemany"""
+    try:
+        insert_chunk(user_id, category_id, chunk, set(seen), report)
+    except IntegrityError:
+        # a concurrent request added one of these names after the duplicate
+        # query ran, the unique index caught it so check the chunk again
+        db.session.rollback()
+        del report[len(report) - len(chunk):]
+        try:
+            insert_chunk(user_id, category_id, chunk, set(seen), report)
+        except IntegrityError:
+            # still racing the other request, leave the chunk to it rather
+            # than failing the rows already imported
+            db.session.rollback()
+            del report[len(report) - len(chunk):]
+            report.extend({'row': row['row'], 'recipe_name': row['recipe_name'], 'status': 'failed',
+                           'message': 'Recipe name was taken by a concurrent request.'} for row in chunk)
+            return
+    seen.update(row['recipe_name'] for row in chunk)
+
+
+def insert_chunk(user_id, category_id, chunk, seen, report):
+    names = [row['recipe_name'] for row in chunk]
+    existing = set(name for name, in db.session.query(Recipe.recipe_name).filter(
+        Recipe.user_id == user_id).filter(Recipe.recipe_name.in_(names)))
+    rows = []
+    for row in chunk:
+        if row['recipe_name'] in existing or row['recipe_name'] in seen:
+            report.append({'row': row['row'], 'recipe_name': row['recipe_name'],
+                           'status': 'duplicate', 'message': 'Recipe already exists.'})
+            continue
+        seen.add(row['recipe_name'])
+        rows.append({'recipe_name': row['recipe_name'], 'ingredients': row['ingredients'],
+                     'directions': row['directions'], 'user_id': user_id, 'category_id': category_id})
+        report.append({'row': row['row'], 'recipe_name': row['recipe_name'], 'status': 'created'})
+    if rows:
+        db.session.execute(Recipe.__table__.insert(), rows)
+        ingredients = dict((row['recipe_name'], row['ingredients']) for row in rows)
+        inserted = db.session.query(Recipe.recipe_id, Recipe.recipe_name).filter(
+            Recipe.user_id == user_id).filter(Recipe.recipe_name.in_(list(ingredients)))
+        RecipeIngredient.link([(recipe_id, user_id, ingredients[name]) for recipe_id, name in inserted],
+                              replace=False)
+        UserStats.add(user_id, recipes=len(rows))
+        UserStats.add_recipes({category_id: len(rows)})
+    db.session.commit()
+
+
+@recipe_api.route('/categories/<int:category_id>/recipes/bulk', methods=['POST'])
+@login_required
+@shed('bulk_import')
+@swag_from('/app/docs/create_recipes_bulk.yml')
+def create_recipes_bulk(user_id, category_id):
+    """Imports many recipes into an existing category from NDJSON or CSV"""
+    category = Category.query.filter(Category.user_id == user_id).filter(
+        Category.category_id == category_id).first()
+    if not category:
+        return make_response(jsonify({'message': 'Category doesnt exist.'})), 404
+    if request.mimetype not in ('application/x-ndjson', 'text/csv'):
+        response = {'message': 'Send recipes as application/x-ndjson or text/csv.'}
+        return make_response(jsonify(response)), 415
+    chunk_size = current_app.config['BULK_IMPORT_CHUNK_SIZE']
+    report, chunk, seen = [], [], set()
+    for number, row in enumerate(read_import_rows(), 1):
+        if isinstance(row, str):
+            report.append({'row': number, 'status': 'invalid', 'message': row})
+            continue
+        recipe_name = str((row or {}).get('recipe_name') or '').strip()
+        if not recipe_name or validate.validate_name(recipe_name) != "True":
+            report.append({'row': number, 'status': 'invalid', 'message': 'Recipe name required.'})
+            continue
+        chunk.append({'row': number, 'recipe_name': recipe_name.title(),
+                      'ingredients': str(row.get('ingredients') or ''),
+                      'directions': str(row.get('directions') or '')})
+        if len(chunk) >= chunk_size:
+            import_chunk(user_id, category_id, chunk, seen, report)
+            chunk = []
+    if chunk:
+        import_chunk(user_id, category_id, chunk, seen, report)
+    cache.invalidate('recipes:{}:{}'.format(user_id, category_id))
+    report.sort(key=lambda r: r['row'])
+    counts = {status: sum(1 for r in report if r['status'] == status)
+              for status in ('created', 'duplicate', 'invalid', 'failed')}
+    return make_response(jsonify({'counts': counts, 'results': report})), 200
 
 
 @recipe_api.route('/categories/<int:category_id>/recipes/', methods=['GET'])
 @login_required
+@cached('recipes:{user_id}:{category_id}', 'category:{user_id}:{category_id}')
 @swag_from('/app/docs/view_recipes.yml')
 def view_recipes(user_id, category_id):
     """View recipes in an existing category"""
-    category = Category.query.filter(Category.user_id == user_id).filter(
-        Category.category_id == category_id)
-    if not category:
-        response = {'message': 'Category name doesnt exist.'}
-        return make_response(jsonify(response)), 422
+    # recipes are scoped to the user and category below, so a category that
+    # doesn't exist or isn't the user's simply has no recipes
     if request.method == "GET":
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 6))
-        q = str(request.args.get('q', '')).title()
-        # GET all the recipes under this category
-        recipes = Recipe.query.filter(Recipe.user_id == user_id).filter(
-            Recipe.category_id == category_id).filter(Recipe.recipe_name.like('%' + q + '%')).paginate(page, per_page)
-        results = []
-        if recipes:
-            for recipe in recipes.items:
-                obj = recipe.recipe_json()
-                results.append(obj)
+        try:
+            page, per_page = page_args(request.args, 6, current_app.config['MAX_PER_PAGE'])
+        except ValueError as e:
+            return make_response(jsonify({'message': str(e)})), 400
+        q = str(request.args.get('q', ''))
+        # unless searching, the total is the category's recipe counter
+        count = None if q else lambda: UserStats.recipe_total(user_id, category_id)
+        try:
+            serializer = recipe_listing_serializer(request.args.get('fields', ''))
+        except ValueError as e:
+            return make_response(jsonify({'message': str(e)})), 400
+        if 'cursor' in request.args:
+            # keyset pagination, seeks past the last recipe_id seen
+            query = search.search(Recipe.query.filter(Recipe.user_id == user_id).filter(
+                Recipe.category_id == category_id).with_entities(*serializer.columns),
+                Recipe, q, ranked=False)
+            try:
+                recipes = KeysetPage(query, Recipe.recipe_id, request.args['cursor'],
+                                     per_page, request.args.get('include_total') == 'true', count)
+            except ValueError as e:
+                return make_response(jsonify({'message': str(e)})), 400
+            if not recipes.items and not request.args['cursor']:
+                return make_response(jsonify({'message': 'No recipes found'})), 422
+            return json_response(recipes.response(serializer.rows(recipes.items)))
+        # GET all the recipes under this category, searching names, ingredients and directions
+        recipes = paginate(search.search(Recipe.query.filter(Recipe.user_id == user_id).filter(
+            Recipe.category_id == category_id).with_entities(*serializer.columns),
+            Recipe, q), page, per_page, count=count)
+        results = serializer.rows(recipes.items)
         if results:
-            return ({'results':results, 'page':recipes.page, 'total':recipes.total, 'per_page':recipes.per_page, 'next_page':recipes.next_num}), 200
+            return json_response({'results':results, 'page':recipes.page, 'total':recipes.total, 'per_page':recipes.per_page, 'next_page':recipes.next_num})
             # return make_response(jsonify(results)), 200
         return make_response(jsonify({'message': 'No recipes found'})), 422
 
 
+@recipe_api.route('/recipes', methods=['GET'])
+@login_required
+@swag_from('/app/docs/view_recipes_by_id.yml')
+def view_recipes_by_id(user_id):
+    """View many recipes, from any of the user's categories, by their IDs"""
+    try:
+        ids = multiget.parse_ids(request.args.get('ids', ''), current_app.config['BATCH_MAX_IDS'])
+        # whole recipes as view_one_recipe shows them, unless ?fields= asks for less
+        fields = request.args.get('fields', '')
+        serializer = recipe_listing_serializer(fields) if fields else recipe_serializer
+    except ValueError as e:
+        return make_response(jsonify({'message': str(e)})), 400
+    rows = db.session.query(*serializer.columns).filter(Recipe.user_id == user_id).filter(
+        Recipe.recipe_id.in_(ids))
+    return json_response(multiget.ordered(ids, serializer.rows(rows), 'recipe_id'))
+
+
+@recipe_api.route('/recipes', methods=['DELETE'])
+@login_required
+@swag_from('/app/docs/delete_recipes_by_id.yml')
+def delete_recipes_by_id(user_id):
+    """Deletes many recipes, from any of the user's categories, by ID in one transaction"""
+    try:
+        ids = multiget.parse_ids(request.args.get('ids', ''), current_app.config['BATCH_MAX_IDS'])
+    except ValueError as e:
+        return make_response(jsonify({'message': str(e)})), 400
+    deleted = Recipe.bulk_delete(user_id, ids)
+    db.session.commit()
+    if deleted:
+        namespaces = set('recipes:{}:{}'.format(user_id, category_id) for recipe_id, category_id in deleted)
+        namespaces.update('recipe:{}:{}'.format(user_id, recipe_id) for recipe_id, category_id in deleted)
+        cache.invalidate(*namespaces)
+    return json_response(multiget.deleted(ids, [recipe_id for recipe_id, category_id in deleted]))
+
+
+@recipe_api.route('/recipes/cook', methods=['GET'])
+@login_required
+@swag_from('/app/docs/cook.yml')
+def cook(user_id):
+    """Ranks the user's recipes by how much of them the pantry covers"""
+    pantry = parse_ingredients(request.args.get('pantry', ''))
+    if not pantry:
+        return make_response(jsonify({'message': 'Pantry ingredients required.'})), 400
+    try:
+        limit = min(int(request.args.get('limit', 20)), 100)
+    except ValueError:
+        return make_response(jsonify({'message': 'Invalid limit.'})), 400
+    pantry_ids = list(Ingredient.ids_for(pantry).values())
+    if not pantry_ids:
+        return make_response(jsonify({'message': 'No recipes found'})), 422
+    # one pass over the (user_id, ingredient_id) index counts, per recipe,
+    # how many of its ingredients are in the pantry; the recipe's own
+    # ingredient_count gives the coverage without touching its other rows
+    have = func.count(RecipeIngredient.ingredient_id).label('have')
+    matches = db.session.query(RecipeIngredient.recipe_id, have).filter(
+        RecipeIngredient.user_id == user_id).filter(
+        RecipeIngredient.ingredient_id.in_(pantry_ids)).group_by(
+        RecipeIngredient.recipe_id).subquery()
+    missing = (Recipe.ingredient_count - matches.c.have).label('missing')
+    rows = db.session.query(Recipe.recipe_id, Recipe.recipe_name, Recipe.category_id,
+                            Recipe.ingredient_count, matches.c.have, missing).join(
+        matches, matches.c.recipe_id == Recipe.recipe_id).order_by(
+        (matches.c.have * 1.0 / Recipe.ingredient_count).desc(), missing,
+        Recipe.recipe_id).limit(limit).all()
+    if not rows:
+        return make_response(jsonify({'message': 'No recipes found'})), 422
+    # names of the missing ingredients for just this page, in one IN query
+    missing_names = {}
+    for recipe_id, name in db.session.query(RecipeIngredient.recipe_id, Ingredient.name).join(
+            Ingredient, Ingredient.ingredient_id == RecipeIngredient.ingredient_id).filter(
+            RecipeIngredient.recipe_id.in_([row.recipe_id for row in rows])).filter(
+            ~RecipeIngredient.ingredient_id.in_(pantry_ids)).order_by(Ingredient.name):
+        missing_names.setdefault(recipe_id, []).append(name)
+    results = [{'recipe_id': row.recipe_id, 'recipe_name': row.recipe_name,
+                'category_id': row.category_id, 'ingredient_count': row.ingredient_count,
+                'have': row.have, 'missing': missing_names.get(row.recipe_id, []),
+                'coverage': round(float(row.have) / row.ingredient_count, 4)}
+               for row in rows]
+    return json_response({'pantry': pantry, 'results': results})
+
+
 @recipe_api.route('/categories/<int:category_id>/recipes/<int:recipe_id>', methods=['GET'])
 @login_required
+@cached('recipe:{user_id}:{recipe_id}', 'category:{user_id}:{category_id}')
 @swag_from('/app/docs/view_one_recipe.yml')
 def view_one_recipe(user_id, category_id, recipe_id):
     """View one recipe in an existing category"""
-    category = Category.query.filter(Category.user_id == user_id).filter(
-        Category.category_id == category_id)
-    if not category:
-        response = {'message': 'Category name doesnt exist.'}
-        return make_response(jsonify(response)), 422
-    recipe = Recipe.query.filter_by(recipe_id=recipe_id).first()
+    recipe = Recipe.query.options(db.undefer_group('body')).filter_by(
+        user_id=user_id, category_id=category_id, recipe_id=recipe_id).first()
     if not recipe:
         return {"message": "No recipe found"}, 404
     response = jsonify(recipe.recipe_json())
@@ -88,12 +309,9 @@ def view_one_recipe(user_id, category_id, recipe_id):
 @swag_from('/app/docs/edit_recipe.yml')
 def edit_recipe(user_id, category_id, recipe_id):
     """Edit a recipe in an existing category"""
-    category = Category.query.filter(Category.user_id == user_id).filter(
-        Category.category_id == category_id)
-    if not category:
-        response = {'message': 'Category name doesnt exist.'}
-        return make_response(jsonify(response)), 422
-    recipe = Recipe.query.filter_by(recipe_id=recipe_id).first()
+    # with the text loaded, saving can tell whether the ingredients changed
+    recipe = Recipe.query.options(db.undefer_group('body')).filter_by(
+        user_id=user_id, category_id=category_id, recipe_id=recipe_id).first()
     if not recipe:
         return {"message": "No recipe found to edit"}, 404
     if request.method == 'PUT':
@@ -104,7 +322,10 @@ def edit_recipe(user_id, category_id, recipe_id):
         recipe.recipe_name = recipe_name
         recipe.ingredients = ingredients
         recipe.directions = directions
-        recipe.save()
+        try:
+            recipe.save()
+        except IntegrityError:
+            return make_response(jsonify({'message': 'Recipe already exists.'})), 409
         response = jsonify(recipe.recipe_json())
         response.status_code = 200
         return response
@@ -115,13 +336,9 @@ def edit_recipe(user_id, category_id, recipe_id):
 @swag_from('/app/docs/delete_recipe.yml')
 def delete_recipe(user_id, category_id, recipe_id):
     """Delete a recipe in an existing category"""
-    category = Category.query.filter(Category.user_id == user_id).filter(
-        Category.category_id == category_id)
-    if not category:
-        response = {'message': 'Category name doesnt exist.'}
-        return make_response(jsonify(response)), 422
     # delete a recipe
-    recipe = Recipe.query.filter_by(recipe_id=recipe_id).first()
+    recipe = Recipe.query.filter_by(
+        user_id=user_id, category_id=category_id, recipe_id=recipe_id).first()
     if not recipe:
         # Raise an HTTPException with a 404 not found status code
         return {"message": "No recipe found to delete"}, 404
@@ -0,0 +1,75 @@
+import threading
+import time
+from calendar import timegm
+from datetime import timedelta
+
+
+class RevocationCache(object):
+    """In-process view of the expired_tokens table, by token jti.
+
+    Logouts in this process are recorded immediately. Logouts made by other
+    workers are picked up by a single incremental query at most once every
+    `sync_interval` seconds, so auth checks themselves never touch the
+    database.
+    """
+
+    def __init__(self, sync_interval=5, overlap=30):
+        self.sync_interval = sync_interval
+        self.overlap = overlap
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.revoked = {}
+        self.last_expired_on = None
+        self.last_sync = None
+
+    def revoke(self, jti, expires_at):
+        """Remember a revoked token until its own `exp` passes"""
+        with self.lock:
+            self.revoked[jti] = expires_at
+
+    def is_revoked(self, jti):
+        """Checks if a token whose signature is already verified was revoked"""
+        if self.sync_due():
+            from app import db
+            self.sync(db.session)
+        # entries are only dropped once their token has expired, and expired
+        # tokens fail verification before they get here
+        return jti in self.revoked
+
+    def sync_due(self):
+        """Claims the next sync if `sync_interval` has passed since the last one"""
+        now = time.time()
+        if self.last_sync is not None and now - self.last_sync < self.sync_interval:
+            return False
+        with self.lock:
+            if self.last_sync is not None and now - self.last_sync < self.sync_interval:
+                return False
+            self.last_sync = now
+        return True
+
+    def sync(self, session):
+        """Picks up the tokens revoked since the last sync, querying through `session`"""
+        from app.models.recipeAuth import ExpiredToken
+        now = time.time()
+        query = session.query(ExpiredToken.jti, ExpiredToken.expires_at, ExpiredToken.expired_on)
+        if self.last_expired_on is not None:
+            # ids and timestamps are taken before commit, so a row can show up
+            # after later ones were synced; re-read a margin for transactions
+            # that were still open, the jtis that repeat are already known
+            query = query.filter(
+                ExpiredToken.expired_on >= self.last_expired_on - timedelta(seconds=self.overlap))
+        for jti, expires_at, expired_on in query.all():
+            if self.last_expired_on is None or expired_on > self.last_expired_on:
+                self.last_expired_on = expired_on
+            expires_at = timegm(expires_at.utctimetuple())
+            if expires_at > now:
+                self.revoke(jti, expires_at)
+        self._prune(now)
+
+    def _prune(self, now):
+        with self.lock:
+            expired = [jti for jti, expires_at in self.revoked.items() if expires_at <= now]
+            for jti in expired:
+                del self.revoked[jti]
@@ -0,0 +1,91 @@
+from sqlalchemy import DDL, event, func, or_, select, table, column, text
+
+from app import db
+
+# model -> (index name, primary key column, searchable columns)
+indexes = {}
+
+# FTS5 trigram indexes can't match anything shorter than a trigram
+MIN_FTS_QUERY = 3
+
+
+def register(model, primary_key, columns):
+    """Builds a search index over `columns` whenever the model's table is created.
+
+    On PostgreSQL every column gets a pg_trgm GIN index, which serves the
+    ILIKE '%q%' filter. On SQLite an external content FTS5 table with the
+    trigram tokenizer is kept in sync by triggers.
+    """
+    tablename = model.__tablename__
+    name = '{}_search'.format(tablename)
+    indexes[model] = (name, primary_key, columns)
+    names = [c.name for c in columns]
+    pk = primary_key.name
+
+    postgres = [DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm')]
+    for col in names:
+        postgres.append(DDL(
+            'CREATE INDEX IF NOT EXISTS ix_{0}_{1}_trgm ON {0} '
+            'USING gin ({1} gin_trgm_ops)'.format(tablename, col)))
+
+    new_values = ', '.join('new.' + col for col in names)
+    old_values = ', '.join('old.' + col for col in names)
+    sqlite = [
+        DDL("CREATE VIRTUAL TABLE IF NOT EXISTS {0} USING fts5({1}, content='{2}', "
+            "content_rowid='{3}', tokenize='trigram')".format(name, ', '.join(names), tablename, pk)),
+        DDL("CREATE TRIGGER {0}_ai AFTER INSERT ON {1} BEGIN "
+            "INSERT INTO {0}(rowid, {2}) VALUES (new.{3}, {4}); END".format(
+                name, tablename, ', '.join(names), pk, new_values)),
+        DDL("CREATE TRIGGER {0}_ad AFTER DELETE ON {1} BEGIN "
+            "INSERT INTO {0}({0}, rowid, {2}) VALUES ('delete', old.{3}, {4}); END".format(
+                name, tablename, ', '.join(names), pk, old_values)),
+        DDL("CREATE TRIGGER {0}_au AFTER UPDATE ON {1} BEGIN "
+            "INSERT INTO {0}({0}, rowid, {2}) VALUES ('delete', old.{3}, {4}); "
+            "INSERT INTO {0}(rowid, {2}) VALUES (new.{3}, {5}); END".format(
+                name, tablename, ', '.join(names), pk, old_values, new_values)),
+    ]
+    for ddl in postgres:
+        event.listen(model.__table__, 'after_create', ddl.execute_if(dialect='postgresql'))
+    for ddl in sqlite:
+        event.listen(model.__table__, 'after_create', ddl.execute_if(dialect='sqlite'))
+    event.listen(model.__table__, 'before_drop',
+                 DDL('DROP TABLE IF EXISTS {}'.format(name)).execute_if(dialect='sqlite'))
+
+
+def _like_pattern(q):
+    """Escapes LIKE wildcards so q is matched literally"""
+    return '%' + q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def search(query, model, q, ranked=True, dialect=None):
+    """Filters `query` down to rows of `model` matching q, best matches first.
+
+    With ranked=False only the filter is applied and ordering is left to the
+    caller, e.g. for keyset pagination. `query` may also be a select(), whose
+    `dialect` name must then be given as there's no session to ask.
+    """
+    name, primary_key, columns = indexes[model]
+    q = q.strip()
+    if not q:
+        return query.order_by(primary_key) if ranked else query
+    dialect = dialect or db.engine.dialect.name
+
+    if dialect == 'sqlite' and len(q) >= MIN_FTS_QUERY:
+        fts = table(name, column('rowid'), column('rank'))
+        matches = select([fts.c.rowid, fts.c.rank]).where(
+            text('{} MATCH :search_q'.format(name)).bindparams(
+                search_q='"' + q.replace('"', '""') + '"')).alias('matches')
+        query = query.join(matches, matches.c.rowid == primary_key)
+        return query.order_by(matches.c.rank, primary_key) if ranked else query
+
+    pattern = _like_pattern(q)
+    query = query.filter(or_(*[c.ilike(pattern, escape='\\') for c in columns]))
+    if not ranked:
+        return query
+    if dialect == 'postgresql':
+        # a hit on the first column (the name) outranks one in the other columns
+        return query.order_by(
+            func.word_similarity(q, func.coalesce(columns[0], '')).desc(),
+            func.greatest(*[func.word_similarity(q, func.coalesce(c, '')) for c in columns]).desc(),
+            primary_key)
+    return query.order_by(primary_key)
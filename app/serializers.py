@@ -0,0 +1,115 @@
+import json
+from datetime import date
+
+from flask import current_app, url_for
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:
+    # orjson is optional, the standard library encoder gives the same output
+    orjson = None
+
+from app.instrumentation import timed
+from app.models.category import Category
+from app.models.recipe import Recipe
+
+
+def _default(value):
+    # dates go out the way Flask's jsonify has always rendered them
+    if isinstance(value, date):
+        return http_date(value)
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+def dumps(obj):
+    """Encodes obj as JSON bytes, using orjson when it's installed"""
+    with timed('serialize'):
+        if orjson is not None:
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def json_response(obj, status=200):
+    """A ready to send JSON response, bypassing Flask-API's renderers"""
+    return current_app.response_class(dumps(obj), status=status, mimetype='application/json')
+
+
+class Serializer(object):
+    """Turns rows of selected columns into response dicts.
+
+    The field list is fixed when the serializer is built, so serializing a
+    row is a zip over precomputed keys rather than per-attribute lookups.
+    List endpoints select `columns` and hand the resulting tuples to rows().
+    """
+
+    def __init__(self, *fields):
+        # fields are (response key, column) pairs
+        self.keys = tuple(key for key, column in fields)
+        self.columns = tuple(column for key, column in fields)
+
+    def row(self, row):
+        return dict(zip(self.keys, row))
+
+    def rows(self, rows):
+        keys = self.keys
+        with timed('serialize'):
+            return [dict(zip(keys, row)) for row in rows]
+
+    def entity(self, obj):
+        """Serializes a loaded model instance with the same fields"""
+        return self.row(getattr(obj, column.key) for column in self.columns)
+
+    def only(self, keys):
+        """A serializer for a subset of the fields, raises ValueError for unknown keys"""
+        columns = dict(zip(self.keys, self.columns))
+        unknown = [key for key in keys if key not in columns]
+        if unknown:
+            raise ValueError('Unknown fields: {}'.format(', '.join(unknown)))
+        return Serializer(*[(key, columns[key]) for key in self.keys if key in keys])
+
+
+category_serializer = Serializer(
+    ('category_id', Category.category_id),
+    ('category_name', Category.category_name),
+    ('date_created', Category.date_created),
+    ('date_modified', Category.date_modified),
+    ('created_by', Category.user_id))
+
+recipe_serializer = Serializer(
+    ('recipe_id', Recipe.recipe_id),
+    ('recipe_name', Recipe.recipe_name),
+    ('ingredients', Recipe.ingredients),
+    ('directions', Recipe.directions),
+    ('date_created', Recipe.date_created),
+    ('date_modified', Recipe.date_modified),
+    ('created_by', Recipe.user_id),
+    ('category_id', Recipe.category_id))
+
+# what recipe listings return unless ?fields= asks for more, i.e. everything
+# but the long ingredients and directions
+recipe_summary_serializer = recipe_serializer.only(
+    ['recipe_id', 'recipe_name', 'date_created', 'date_modified', 'created_by', 'category_id'])
+
+
+def recipe_listing_serializer(fields):
+    """The serializer for the comma separated `fields` a listing asked for"""
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    if not fields:
+        return recipe_summary_serializer
+    # pagination needs the recipe_id of every row
+    return recipe_serializer.only(['recipe_id'] + fields)
+
+
+def recipes_url_template():
+    """The external recipes url of a category, built once per request"""
+    return url_for('category_api.view_categories', _external=True) + '{}/recipes/'
+
+
+def categories_with_links(rows, template=None):
+    """Serializes category rows, adding the link to each category's recipes"""
+    template = template or recipes_url_template()
+    results = category_serializer.rows(rows)
+    for result in results:
+        result['recipes'] = template.format(result['category_id'])
+    return results
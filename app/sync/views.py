@@ -0,0 +1,139 @@
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta
+
+from flask import make_response, request, jsonify, current_app
+from flasgger import swag_from
+from sqlalchemy import and_, or_
+
+from app import db
+from app.models.category import Category
+from app.models.changelog import ChangeLog
+from app.models.recipe import Recipe
+from app.categories.views import login_required
+from app.serializers import category_serializer, categories_with_links, recipe_serializer, json_response
+from . import sync_api
+
+TIMESTAMP = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def encode_token(state):
+    """Turns the sync state into an opaque token, like a pagination cursor"""
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """Returns the sync state of a token, raises ValueError if it's invalid.
+
+    'since' is where the round of syncing started (None for a full sync)
+    and 'now' when its first page was read; the rest are the positions
+    reached in each kind of row while paging through the round.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        if state['since'] is not None:
+            datetime.strptime(state['since'], TIMESTAMP)
+        if state.get('now') is not None:
+            datetime.strptime(state['now'], TIMESTAMP)
+        for key in ('categories', 'recipes'):
+            if key in state:
+                datetime.strptime(state[key][0], TIMESTAMP)
+                int(state[key][1])
+        int(state.get('deleted', 0))
+        return state
+    except (binascii.Error, UnicodeDecodeError, ValueError, KeyError, IndexError,
+            TypeError, AttributeError):
+        raise ValueError('Invalid sync token')
+
+
+def comparable(value):
+    """A timestamp column or value in a form that compares with the other"""
+    if db.engine.dialect.name == 'sqlite':
+        # sqlite keeps timestamps as text, CURRENT_TIMESTAMP defaults without
+        # a fraction and bound datetimes with one, so compare whole seconds
+        return db.func.datetime(value)
+    return value
+
+
+def timestamp(value):
+    return comparable(datetime.strptime(value, TIMESTAMP))
+
+
+def changed_since(query, column, key_column, since, after, limit):
+    """Rows modified at or after since, seeking past the (date_modified, id) after"""
+    if since is not None:
+        query = query.filter(comparable(column) >= timestamp(since))
+    if after is not None:
+        modified = timestamp(after[0])
+        query = query.filter(or_(comparable(column) > modified,
+                                 and_(comparable(column) == modified, key_column > after[1])))
+    return query.order_by(comparable(column), key_column).limit(limit + 1).all()
+
+
+@sync_api.route('/sync', methods=['GET'])
+@login_required
+@swag_from('/app/docs/sync.yml')
+def sync(user_id):
+    """Returns the categories and recipes changed since a sync token, and the deleted ones"""
+    # date_modified and deleted_at are set by the database's clock
+    now = db.now()
+    since = request.args.get('since', '')
+    if since:
+        try:
+            state = decode_token(since)
+        except ValueError as e:
+            return make_response(jsonify({'message': str(e)})), 400
+        retention = timedelta(days=current_app.config['SYNC_TOMBSTONE_DAYS'])
+        if state['since'] is not None and datetime.strptime(state['since'], TIMESTAMP) < now - retention:
+            # the tombstones it needs may have been pruned
+            response = {'message': 'Sync token expired, sync again without since.'}
+            return make_response(jsonify(response)), 410
+        # the first page of a round
+        if state.get('now') is None:
+            state['now'] = now.strftime(TIMESTAMP)
+    else:
+        # a full sync, everything there is and no tombstones
+        state = {'since': None, 'now': now.strftime(TIMESTAMP)}
+    limit = current_app.config['SYNC_PAGE_SIZE']
+    has_more = False
+
+    categories = changed_since(
+        Category.query.filter(Category.user_id == user_id).with_entities(*category_serializer.columns),
+        Category.date_modified, Category.category_id, state['since'], state.get('categories'), limit)
+    if len(categories) > limit:
+        categories, has_more = categories[:limit], True
+    if categories:
+        state['categories'] = [categories[-1].date_modified.strftime(TIMESTAMP), categories[-1].category_id]
+
+    recipes = changed_since(
+        db.session.query(*recipe_serializer.columns).filter(Recipe.user_id == user_id),
+        Recipe.date_modified, Recipe.recipe_id, state['since'], state.get('recipes'), limit)
+    if len(recipes) > limit:
+        recipes, has_more = recipes[:limit], True
+    if recipes:
+        state['recipes'] = [recipes[-1].date_modified.strftime(TIMESTAMP), recipes[-1].recipe_id]
+
+    deleted = {'categories': [], 'recipes': []}
+    if state['since'] is not None:
+        tombstones = db.session.query(ChangeLog.change_id, ChangeLog.entity, ChangeLog.entity_id).filter(
+            ChangeLog.user_id == user_id).filter(
+            comparable(ChangeLog.deleted_at) >= timestamp(state['since'])).filter(
+            ChangeLog.change_id > state.get('deleted', 0)).order_by(ChangeLog.change_id).limit(limit + 1).all()
+        if len(tombstones) > limit:
+            tombstones, has_more = tombstones[:limit], True
+        for change_id, entity, entity_id in tombstones:
+            deleted['categories' if entity == ChangeLog.CATEGORY else 'recipes'].append(entity_id)
+        if tombstones:
+            state['deleted'] = tombstones[-1].change_id
+
+    if not has_more:
+        # the next round starts from when this one did, less a margin for
+        # transactions that were still open then, so changes may repeat
+        overlap = timedelta(seconds=current_app.config['SYNC_OVERLAP_SECONDS'])
+        start = datetime.strptime(state['now'], TIMESTAMP) - overlap
+        state = {'since': start.strftime(TIMESTAMP)}
+    return json_response({'categories': categories_with_links(categories),
+                          'recipes': recipe_serializer.rows(recipes),
+                          'deleted': deleted, 'next': encode_token(state), 'has_more': has_more})
@@ -0,0 +1,102 @@
+import secrets
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import jwt
+from flask import current_app
+
+from app.instrumentation import timed
+
+# token types, carried in the 'typ' claim so one kind can't be used as another
+ACCESS = 'access'
+REFRESH = 'refresh'
+RESET = 'reset'
+
+
+class KeyRing(object):
+    """HMAC signing keys by key id (kid).
+
+    The first key signs new tokens and every key verifies the tokens that
+    name it in their header, so a new key can be put first while the
+    tokens signed by the old one run out, and the old key dropped after.
+    """
+
+    def __init__(self, keys):
+        if not keys:
+            raise ValueError('At least one signing key is required')
+        self.keys = OrderedDict(keys)
+        self.signing_kid = next(iter(self.keys))
+
+    @staticmethod
+    def parse(spec):
+        """Builds a key ring from 'kid:secret,kid:secret'"""
+        keys = []
+        for entry in spec.split(','):
+            kid, separator, secret = entry.strip().partition(':')
+            if not separator or not kid or not secret:
+                raise ValueError('JWT_KEYS entries look like kid:secret')
+            keys.append((kid, secret.encode()))
+        return KeyRing(keys)
+
+    def get(self, kid):
+        return self.keys.get(kid)
+
+
+class TokenService(object):
+    """Issues and verifies the JWTs of every token type.
+
+    Verifying only needs the key ring, parsed once per app, so it never
+    touches the database. Every token has a random 'jti' that revocation is
+    keyed on.
+    """
+
+    algorithm = 'HS256'
+
+    def __init__(self, keyring, lifetimes):
+        self.keyring = keyring
+        self.lifetimes = lifetimes
+
+    @staticmethod
+    def from_config(config):
+        if not config.get('JWT_KEYS'):
+            raise ValueError('Set JWT_KEYS or SECRET to sign tokens with')
+        return TokenService(KeyRing.parse(config['JWT_KEYS']), {
+            ACCESS: timedelta(minutes=config['ACCESS_TOKEN_MINUTES']),
+            REFRESH: timedelta(days=config['REFRESH_TOKEN_DAYS']),
+            RESET: timedelta(minutes=config['RESET_TOKEN_MINUTES']),
+        })
+
+    def lifetime(self, token_type):
+        """Seconds a new token of `token_type` stays valid"""
+        return int(self.lifetimes[token_type].total_seconds())
+
+    def issue(self, user_id, token_type, epoch=0):
+        """Returns a new signed token for user_id, of the user's current token `epoch`"""
+        now = datetime.utcnow()
+        payload = {'sub': user_id, 'typ': token_type, 'jti': secrets.token_hex(16),
+                   'epoch': epoch, 'iat': now, 'exp': now + self.lifetimes[token_type]}
+        kid = self.keyring.signing_kid
+        with timed('jwt'):
+            token = jwt.encode(payload, self.keyring.get(kid), algorithm=self.algorithm,
+                               headers={'kid': kid})
+        return token.decode() if isinstance(token, bytes) else token
+
+    def verify(self, token, token_type):
+        """Returns the claims of a valid token of `token_type`.
+
+        Raises jwt.ExpiredSignatureError for expired tokens and
+        jwt.InvalidTokenError for anything else wrong with it.
+        """
+        with timed('jwt'):
+            key = self.keyring.get(jwt.get_unverified_header(token).get('kid'))
+            if key is None:
+                raise jwt.InvalidTokenError('Unknown signing key')
+            claims = jwt.decode(token, key, algorithms=[self.algorithm])
+        if claims.get('typ') != token_type or not claims.get('jti'):
+            raise jwt.InvalidTokenError('Wrong token type')
+        return claims
+
+
+def service():
+    """The current app's token service"""
+    return current_app.extensions['token_service']
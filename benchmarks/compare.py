@@ -0,0 +1,65 @@
+"""Compares two benchmark result files, e.g. from the base and head commits.
+
+Prints p50, p99 and throughput per endpoint (per scale for suite results)
+and exits with status 1 when an endpoint's p99 got slower by more than
+--threshold, ignoring differences under --min-ms which are noise:
+
+    python -m benchmarks.compare benchmarks/results/base.json benchmarks/results/head.json
+"""
+import argparse
+import json
+import sys
+
+
+def runs(results):
+    """Maps scale name to run, a single load run is scale '-'"""
+    if 'scales' in results:
+        return results['scales']
+    return {'-': results}
+
+
+def change(before, after):
+    if not before:
+        return ''
+    return '{:+.0%}'.format(float(after - before) / before)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed p99 slowdown, 0.2 is 20%%')
+    parser.add_argument('--min-ms', type=float, default=2.0)
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    print('base {} -> head {}'.format(base.get('commit'), head.get('commit')))
+    row = '{:<6} {:<42} {:>9} {:>9} {:>6} {:>9} {:>9} {:>6} {:>8}'
+    print(row.format('scale', 'endpoint', 'p50 ms', 'p50 ms', '', 'p99 ms', 'p99 ms', '', 'req/s'))
+    regressions = []
+    head_runs = runs(head)
+    for scale, base_run in sorted(runs(base).items()):
+        if scale not in head_runs:
+            continue
+        head_run = head_runs[scale]
+        for name, before in sorted(base_run['endpoints'].items()):
+            after = head_run['endpoints'].get(name)
+            if after is None:
+                continue
+            print(row.format(scale, name, before['p50_ms'], after['p50_ms'],
+                             change(before['p50_ms'], after['p50_ms']), before['p99_ms'], after['p99_ms'],
+                             change(before['p99_ms'], after['p99_ms']),
+                             change(before['requests_per_second'], after['requests_per_second'])))
+            slower = after['p99_ms'] - before['p99_ms']
+            if slower > args.min_ms and slower > before['p99_ms'] * args.threshold:
+                regressions.append('{} {}: p99 {} -> {} ms'.format(scale, name, before['p99_ms'], after['p99_ms']))
+    for regression in regressions:
+        print('REGRESSION', regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,435 @@
+"""Concurrent load generator for every endpoint of the API.
+
+Each thread logs in as one of the users made by benchmarks.seed and runs a
+weighted mix of scenarios (browsing, searching, multi-gets and batches,
+sync, writes, bulk import and delete, export, auth) for --duration seconds after a --warmup. Latency is recorded
+per endpoint and the p50/p90/p99, throughput and status counts are written
+as JSON, so runs on two commits can be compared with benchmarks.compare.
+
+Without --url the app is called in process through the WSGI test client;
+with --url requests go over HTTP to a running server, e.g.
+
+    DATABASE_URL=sqlite:////tmp/yummy-bench.db python -m benchmarks.load --threads 8
+    RATE_LIMIT_BACKEND=none gunicorn -w 4 run:app &
+    python -m benchmarks.load --url http://localhost:8000 --threads 32 --output results.json
+
+Rate limits would throttle the load generator, so turn them off on the
+server (in process they are off unless RATE_LIMIT_BACKEND is set).
+"""
+import argparse
+import datetime
+import http.client
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+from urllib.parse import urlparse
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/yummy-bench.db')
+os.environ.setdefault('RATE_LIMIT_BACKEND', 'none')
+
+from benchmarks.seed import INGREDIENTS, PASSWORD
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+class WSGIClient(object):
+    """Calls the app in this process, the way a threaded worker would"""
+
+    def __init__(self, app, remote_addr):
+        self.client = app.test_client()
+        self.environ = {'REMOTE_ADDR': remote_addr}
+
+    def request(self, method, path, headers, body, content_type):
+        response = self.client.open(path, method=method, headers=headers, data=body,
+                                    content_type=content_type, environ_base=self.environ)
+        return response.status_code, response.get_data()
+
+
+class HTTPClient(object):
+    """One keep-alive connection to a running server"""
+
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.prefix = parsed.path.rstrip('/')
+        self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+
+    def request(self, method, path, headers, body, content_type):
+        headers = dict(headers)
+        if body is not None:
+            headers['Content-Type'] = content_type
+        try:
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            return response.status, response.read()
+        except (http.client.HTTPException, OSError):
+            # reconnect on the next request, the failure counts as status 0
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            return 0, b''
+
+
+class Recorder(object):
+    """Collects latencies and statuses per endpoint once the warmup is over"""
+
+    def __init__(self, record_after):
+        self.record_after = record_after
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.statuses = {}
+
+    def record(self, name, seconds, status):
+        if time.time() < self.record_after:
+            return
+        with self.lock:
+            self.latencies.setdefault(name, []).append(seconds)
+            counts = self.statuses.setdefault(name, {})
+            counts[str(status)] = counts.get(str(status), 0) + 1
+
+
+def percentile(ordered, fraction):
+    """Nearest rank percentile of a sorted list"""
+    return ordered[max(0, int(round(fraction * len(ordered))) - 1)]
+
+
+def summarize(latencies, statuses, seconds):
+    ordered = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if int(status) == 0 or int(status) >= 500)
+    return {'requests': len(ordered),
+            'errors': errors,
+            'requests_per_second': round(len(ordered) / seconds, 1),
+            'p50_ms': round(percentile(ordered, 0.50) * 1000, 2),
+            'p90_ms': round(percentile(ordered, 0.90) * 1000, 2),
+            'p99_ms': round(percentile(ordered, 0.99) * 1000, 2),
+            'max_ms': round(ordered[-1] * 1000, 2),
+            'statuses': statuses}
+
+
+class Session(object):
+    """One simulated client, logged in as a seeded user"""
+
+    counter = itertools.count()
+
+    def __init__(self, client, recorder, email, rng):
+        self.client = client
+        self.recorder = recorder
+        self.email = email
+        self.rng = rng
+        self.token = None
+        self.categories = []
+        self.recipes = {}
+        # GET /sync's token, a full sync first and changes since after that
+        self.sync_token = ''
+
+    def call(self, name, method, path, data=None, body=None, content_type='application/json',
+             auth=True, token=None, retrying=False):
+        """Makes a request and records it, unless it was shed and will be retried"""
+        token = token or self.token
+        headers = {'Authorization': 'Bearer ' + token} if auth and token else {}
+        if data is not None:
+            body = json.dumps(data)
+        started = time.perf_counter()
+        status, payload = self.client.request(method, path, headers, body, content_type)
+        if not (retrying and status == 503):
+            self.recorder.record(name, time.perf_counter() - started, status)
+        return status, payload
+
+    def login(self):
+        deadline = time.time() + 60
+        while True:
+            # many clients starting at once can be shed by the password_hash slots
+            retrying = time.time() < deadline
+            status, payload = self.call('POST /auth/login', 'POST', '/api-v1/auth/login',
+                                        {'email': self.email, 'password': PASSWORD}, auth=False,
+                                        retrying=retrying)
+            if status != 503 or not retrying:
+                break
+            time.sleep(self.rng.uniform(0.5, 2))
+        if status != 200:
+            raise RuntimeError('Login as {} failed with {}, seed the database first'.format(
+                self.email, status))
+        self.token = json.loads(payload.decode())['access_token']
+        status, payload = self.call('GET /categories/?cursor', 'GET', '/api-v1/categories/?cursor=&per_page=100')
+        self.categories = [c['category_id'] for c in json.loads(payload.decode())['results']]
+
+    def unique(self, prefix):
+        return '{} {} {}'.format(prefix, os.getpid(), next(self.counter))
+
+    def category(self):
+        return self.rng.choice(self.categories)
+
+    def recipe(self):
+        """A (category_id, recipe_id) pair, listing a category the first time"""
+        category_id = self.category()
+        if category_id not in self.recipes:
+            list_recipes(self, category_id)
+        if not self.recipes[category_id]:
+            return category_id, 0
+        return category_id, self.rng.choice(self.recipes[category_id])
+
+
+def list_categories(s):
+    s.call('GET /categories/', 'GET', '/api-v1/categories/?page={}'.format(s.rng.randint(1, 2)))
+
+
+def cursor_categories(s):
+    s.call('GET /categories/?cursor', 'GET', '/api-v1/categories/?cursor=&per_page=20')
+
+
+def search_categories(s):
+    s.call('GET /categories/?q', 'GET', '/api-v1/categories/?q=Category+{}'.format(s.rng.randint(0, 9)))
+
+
+def view_category(s):
+    s.call('GET /categories/<id>', 'GET', '/api-v1/categories/{}'.format(s.category()))
+
+
+def username(s):
+    s.call('GET /username', 'GET', '/api-v1/username')
+
+
+def list_recipes(s, category_id=None):
+    category_id = category_id or s.category()
+    status, payload = s.call('GET /categories/<id>/recipes/', 'GET',
+                             '/api-v1/categories/{}/recipes/?per_page=20'.format(category_id))
+    results = json.loads(payload.decode()).get('results', []) if status == 200 else []
+    s.recipes[category_id] = [r['recipe_id'] for r in results]
+
+
+def cursor_recipes(s):
+    s.call('GET /categories/<id>/recipes/?cursor', 'GET',
+           '/api-v1/categories/{}/recipes/?cursor=&per_page=20&fields=recipe_name,ingredients'.format(
+               s.category()))
+
+
+def search_recipes(s):
+    s.call('GET /categories/<id>/recipes/?q', 'GET', '/api-v1/categories/{}/recipes/?q={}'.format(
+        s.category(), s.rng.choice(INGREDIENTS).replace(' ', '+')))
+
+
+def view_recipe(s):
+    s.call('GET /categories/<id>/recipes/<id>', 'GET', '/api-v1/categories/{}/recipes/{}'.format(*s.recipe()))
+
+
+def recipes_by_id(s):
+    category_id, recipe_id = s.recipe()
+    ids = ','.join(str(i) for i in s.recipes[category_id][:10]) or str(recipe_id)
+    s.call('GET /recipes?ids', 'GET', '/api-v1/recipes?ids=' + ids)
+
+
+def batch(s):
+    category_id, recipe_id = s.recipe()
+    paths = ['/api-v1/categories/{}'.format(category_id),
+             '/api-v1/categories/{}/recipes/{}'.format(category_id, recipe_id),
+             '/api-v1/categories/{}/recipes/?per_page=20'.format(category_id),
+             '/api-v1/stats']
+    s.call('POST /batch', 'POST', '/api-v1/batch', {'requests': [{'path': path} for path in paths]})
+
+
+def stats(s):
+    s.call('GET /stats', 'GET', '/api-v1/stats')
+
+
+def sync(s):
+    status, payload = s.call('GET /sync', 'GET', '/api-v1/sync?since=' + s.sync_token)
+    if status == 200:
+        s.sync_token = json.loads(payload.decode())['next']
+    elif status == 410:
+        s.sync_token = ''
+
+
+def cook(s):
+    pantry = ','.join(s.rng.sample(INGREDIENTS, 5)).replace(' ', '+')
+    s.call('GET /recipes/cook', 'GET', '/api-v1/recipes/cook?pantry=' + pantry)
+
+
+def health(s):
+    s.call('GET /health', 'GET', '/api-v1/health', auth=False)
+
+
+def metrics(s):
+    s.call('GET /metrics', 'GET', '/metrics', auth=False)
+
+
+def export(s):
+    s.call('GET /export', 'GET', '/api-v1/export?format=ndjson')
+
+
+def category_writes(s):
+    status, payload = s.call('POST /categories/', 'POST', '/api-v1/categories/',
+                             {'category_name': s.unique('Bench Category')})
+    if status != 201:
+        return
+    category_id = json.loads(payload.decode())['category_id']
+    url = '/api-v1/categories/{}'.format(category_id)
+    s.call('PUT /categories/<id>', 'PUT', url, {'category_name': s.unique('Renamed Category')})
+    s.call('DELETE /categories/<id>', 'DELETE', url)
+
+
+def recipe_writes(s):
+    url = '/api-v1/categories/{}/recipes/'.format(s.category())
+    status, payload = s.call('POST /categories/<id>/recipes/', 'POST', url, {
+        'recipe_name': s.unique('Bench Recipe'), 'ingredients': ', '.join(s.rng.sample(INGREDIENTS, 5)),
+        'directions': 'Mix everything and bake for 20 minutes.'})
+    if status != 201:
+        return
+    url += str(json.loads(payload.decode())['recipe_id'])
+    s.call('PUT /categories/<id>/recipes/<id>', 'PUT', url, {
+        'recipe_name': s.unique('Renamed Recipe'), 'ingredients': ', '.join(s.rng.sample(INGREDIENTS, 4)),
+        'directions': 'Mix everything and fry for 5 minutes.'})
+    s.call('DELETE /categories/<id>/recipes/<id>', 'DELETE', url)
+
+
+def bulk_delete(s):
+    category_ids = []
+    for _ in range(3):
+        status, payload = s.call('POST /categories/', 'POST', '/api-v1/categories/',
+                                 {'category_name': s.unique('Bench Category')})
+        if status == 201:
+            category_ids.append(json.loads(payload.decode())['category_id'])
+    if not category_ids:
+        return
+    url = '/api-v1/categories/{}/recipes/'.format(category_ids[0])
+    recipe_ids = []
+    for _ in range(3):
+        status, payload = s.call('POST /categories/<id>/recipes/', 'POST', url, {
+            'recipe_name': s.unique('Bench Recipe'), 'ingredients': ', '.join(s.rng.sample(INGREDIENTS, 5))})
+        if status == 201:
+            recipe_ids.append(json.loads(payload.decode())['recipe_id'])
+    if recipe_ids:
+        s.call('DELETE /recipes?ids', 'DELETE', '/api-v1/recipes?ids=' + ','.join(map(str, recipe_ids)))
+    s.call('DELETE /categories/?ids', 'DELETE', '/api-v1/categories/?ids=' + ','.join(map(str, category_ids)))
+
+
+def bulk_import(s):
+    body = '\n'.join(json.dumps({'recipe_name': s.unique('Bulk Recipe'),
+                                 'ingredients': ', '.join(s.rng.sample(INGREDIENTS, 5))})
+                     for _ in range(20))
+    s.call('POST /categories/<id>/recipes/bulk', 'POST',
+           '/api-v1/categories/{}/recipes/bulk'.format(s.category()),
+           body=body, content_type='application/x-ndjson')
+
+
+def auth(s):
+    email = s.unique('new').replace(' ', '.') + '@yummy.com'
+    user = {'email': email, 'username': 'new', 'password': PASSWORD, 'confirm_password': PASSWORD}
+    s.call('POST /auth/register', 'POST', '/api-v1/auth/register', user, auth=False)
+    status, payload = s.call('POST /auth/login', 'POST', '/api-v1/auth/login', user, auth=False)
+    if status != 200:
+        return
+    token = json.loads(payload.decode())['access_token']
+    s.call('POST /auth/send_email', 'POST', '/api-v1/auth/send_email', {'email': email}, auth=False)
+    s.call('POST /auth/logout', 'POST', '/api-v1/auth/logout', token=token)
+
+
+# (scenario, weight), reads dominate like they do in real traffic
+SCENARIOS = [
+    (list_categories, 10), (cursor_categories, 5), (search_categories, 3), (view_category, 10),
+    (username, 2), (list_recipes, 10), (cursor_recipes, 5), (search_recipes, 5), (view_recipe, 10),
+    (recipes_by_id, 3), (batch, 3), (stats, 2), (sync, 3),
+    (cook, 3), (health, 1), (metrics, 1), (export, 1),
+    (category_writes, 2), (recipe_writes, 3), (bulk_delete, 1), (bulk_import, 1), (auth, 1),
+]
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL)
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                        stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit.decode().strip(), bool(dirty.strip())
+
+
+def run(make_client, threads, users, duration, warmup, random_seed=2018, scenarios=SCENARIOS):
+    """Runs the scenario mix on `threads` threads, returns the summary"""
+    scenarios = [scenario for scenario, weight in scenarios for _ in range(weight)]
+    started = time.time()
+    recorder = Recorder(started + warmup)
+    deadline = started + warmup + duration
+    failures = []
+
+    def worker(number):
+        rng = random.Random(random_seed + number)
+        session = Session(make_client(number), recorder, 'bench{}@yummy.com'.format(number % users), rng)
+        try:
+            session.login()
+            while time.time() < deadline:
+                rng.choice(scenarios)(session)
+        except Exception as e:
+            failures.append(repr(e))
+
+    workers = [threading.Thread(target=worker, args=(number,)) for number in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    if failures:
+        raise RuntimeError(failures[0])
+
+    endpoints = dict((name, summarize(recorder.latencies[name], recorder.statuses[name], duration))
+                     for name in sorted(recorder.latencies))
+    statuses = {}
+    for counts in recorder.statuses.values():
+        for status, count in counts.items():
+            statuses[status] = statuses.get(status, 0) + count
+    latencies = [seconds for values in recorder.latencies.values() for seconds in values]
+    return {'threads': threads, 'duration': duration, 'warmup': warmup,
+            'total': summarize(latencies, statuses, duration), 'endpoints': endpoints}
+
+
+def metadata(target):
+    commit, dirty = git_commit()
+    return {'commit': commit, 'dirty': dirty, 'target': target,
+            'started_at': datetime.datetime.utcnow().isoformat() + 'Z',
+            'python': platform.python_version(), 'machine': platform.machine()}
+
+
+def write(results, output):
+    """Writes results to `output`, or to benchmarks/results/ named after the commit"""
+    if output is None:
+        if not os.path.isdir(RESULTS_DIR):
+            os.makedirs(RESULTS_DIR)
+        output = os.path.join(RESULTS_DIR, '{}-{}.json'.format(
+            (results.get('commit') or 'unknown')[:10], int(time.time())))
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='a running server, instead of calling the app in process')
+    parser.add_argument('--config', default='development')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--users', type=int, default=10, help='seeded users to log in as')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to record')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds to run before recording')
+    parser.add_argument('--output', help='JSON results file, by default under benchmarks/results/')
+    args = parser.parse_args()
+
+    if args.url:
+        results = metadata(args.url)
+        make_client = lambda number: HTTPClient(args.url)
+    else:
+        from app import create_app, db
+        from benchmarks.seed import dataset
+        app = create_app(args.config)
+        results = metadata('in-process')
+        with app.app_context():
+            results['database'] = db.engine.dialect.name
+            results['dataset'] = dataset()
+        make_client = lambda number: WSGIClient(app, '10.0.{}.{}'.format(number // 250, number % 250 + 1))
+    results.update(run(make_client, args.threads, args.users, args.duration, args.warmup))
+    print(json.dumps(dict(results, endpoints=len(results['endpoints'])), indent=2))
+    print('Results written to', write(results, args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Load test for the database connection pool.
+
+Runs many concurrent requests against /api-v1/health inside one process, the
+way threads of a gunicorn worker would, and prints the pool counters
+afterwards. Point DATABASE_URL at a local Postgres to exercise QueuePool, e.g.
+
+    DATABASE_URL=postgresql://localhost/recipe_db DB_POOL_SIZE=5 \\
+        python -m benchmarks.pool_load --threads 30 --requests 200
+
+With more threads than DB_POOL_SIZE + DB_MAX_OVERFLOW, requests wait for a
+connection and fail once SQLALCHEMY_POOL_TIMEOUT passes. Restarting Postgres
+mid-run shows pre-ping replacing the stale connections ('stale' counter).
+"""
+import argparse
+import json
+import threading
+import time
+
+from app import create_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', default='development')
+    parser.add_argument('--threads', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=100, help='requests per thread')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+    statuses = []
+    lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        for _ in range(args.requests):
+            status = client.get('/api-v1/health').status_code
+            with lock:
+                statuses.append(status)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+
+    pool = json.loads(app.test_client().get('/api-v1/health').data.decode())['pool']
+    print(json.dumps({
+        'requests': len(statuses),
+        'errors': sum(1 for status in statuses if status != 200),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(statuses) / elapsed, 1),
+        'pool': pool,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Seeds a database with synthetic users, categories and recipes for load tests.
+
+The data is generated from a fixed random seed, so every run at a scale
+produces the same rows. Scales are recipe counts: 1k, 100k and 1M, or any
+number. Users are bench<N>@yummy.com with the password 'benchmark', and
+every user gets the same number of categories and recipes, e.g.
+
+    DATABASE_URL=sqlite:////tmp/yummy-bench.db python -m benchmarks.seed --scale 100k
+    DATABASE_URL=postgresql://localhost/bench_db python -m benchmarks.seed --scale 1M
+
+The tables are dropped and recreated first, so don't point it at real data.
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/yummy-bench.db')
+
+from app import create_app, db, hashing
+from app.models.recipeAuth import RecipeApp
+from app.models.category import Category
+from app.models.recipe import Recipe
+from app.models.ingredient import RecipeIngredient
+from app.models.stats import UserStats
+
+SCALES = {'1k': 1000, '100k': 100000, '1M': 1000000}
+PASSWORD = 'benchmark'
+CATEGORIES_PER_USER = 10
+BATCH_SIZE = 10000
+
+INGREDIENTS = [
+    'eggs', 'flour', 'milk', 'butter', 'sugar', 'salt', 'pepper', 'olive oil', 'garlic', 'onions',
+    'tomatoes', 'carrots', 'potatoes', 'rice', 'beans', 'lentils', 'chicken', 'beef', 'pork', 'fish',
+    'lemon', 'lime', 'ginger', 'chilli', 'cumin', 'coriander', 'parsley', 'basil', 'thyme', 'rosemary',
+    'cream', 'cheese', 'yoghurt', 'honey', 'vinegar', 'soy sauce', 'mushrooms', 'spinach', 'peas', 'corn',
+]
+WORDS = ['stir', 'simmer', 'chop', 'season', 'bake', 'fry', 'whisk', 'fold', 'rest', 'serve',
+         'the', 'until', 'golden', 'gently', 'slowly', 'for', 'minutes', 'over', 'low', 'heat']
+
+
+def scale(value):
+    """Parses '100k' style scales as well as plain numbers"""
+    if value in SCALES:
+        return SCALES[value]
+    return int(value)
+
+
+def layout(recipes):
+    """Returns (users, recipes per category) for a total number of recipes"""
+    users = max(10, recipes // 1000)
+    return users, max(1, recipes // (users * CATEGORIES_PER_USER))
+
+
+def batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def recipe_rows(rng, categories, per_category):
+    for category_id, user_id in categories:
+        for number in range(per_category):
+            ingredients = rng.sample(INGREDIENTS, rng.randint(3, 8))
+            directions = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 400)))
+            yield {'recipe_name': 'Recipe {} {}'.format(category_id, number),
+                   'ingredients': ', '.join(ingredients), 'directions': directions.capitalize() + '.',
+                   'user_id': user_id, 'category_id': category_id}
+
+
+def seed(recipes, random_seed=2018):
+    """Recreates the tables and fills them, returns the row counts"""
+    rng = random.Random(random_seed)
+    users, per_category = layout(recipes)
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+
+    # one hash for every user, bcrypt would dominate seeding otherwise
+    password = hashing.hash_password(PASSWORD)
+    for batch in batches({'email': 'bench{}@yummy.com'.format(n), 'username': 'bench{}'.format(n),
+                          'password': password} for n in range(users)):
+        db.session.execute(RecipeApp.__table__.insert(), batch)
+    user_ids = [user_id for user_id, in db.session.query(RecipeApp.user_id).order_by(RecipeApp.user_id)]
+    for batch in batches({'category_name': 'Category {}'.format(n), 'user_id': user_id}
+                         for user_id in user_ids for n in range(CATEGORIES_PER_USER)):
+        db.session.execute(Category.__table__.insert(), batch)
+    categories = db.session.query(Category.category_id, Category.user_id).order_by(
+        Category.category_id).all()
+    db.session.commit()
+
+    for batch in batches(recipe_rows(rng, categories, per_category)):
+        db.session.execute(Recipe.__table__.insert(), batch)
+        db.session.commit()
+    RecipeIngredient.reindex(BATCH_SIZE)
+    # the rows went in around the models, so count them in one go
+    UserStats.reconcile()
+    return dataset()
+
+
+def dataset():
+    """Counts the rows the load is run against"""
+    return {'users': db.session.query(RecipeApp).count(),
+            'categories': db.session.query(Category).count(),
+            'recipes': db.session.query(Recipe).count()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', default='development')
+    parser.add_argument('--scale', type=scale, default='1k', help='1k, 100k, 1M or a number of recipes')
+    parser.add_argument('--seed', type=int, default=2018, help='random seed')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+    with app.app_context():
+        started = time.time()
+        counts = seed(args.scale, args.seed)
+    counts['seconds'] = round(time.time() - started, 1)
+    print(json.dumps(counts, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Compares the sync (gunicorn) and async (uvicorn) deployments at rising concurrency.
+
+Starts each server in turn with --workers processes against the same
+database, runs the load generator's category and recipe scenarios over
+HTTP at every --concurrency level, and prints the throughput and latency
+of both side by side. Seed the database first (or pass --scale), and use
+Postgres, where waiting on the database is what the async mode saves:
+
+    DATABASE_URL=postgresql://localhost/bench_db python -m benchmarks.serving --scale 100k \\
+        --workers 4 --concurrency 16,64,256
+
+It needs requirements-async.txt. The sync server runs on --sync-python,
+so it can be given an environment with the regular requirements.txt.
+The load generator is threaded Python too; above a few hundred clients,
+check that it isn't the bottleneck by running benchmarks.load --url from
+another machine.
+"""
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/yummy-bench.db')
+os.environ.setdefault('RATE_LIMIT_BACKEND', 'none')
+
+from benchmarks import load, seed
+
+# the scenarios served by the async routes, auth aside
+ASYNC_SCENARIOS = (load.list_categories, load.cursor_categories, load.search_categories,
+                   load.view_category, load.username, load.list_recipes, load.cursor_recipes,
+                   load.search_recipes, load.view_recipe, load.cook, load.category_writes,
+                   load.recipe_writes)
+SCENARIOS = [(scenario, weight) for scenario, weight in load.SCENARIOS if scenario in ASYNC_SCENARIOS]
+
+
+def command(mode, python, workers, port):
+    if mode == 'sync':
+        # the Procfile's deployment, threaded workers
+        return [python, '-m', 'gunicorn', '--workers', str(workers), '--worker-class', 'gthread',
+                '--threads', os.getenv('GUNICORN_THREADS', '8'), '--bind', '127.0.0.1:{}'.format(port),
+                '--log-level', 'warning', 'run:app']
+    return [python, '-m', 'uvicorn', 'asgi:app', '--workers', str(workers), '--host', '127.0.0.1',
+            '--port', str(port), '--log-level', 'warning', '--no-access-log']
+
+
+def wait_until_ready(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/api-v1/health')
+            if connection.getresponse().status == 200:
+                return
+        except (http.client.HTTPException, OSError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError('The server on port {} did not start'.format(port))
+
+
+def serve(mode, args, port):
+    env = dict(os.environ, FLASK_CONFIG=args.config)
+    python = args.sync_python if mode == 'sync' else sys.executable
+    server = subprocess.Popen(command(mode, python, args.workers, port), env=env,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    try:
+        wait_until_ready(port)
+    except RuntimeError:
+        server.terminate()
+        raise
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', default='development')
+    parser.add_argument('--scale', type=seed.scale, help='seed this many recipes first, e.g. 100k')
+    parser.add_argument('--workers', type=int, default=4, help='server processes of either mode')
+    parser.add_argument('--concurrency', default='16,64,256', help='comma separated client counts')
+    parser.add_argument('--users', type=int, default=10, help='seeded users to log in as')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to record per level')
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--sync-python', default=sys.executable, help='interpreter for the sync server')
+    parser.add_argument('--output', help='JSON results file, by default under benchmarks/results/')
+    args = parser.parse_args()
+
+    results = load.metadata('serving')
+    if args.scale:
+        from app import create_app, db
+        app = create_app(args.config)
+        with app.app_context():
+            results['dataset'] = seed.seed(args.scale)
+            db.session.remove()
+        args.users, _ = seed.layout(args.scale)
+    results.update(workers=args.workers, modes={})
+    levels = [int(level) for level in args.concurrency.split(',')]
+    for offset, mode in enumerate(('sync', 'async')):
+        port = args.port + offset
+        url = 'http://127.0.0.1:{}'.format(port)
+        server = serve(mode, args, port)
+        try:
+            results['modes'][mode] = dict(
+                (str(clients), load.run(lambda number: load.HTTPClient(url), clients, args.users,
+                                        args.duration, args.warmup, scenarios=SCENARIOS))
+                for clients in levels)
+        finally:
+            server.terminate()
+            server.wait()
+
+    row = '{:>8} {:>6} {:>10} {:>9} {:>9} {:>7}'
+    print(row.format('clients', 'mode', 'req/s', 'p50 ms', 'p99 ms', 'errors'))
+    for clients in levels:
+        for mode in ('sync', 'async'):
+            total = results['modes'][mode][str(clients)]['total']
+            print(row.format(clients, mode, total['requests_per_second'], total['p50_ms'],
+                             total['p99_ms'], total['errors']))
+    print('Results written to', load.write(results, args.output))
+
+
+if __name__ == '__main__':
+    main()
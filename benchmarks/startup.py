@@ -0,0 +1,58 @@
+"""Measures the cold start cost of create_app.
+
+create_app used to run db.create_all() on every start, which inspects every
+table on each gunicorn worker boot and test run. The schema now comes from
+migrations, so this compares a plain create_app with create_app followed by
+the create_all it used to do, against an existing schema, e.g.
+
+    DATABASE_URL=postgresql://localhost/recipe_db python -m benchmarks.startup
+"""
+import argparse
+import json
+import time
+
+from app import create_app, db
+
+
+def timed(func, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {'median_ms': round(timings[len(timings) // 2] * 1000, 2),
+            'max_ms': round(timings[-1] * 1000, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', default='development')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+    with app.app_context():
+        # make sure the schema exists, as it would after 'manage.py db upgrade'
+        db.create_all()
+        db.engine.dispose()
+
+    def start_without_ddl():
+        app = create_app(args.config)
+        with app.app_context():
+            db.engine.dispose()
+
+    def start_with_create_all():
+        app = create_app(args.config)
+        with app.app_context():
+            db.create_all()
+            db.engine.dispose()
+
+    print(json.dumps({
+        'create_app': timed(start_without_ddl, args.runs),
+        'create_app + create_all': timed(start_with_create_all, args.runs),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Seeds each scale in turn and runs the load generator against it.
+
+Writes one JSON file with the results of every scale, named after the
+current commit, for benchmarks.compare, e.g.
+
+    python -m benchmarks.suite --scales 1k,100k --duration 30
+    DATABASE_URL=postgresql://localhost/bench_db python -m benchmarks.suite --scales 1k,100k,1M
+
+The database at DATABASE_URL is dropped and reseeded for every scale.
+"""
+import argparse
+import json
+import os
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/yummy-bench.db')
+os.environ.setdefault('RATE_LIMIT_BACKEND', 'none')
+
+from app import create_app, db
+from benchmarks import load, seed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', default='development')
+    parser.add_argument('--scales', default='1k,100k', help='comma separated, e.g. 1k,100k,1M')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30, help='seconds to record per scale')
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--output', help='JSON results file, by default under benchmarks/results/')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+    results = load.metadata('in-process')
+    results['scales'] = {}
+    for name in args.scales.split(','):
+        with app.app_context():
+            results['database'] = db.engine.dialect.name
+            dataset = seed.seed(seed.scale(name))
+            db.session.remove()
+        users, _ = seed.layout(seed.scale(name))
+        make_client = lambda number: load.WSGIClient(app, '10.0.{}.{}'.format(number // 250, number % 250 + 1))
+        run = load.run(make_client, args.threads, users, args.duration, args.warmup)
+        run['dataset'] = dataset
+        results['scales'][name] = run
+        print(name, json.dumps(dict((key, run['total'][key]) for key in (
+            'requests_per_second', 'p50_ms', 'p99_ms', 'errors'))))
+    print('Results written to', load.write(results, args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,18 +3,120 @@ import os
 class Config(object):
     """Parent configuration class."""
     DEBUG = False
-    SECRET = "abcdef"
+    SECRET = os.getenv('SECRET', 'abcdef')
+    # keys signing the access, refresh and password reset tokens, as
+    # comma separated kid:secret pairs. The first signs new tokens and all
+    # of them verify, so to rotate put a new key first and drop the old one
+    # once REFRESH_TOKEN_DAYS have passed
+    JWT_KEYS = os.getenv('JWT_KEYS', 'default:' + SECRET)
+    ACCESS_TOKEN_MINUTES = 15
+    REFRESH_TOKEN_DAYS = 30
+    RESET_TOKEN_MINUTES = 30
+    # database connection pool, per worker process
+    SQLALCHEMY_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    SQLALCHEMY_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    # seconds to wait for a free connection before failing the request
+    SQLALCHEMY_POOL_TIMEOUT = 10
+    # replace connections older than this, below any server or proxy idle timeout
+    SQLALCHEMY_POOL_RECYCLE = 1800
+    # test connections on checkout so a database failover doesn't fail requests
+    SQLALCHEMY_POOL_PRE_PING = True
+    # set when connecting through PgBouncer in transaction pooling mode
+    SQLALCHEMY_PGBOUNCER = os.getenv('DB_PGBOUNCER', '') == 'true'
+    # bcrypt work factor, existing hashes are upgraded on the next login
+    BCRYPT_LOG_ROUNDS = 12
+    # threads per worker that may hash passwords at the same time
+    PASSWORD_HASH_WORKERS = 4
+    PASSWORD_HASH_TIMEOUT = 30
+    # seconds between refreshes of the in-process revoked token cache from
+    # the expired_tokens table, i.e. how long a logout on one worker can take
+    # to be seen by the others
+    REVOCATION_SYNC_INTERVAL = 5
+    # how far back each refresh re-reads, for logouts whose transaction was
+    # still open during the previous one
+    REVOCATION_SYNC_OVERLAP_SECONDS = 30
+    # cache for GET responses: 'memory', 'redis' or 'none'. 'memory' is an
+    # LRU per worker and a write only invalidates the worker that handled
+    # it, so with several workers the others serve stale bodies and 304s
+    # for up to RESPONSE_CACHE_TTL seconds; use 'redis' for those
+    RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'none')
+    RESPONSE_CACHE_REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    RESPONSE_CACHE_SIZE = 1024
+    RESPONSE_CACHE_TTL = 300
+    # token bucket rate limits, (requests, per seconds): 'api' is per user
+    # and route, send_email_to per recipient and the others per client IP
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+    RATE_LIMIT_REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    RATE_LIMITS = {
+        'login': (10, 60),
+        'refresh': (30, 60),
+        'register': (5, 60),
+        'reset_password': (5, 300),
+        'send_email': (5, 3600),
+        'send_email_to': (3, 3600),
+        'api': (300, 60),
+    }
+    # proxies in front of the app that append to X-Forwarded-For (1 on Heroku)
+    RATE_LIMIT_PROXIES = int(os.getenv('RATE_LIMIT_PROXIES', 0))
+    # load shedding, requests over these caps get a 503 right away: in total
+    # per worker (0 for no cap) and per group of expensive endpoints
+    MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', 0))
+    CONCURRENCY_LIMITS = {
+        'password_hash': 8,
+        'bulk_import': 2,
+    }
+    # per route request metrics at /metrics, which requires METRICS_TOKEN as
+    # a bearer token when it's set; METRICS_SERVER_TIMING adds a
+    # Server-Timing header with the same breakdown to every response
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    METRICS_SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING', '') == 'true'
+    # rows inserted per transaction by the bulk recipe import
+    BULK_IMPORT_CHUNK_SIZE = 500
+    # largest per_page a listing accepts
+    MAX_PER_PAGE = 100
+    # ids per multi-get (?ids=) and sub-requests per POST /batch
+    BATCH_MAX_IDS = 100
+    BATCH_MAX_REQUESTS = 50
+    # GET /sync: rows of each kind per response, how long tombstones of
+    # deleted rows are kept ('python manage.py prune_change_log') and so how
+    # old a sync token may be, and how far back each round re-reads for
+    # transactions still open when the previous one started
+    SYNC_PAGE_SIZE = 500
+    SYNC_TOMBSTONE_DAYS = 30
+    SYNC_OVERLAP_SECONDS = 30
+    # rows fetched per round-trip while streaming an export
+    EXPORT_BATCH_SIZE = 1000
+    # outgoing mail, queued in the outbox table and sent by
+    # 'python manage.py outbox_worker'
+    MAIL_SERVER = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
+    MAIL_PORT = int(os.getenv('MAIL_PORT', 465))
+    MAIL_USE_SSL = True
+    MAIL_USE_TLS = False
+    MAIL_USERNAME = os.getenv('MAIL_USERNAME')
+    MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER', MAIL_USERNAME or 'admin@yummyrecipes.com')
+    OUTBOX_BATCH_SIZE = 50
+    OUTBOX_MAX_ATTEMPTS = 5
+    # seconds before the first retry, doubled after every failed attempt
+    OUTBOX_RETRY_DELAY = 30
+    OUTBOX_POLL_INTERVAL = 5
 
 class DevelopmentConfig(Config):
     """Configurations for Development."""
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'postgresql://localhost/recipe_db')
+    # the development server is a single process
+    RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')
 
 class TestingConfig(Config):
     """Configurations for Testing, with a separate test database."""
     TESTING = True
     SQLALCHEMY_DATABASE_URI =  os.getenv('DATABASE_URL', 'postgresql://localhost/tests_db')
     DEBUG = True
+    # keep the periodic revocation sync out of the query budget tests
+    REVOCATION_SYNC_INTERVAL = 60
+    BCRYPT_LOG_ROUNDS = 4
+    RESPONSE_CACHE_BACKEND = 'memory'
 
 class StagingConfig(Config):
     """Configurations for Staging."""
@@ -24,6 +126,9 @@ class ProductionConfig(Config):
     """Configurations for Production."""
     DEBUG = False
     TESTING = False
+    # no development fallback, the app won't start without a real key
+    SECRET = os.getenv('SECRET')
+    JWT_KEYS = os.getenv('JWT_KEYS') or ('default:' + SECRET if SECRET else None)
 
 app_config = {
     'development': DevelopmentConfig,
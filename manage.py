@@ -1,10 +1,13 @@
 import os
 from flask_script import Manager # class for handling a set of commands
 from flask_migrate import Migrate, MigrateCommand
-from app import db, create_app
-from app.models.recipeAuth import RecipeApp
+from app import db, create_app, outbox
+from app.models.recipeAuth import RecipeApp, ExpiredToken
 from app.models.category import Category
 from app.models.recipe import Recipe
+from app.models.ingredient import RecipeIngredient
+from app.models.changelog import ChangeLog
+from app.models.stats import UserStats
 
 app = create_app(config_name=os.getenv('FLASK_CONFIG'))
 migrate = Migrate(app, db)
@@ -12,5 +15,36 @@ manager = Manager(app)
 
 manager.add_command('db', MigrateCommand)
 
+
+@manager.command
+def prune_tokens():
+    """Deletes revoked tokens that have already expired"""
+    print('Pruned {} expired tokens'.format(ExpiredToken.prune()))
+
+
+@manager.command
+def prune_change_log():
+    """Deletes tombstones older than any sync token that is still accepted"""
+    print('Pruned {} tombstones'.format(ChangeLog.prune(app.config['SYNC_TOMBSTONE_DAYS'])))
+
+
+@manager.command
+def outbox_worker():
+    """Sends queued emails until interrupted"""
+    outbox.run_worker(app)
+
+
+@manager.command
+def reindex_ingredients():
+    """Rebuilds every recipe's ingredient links from its ingredients text"""
+    total = RecipeIngredient.reindex(app.config['BULK_IMPORT_CHUNK_SIZE'])
+    print('Reindexed ingredients of {} recipes'.format(total))
+
+
+@manager.command
+def reconcile_stats():
+    """Rebuilds the category and recipe counters from the tables"""
+    print('Reconciled the counts of {} users'.format(UserStats.reconcile()))
+
 if __name__ == '__main__':
     manager.run()
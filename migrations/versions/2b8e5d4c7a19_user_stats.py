@@ -0,0 +1,39 @@
+"""per user and per category counters
+
+Revision ID: 2b8e5d4c7a19
+Revises: 9d3a6f1b2c57
+Create Date: 2026-10-19 14:52:17.904316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b8e5d4c7a19'
+down_revision = '9d3a6f1b2c57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('category_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('recipe_count', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['auth.user_id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.add_column('category', sa.Column('recipe_count', sa.Integer(), server_default='0', nullable=False))
+    # the counts of existing rows, what `python manage.py reconcile_stats` rebuilds
+    op.execute('INSERT INTO user_stats (user_id, category_count, recipe_count) '
+               'SELECT user_id, '
+               '(SELECT count(*) FROM category WHERE category.user_id = auth.user_id), '
+               '(SELECT count(*) FROM recipe WHERE recipe.user_id = auth.user_id) FROM auth')
+    op.execute('UPDATE category SET recipe_count = '
+               '(SELECT count(*) FROM recipe WHERE recipe.category_id = category.category_id)')
+
+
+def downgrade():
+    op.drop_column('category', 'recipe_count')
+    op.drop_table('user_stats')
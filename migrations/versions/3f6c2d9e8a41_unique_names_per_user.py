@@ -0,0 +1,39 @@
+"""unique category and recipe names per user
+
+Revision ID: 3f6c2d9e8a41
+Revises: bcd1a7208f11
+Create Date: 2026-10-18 21:02:44.118240
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6c2d9e8a41'
+down_revision = 'bcd1a7208f11'
+branch_labels = None
+depends_on = None
+
+
+def rename_duplicates(table, pk, name):
+    """Appends the id to every duplicate name but the oldest, so the unique index can be built"""
+    op.execute(
+        "UPDATE {0} SET {2} = {2} || ' (' || {1} || ')' WHERE EXISTS ("
+        "SELECT 1 FROM {0} AS older WHERE older.user_id = {0}.user_id "
+        "AND older.{2} = {0}.{2} AND older.{1} < {0}.{1})".format(table, pk, name))
+
+
+def upgrade():
+    rename_duplicates('category', 'category_id', 'category_name')
+    rename_duplicates('recipe', 'recipe_id', 'recipe_name')
+    # the composite index leads with user_id, so it replaces the plain one
+    op.drop_index('ix_category_user_id', table_name='category')
+    op.create_index('ix_category_user_id_category_name', 'category', ['user_id', 'category_name'], unique=True)
+    op.create_index('ix_recipe_user_id_recipe_name', 'recipe', ['user_id', 'recipe_name'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_recipe_user_id_recipe_name', table_name='recipe')
+    op.drop_index('ix_category_user_id_category_name', table_name='category')
+    op.create_index('ix_category_user_id', 'category', ['user_id'], unique=False)
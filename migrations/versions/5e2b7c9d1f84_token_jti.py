@@ -0,0 +1,46 @@
+"""revoked tokens keyed by jti
+
+Revision ID: 5e2b7c9d1f84
+Revises: c41d8f2a6b73
+Create Date: 2026-10-18 23:41:12.218406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e2b7c9d1f84'
+down_revision = 'c41d8f2a6b73'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # tokens issued before this revision have no kid and no longer verify,
+    # so their revocations are dropped rather than converted
+    op.drop_index(op.f('ix_expired_tokens_expires_at'), table_name='expired_tokens')
+    op.drop_table('expired_tokens')
+    op.create_table('expired_tokens',
+    sa.Column('token_id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('jti', sa.String(length=32), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('expired_on', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('token_id'),
+    sa.UniqueConstraint('jti')
+    )
+    op.create_index(op.f('ix_expired_tokens_expires_at'), 'expired_tokens', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_expired_tokens_expires_at'), table_name='expired_tokens')
+    op.drop_table('expired_tokens')
+    op.create_table('expired_tokens',
+    sa.Column('token_id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('token_hash', sa.String(length=64), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('expired_on', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('token_id'),
+    sa.UniqueConstraint('token_hash')
+    )
+    op.create_index(op.f('ix_expired_tokens_expires_at'), 'expired_tokens', ['expires_at'], unique=False)
@@ -0,0 +1,25 @@
+"""per user token epoch
+
+Revision ID: 6c1f3a8d2e95
+Revises: 2b8e5d4c7a19
+Create Date: 2026-10-20 10:12:41.530274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c1f3a8d2e95'
+down_revision = '2b8e5d4c7a19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # tokens issued before carry no epoch, which counts as 0
+    op.add_column('auth', sa.Column('token_epoch', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('auth', 'token_epoch')
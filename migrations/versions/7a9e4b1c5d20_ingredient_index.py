@@ -0,0 +1,44 @@
+"""normalized ingredients per recipe
+
+Revision ID: 7a9e4b1c5d20
+Revises: 3f6c2d9e8a41
+Create Date: 2026-10-18 22:14:05.372810
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a9e4b1c5d20'
+down_revision = '3f6c2d9e8a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ingredient',
+    sa.Column('ingredient_id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.PrimaryKeyConstraint('ingredient_id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('recipe_ingredient',
+    sa.Column('recipe_id', sa.Integer(), nullable=False),
+    sa.Column('ingredient_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['ingredient_id'], ['ingredient.ingredient_id'], ),
+    sa.ForeignKeyConstraint(['recipe_id'], ['recipe.recipe_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('recipe_id', 'ingredient_id')
+    )
+    op.create_index('ix_recipe_ingredient_user_id_ingredient_id', 'recipe_ingredient',
+                    ['user_id', 'ingredient_id', 'recipe_id'], unique=False)
+    op.add_column('recipe', sa.Column('ingredient_count', sa.Integer(), server_default='0', nullable=False))
+    # existing recipes are linked by `python manage.py reindex_ingredients`
+
+
+def downgrade():
+    op.drop_column('recipe', 'ingredient_count')
+    op.drop_index('ix_recipe_ingredient_user_id_ingredient_id', table_name='recipe_ingredient')
+    op.drop_table('recipe_ingredient')
+    op.drop_table('ingredient')
@@ -0,0 +1,25 @@
+"""index expired_tokens by expired_on
+
+Revision ID: 8f4a2c6e1b37
+Revises: 6c1f3a8d2e95
+Create Date: 2026-10-21 09:37:15.204861
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f4a2c6e1b37'
+down_revision = '6c1f3a8d2e95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the revocation sync reads the tokens revoked since its last round
+    op.create_index(op.f('ix_expired_tokens_expired_on'), 'expired_tokens', ['expired_on'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_expired_tokens_expired_on'), table_name='expired_tokens')
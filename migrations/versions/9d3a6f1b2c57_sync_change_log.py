@@ -0,0 +1,38 @@
+"""change log of deleted rows and date_modified indexes for sync
+
+Revision ID: 9d3a6f1b2c57
+Revises: 5e2b7c9d1f84
+Create Date: 2026-10-19 10:06:41.583920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3a6f1b2c57'
+down_revision = '5e2b7c9d1f84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('change_log',
+    sa.Column('change_id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('entity', sa.String(length=16), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['auth.user_id'], ),
+    sa.PrimaryKeyConstraint('change_id')
+    )
+    op.create_index('ix_change_log_user_id_deleted_at', 'change_log', ['user_id', 'deleted_at'], unique=False)
+    op.create_index('ix_category_user_id_date_modified', 'category', ['user_id', 'date_modified'], unique=False)
+    op.create_index('ix_recipe_user_id_date_modified', 'recipe', ['user_id', 'date_modified'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_recipe_user_id_date_modified', table_name='recipe')
+    op.drop_index('ix_category_user_id_date_modified', table_name='category')
+    op.drop_index('ix_change_log_user_id_deleted_at', table_name='change_log')
+    op.drop_table('change_log')
@@ -0,0 +1,219 @@
+"""initial schema
+
+Revision ID: bcd1a7208f11
+Revises: 
+Create Date: 2026-10-18 20:26:19.558295
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import base64
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+
+# revision identifiers, used by Alembic.
+revision = 'bcd1a7208f11'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# the search indexes built by app/search.py, as they stood at this revision;
+# IF NOT EXISTS, as a database adopted from create_all() may have them already
+SEARCH_INDEXES = {
+    'category': ('category_id', ['category_name']),
+    'recipe': ('recipe_id', ['recipe_name', 'ingredients', 'directions']),
+}
+
+
+def create_search_indexes():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, (pk, columns) in SEARCH_INDEXES.items():
+            for column in columns:
+                op.execute('CREATE INDEX IF NOT EXISTS ix_{0}_{1}_trgm ON {0} USING gin ({1} gin_trgm_ops)'.format(
+                    table, column))
+    elif dialect == 'sqlite':
+        for table, (pk, columns) in SEARCH_INDEXES.items():
+            name, names = table + '_search', ', '.join(columns)
+            new = ', '.join('new.' + c for c in columns)
+            old = ', '.join('old.' + c for c in columns)
+            op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS {0} USING fts5({1}, content='{2}', content_rowid='{3}', "
+                       "tokenize='trigram')".format(name, names, table, pk))
+            op.execute("CREATE TRIGGER IF NOT EXISTS {0}_ai AFTER INSERT ON {1} BEGIN INSERT INTO {0}(rowid, {2}) "
+                       "VALUES (new.{3}, {4}); END".format(name, table, names, pk, new))
+            op.execute("CREATE TRIGGER IF NOT EXISTS {0}_ad AFTER DELETE ON {1} BEGIN INSERT INTO {0}({0}, rowid, {2}) "
+                       "VALUES ('delete', old.{3}, {4}); END".format(name, table, names, pk, old))
+            op.execute("CREATE TRIGGER IF NOT EXISTS {0}_au AFTER UPDATE ON {1} BEGIN "
+                       "INSERT INTO {0}({0}, rowid, {2}) VALUES ('delete', old.{3}, {4}); "
+                       "INSERT INTO {0}(rowid, {2}) VALUES (new.{3}, {5}); END".format(
+                           name, table, names, pk, old, new))
+            op.execute("INSERT INTO {0}({0}) VALUES ('rebuild')".format(name))
+
+
+def drop_search_indexes():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for table, (pk, columns) in SEARCH_INDEXES.items():
+            for column in columns:
+                op.execute('DROP INDEX ix_{}_{}_trgm'.format(table, column))
+    elif dialect == 'sqlite':
+        for table in SEARCH_INDEXES:
+            op.execute('DROP TABLE {}_search'.format(table))
+
+
+def adopt_existing_schema(inspector):
+    """Takes a database built by the old create_all() on boot to this revision.
+
+    Such a database has the baseline tables but no alembic_version row, so
+    creating them again would fail. The tables and indexes added since are
+    created, revoked tokens are converted to digests, and the email
+    uniqueness is checked before it's indexed.
+    """
+    bind = op.get_bind()
+    duplicates = [row[0] for row in bind.execute(sa.text(
+        'SELECT email FROM auth GROUP BY email HAVING count(*) > 1'))]
+    if duplicates:
+        raise RuntimeError('auth.email has duplicates, merge or remove these users before '
+                           'upgrading: {}'.format(', '.join(duplicates)))
+    tables = inspector.get_table_names()
+    indexes = dict((table, [index['name'] for index in inspector.get_indexes(table)])
+                   for table in tables)
+    if 'ix_auth_email' not in indexes['auth']:
+        op.create_index(op.f('ix_auth_email'), 'auth', ['email'], unique=True)
+    if bind.dialect.name == 'postgresql':
+        # the unique constraint create_all made, which the index replaces
+        for constraint in inspector.get_unique_constraints('auth'):
+            if constraint['column_names'] == ['email']:
+                op.drop_constraint(constraint['name'], 'auth', type_='unique')
+    if 'token' in [column['name'] for column in inspector.get_columns('expired_tokens')]:
+        convert_expired_tokens()
+    if 'outbox' not in tables:
+        create_outbox()
+    if 'ix_category_user_id' not in indexes['category']:
+        op.create_index(op.f('ix_category_user_id'), 'category', ['user_id'], unique=False)
+    if 'ix_recipe_user_id_category_id' not in indexes['recipe']:
+        op.create_index('ix_recipe_user_id_category_id', 'recipe', ['user_id', 'category_id'], unique=False)
+    create_search_indexes()
+
+
+# how long the tokens create_all() era code issued were valid
+OLD_TOKEN_LIFETIME = timedelta(minutes=1200)
+
+
+def token_expiry(token, expired_on):
+    """The exp claim of an old token, read without verifying it"""
+    try:
+        payload = token.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)).decode())
+        return datetime.utcfromtimestamp(claims['exp'])
+    except (IndexError, ValueError, KeyError, TypeError):
+        # unreadable, so keep it revoked for as long as it could have lasted
+        return expired_on + OLD_TOKEN_LIFETIME
+
+
+def convert_expired_tokens():
+    """Replaces the full revoked tokens with their sha256 digests and expiries"""
+    bind = op.get_bind()
+    old = sa.table('expired_tokens', sa.column('token', sa.String), sa.column('expired_on', sa.DateTime))
+    rows = bind.execute(sa.select([old.c.token, old.c.expired_on])).fetchall()
+    op.drop_table('expired_tokens')
+    table = create_expired_tokens()
+    op.bulk_insert(table, [
+        {'token_hash': hashlib.sha256(token.encode()).hexdigest(),
+         'expires_at': token_expiry(token, expired_on), 'expired_on': expired_on}
+        for token, expired_on in rows])
+
+
+def create_expired_tokens():
+    table = op.create_table('expired_tokens',
+    sa.Column('token_id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('token_hash', sa.String(length=64), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('expired_on', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('token_id'),
+    sa.UniqueConstraint('token_hash')
+    )
+    op.create_index(op.f('ix_expired_tokens_expires_at'), 'expired_tokens', ['expires_at'], unique=False)
+    return table
+
+
+def create_outbox():
+    op.create_table('outbox',
+    sa.Column('message_id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('recipient', sa.String(length=256), nullable=False),
+    sa.Column('subject', sa.String(length=255), nullable=False),
+    sa.Column('html', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('date_created', sa.DateTime(), nullable=True),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('message_id')
+    )
+    op.create_index('ix_outbox_status_next_attempt_at', 'outbox', ['status', 'next_attempt_at'], unique=False)
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'auth' in inspector.get_table_names():
+        adopt_existing_schema(inspector)
+        return
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('auth',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(length=256), nullable=False),
+    sa.Column('password', sa.String(length=256), nullable=False),
+    sa.Column('username', sa.String(length=256), nullable=False),
+    sa.Column('date_created', sa.DateTime(), nullable=True),
+    sa.Column('date_modified', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_index(op.f('ix_auth_email'), 'auth', ['email'], unique=True)
+    create_expired_tokens()
+    create_outbox()
+    op.create_table('category',
+    sa.Column('category_id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('category_name', sa.String(length=255), nullable=True),
+    sa.Column('date_created', sa.DateTime(), nullable=True),
+    sa.Column('date_modified', sa.DateTime(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['auth.user_id'], ),
+    sa.PrimaryKeyConstraint('category_id')
+    )
+    op.create_index(op.f('ix_category_user_id'), 'category', ['user_id'], unique=False)
+    op.create_table('recipe',
+    sa.Column('recipe_id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('recipe_name', sa.String(length=255), nullable=True),
+    sa.Column('ingredients', sa.String(length=255), nullable=True),
+    sa.Column('directions', sa.String(length=255), nullable=True),
+    sa.Column('date_created', sa.DateTime(), nullable=True),
+    sa.Column('date_modified', sa.DateTime(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('category_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['category_id'], ['category.category_id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['auth.user_id'], ),
+    sa.PrimaryKeyConstraint('recipe_id')
+    )
+    op.create_index('ix_recipe_user_id_category_id', 'recipe', ['user_id', 'category_id'], unique=False)
+    # ### end Alembic commands ###
+    create_search_indexes()
+
+
+def downgrade():
+    drop_search_indexes()
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_index('ix_recipe_user_id_category_id', table_name='recipe')
+    op.drop_table('recipe')
+    op.drop_index(op.f('ix_category_user_id'), table_name='category')
+    op.drop_table('category')
+    op.drop_index('ix_outbox_status_next_attempt_at', table_name='outbox')
+    op.drop_table('outbox')
+    op.drop_index(op.f('ix_expired_tokens_expires_at'), table_name='expired_tokens')
+    op.drop_table('expired_tokens')
+    op.drop_index(op.f('ix_auth_email'), table_name='auth')
+    op.drop_table('auth')
+    # ### end Alembic commands ###
@@ -0,0 +1,32 @@
+"""unbounded recipe ingredients and directions
+
+Revision ID: c41d8f2a6b73
+Revises: 7a9e4b1c5d20
+Create Date: 2026-10-18 23:05:51.604417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d8f2a6b73'
+down_revision = '7a9e4b1c5d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite never enforced the VARCHAR length, only PostgreSQL needs the change
+    if op.get_bind().dialect.name == 'sqlite':
+        return
+    for column in ('ingredients', 'directions'):
+        op.alter_column('recipe', column, type_=sa.Text(), existing_type=sa.String(length=255))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        return
+    for column in ('ingredients', 'directions'):
+        op.alter_column('recipe', column, type_=sa.String(length=255), existing_type=sa.Text(),
+                        postgresql_using='left({}, 255)'.format(column))
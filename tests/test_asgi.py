@@ -0,0 +1,142 @@
+import unittest
+import json
+from app import db
+from app.models.changelog import ChangeLog
+
+try:
+    from starlette.testclient import TestClient
+    from app.asgi import create_asgi_app, async_url
+except ImportError:
+    # the async mode needs requirements-async.txt
+    TestClient = None
+
+
+@unittest.skipIf(TestClient is None, 'the async serving mode is not installed')
+class TestAsgi(unittest.TestCase):
+    """The async category and recipe routes, with auth served by the mounted Flask app"""
+    def setUp(self):
+        self.app = create_asgi_app(config_name="testing")
+        self.flask_app = self.app.state.flask
+        # the host Flask's test client uses, so the two modes' links match
+        self.client = TestClient(self.app, base_url='http://localhost')
+        with self.flask_app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+        self.user = {'email': 'Gela@gela.com', 'username': 'Gela',
+                     'password': '1234567', 'confirm_password': '1234567'}
+        self.client.post('/api-v1/auth/register', data=self.user)
+        result = self.client.post('/api-v1/auth/login', data=self.user)
+        self.headers = dict(Authorization="Bearer " + result.json()['access_token'])
+
+    def test_async_url(self):
+        """Test the sync database uri is mapped to its async driver"""
+        self.assertEqual(async_url('postgres://u@localhost/db'), 'postgresql+asyncpg://u@localhost/db')
+        self.assertEqual(async_url('sqlite:////tmp/x.db'), 'sqlite+aiosqlite:////tmp/x.db')
+        with self.assertRaises(ValueError):
+            async_url('mysql://localhost/db')
+
+    def test_categories(self):
+        """Test categories can be created, listed, edited and deleted"""
+        res = self.client.get('/api-v1/categories/', headers=self.headers)
+        self.assertEqual((res.status_code, res.json()), (404, {'message': 'no categories found'}))
+        res = self.client.post('/api-v1/categories/', headers=self.headers, data={'category_name': 'Stews'})
+        self.assertEqual(res.status_code, 201)
+        category = res.json()
+        self.assertEqual(category['category_name'], 'Stews')
+        self.assertTrue(category['recipes'].endswith('/api-v1/categories/{}/recipes/'.format(
+            category['category_id'])))
+        res = self.client.post('/api-v1/categories/', headers=self.headers, json={'category_name': 'Stews'})
+        self.assertEqual(res.status_code, 409)
+        url = '/api-v1/categories/{}'.format(category['category_id'])
+        res = self.client.put(url, headers=self.headers, json={'category_name': 'Soups'})
+        self.assertEqual((res.status_code, res.json()['category_name']), (201, 'Soups'))
+        res = self.client.get('/api-v1/categories/?q=sou', headers=self.headers)
+        self.assertEqual([c['category_name'] for c in res.json()['results']], ['Soups'])
+        res = self.client.get('/api-v1/categories/?cursor=&include_total=true', headers=self.headers)
+        self.assertEqual((res.json()['total'], res.json()['next_cursor']), (1, None))
+        res = self.client.get('/api-v1/categories/?cursor=&per_page=0', headers=self.headers)
+        self.assertEqual(res.status_code, 400)
+        res = self.client.delete(url, headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        res = self.client.delete(url, headers=self.headers)
+        self.assertEqual(res.status_code, 404)
+        # the tombstone GET /sync reports it with
+        with self.flask_app.app_context():
+            self.assertEqual([(c.entity, c.entity_id) for c in ChangeLog.query],
+                             [('category', category['category_id'])])
+
+    def test_recipes(self):
+        """Test recipes, their ingredient links and the pantry ranking"""
+        res = self.client.post('/api-v1/categories/', headers=self.headers, data={'category_name': 'Breakfast'})
+        url = '/api-v1/categories/{}/recipes/'.format(res.json()['category_id'])
+        res = self.client.post(url, headers=self.headers, json={
+            'recipe_name': 'pancakes', 'ingredients': 'eggs, 2 cups flour, milk', 'directions': 'Whisk.'})
+        self.assertEqual(res.status_code, 201)
+        recipe = res.json()
+        self.assertEqual((recipe['recipe_name'], recipe['directions']), ('Pancakes', 'Whisk.'))
+        res = self.client.post(url, headers=self.headers, json={'recipe_name': 'Pancakes'})
+        self.assertEqual(res.status_code, 409)
+        res = self.client.get(url, headers=self.headers)
+        self.assertEqual(res.json()['total'], 1)
+        self.assertNotIn('ingredients', res.json()['results'][0])
+        res = self.client.get(url + '?fields=ingredients', headers=self.headers)
+        self.assertEqual(res.json()['results'][0]['ingredients'], 'eggs, 2 cups flour, milk')
+        res = self.client.get('/api-v1/recipes/cook?pantry=eggs,flour', headers=self.headers)
+        self.assertEqual(res.json()['results'][0]['missing'], ['milk'])
+
+        recipe_url = url + str(recipe['recipe_id'])
+        res = self.client.put(recipe_url, headers=self.headers, json={
+            'recipe_name': 'Crepes', 'ingredients': 'eggs, flour', 'directions': 'Fry.'})
+        self.assertEqual((res.status_code, res.json()['recipe_name']), (200, 'Crepes'))
+        res = self.client.get('/api-v1/recipes/cook?pantry=eggs,flour', headers=self.headers)
+        self.assertEqual(res.json()['results'][0]['coverage'], 1.0)
+        res = self.client.get(recipe_url, headers=self.headers)
+        self.assertEqual(res.json()['directions'], 'Fry.')
+        res = self.client.delete(recipe_url, headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        res = self.client.get(recipe_url, headers=self.headers)
+        self.assertEqual(res.status_code, 404)
+        res = self.client.get('/api-v1/recipes/cook?pantry=eggs,flour', headers=self.headers)
+        self.assertEqual(res.status_code, 422)
+
+    def test_delete_categories(self):
+        """Test categories and their recipes are deleted by ids at once"""
+        ids = [self.client.post('/api-v1/categories/', headers=self.headers,
+                                data={'category_name': name}).json()['category_id'] for name in ('Stews', 'Pies')]
+        self.client.post('/api-v1/categories/{}/recipes/'.format(ids[0]), headers=self.headers,
+                         json={'recipe_name': 'Beef Stew', 'ingredients': 'beef'})
+        res = self.client.delete('/api-v1/categories/?ids={},{},99'.format(*ids), headers=self.headers)
+        self.assertEqual(res.json(), {'deleted': ids, 'missing': [99]})
+        res = self.client.get('/api-v1/categories/', headers=self.headers)
+        self.assertEqual(res.status_code, 404)
+        with self.flask_app.app_context():
+            self.assertEqual(sorted(c.entity for c in ChangeLog.query), ['category', 'category', 'recipe'])
+
+    def test_same_responses_as_flask(self):
+        """Test a listing is the same whichever mode serves it"""
+        for name in ('Stews', 'Soups', 'Salads'):
+            self.client.post('/api-v1/categories/', headers=self.headers, data={'category_name': name})
+        flask_client = self.flask_app.test_client()
+        for path in ('/api-v1/categories/?per_page=2&page=2', '/api-v1/categories/?cursor=&per_page=2',
+                     '/api-v1/categories/?ids=3,1,9'):
+            res = self.client.get(path, headers=self.headers)
+            expected = flask_client.get(path, headers=self.headers)
+            self.assertEqual(res.status_code, expected.status_code)
+            self.assertEqual(res.json(), json.loads(expected.data.decode()))
+
+    def test_revoked_token(self):
+        """Test a token logged out through Flask is refused by the async routes"""
+        self.assertEqual(self.client.get('/api-v1/username', headers=self.headers).json(),
+                         {'username': 'Gela'})
+        self.client.post('/api-v1/auth/logout', headers=self.headers)
+        res = self.client.get('/api-v1/username', headers=self.headers)
+        self.assertEqual((res.status_code, res.json()), (401, {'message': 'Expired token. Please login.'}))
+        res = self.client.get('/api-v1/categories/')
+        self.assertEqual(res.status_code, 401)
+
+    def tearDown(self):
+        """teardown all initialized variables."""
+        with self.flask_app.app_context():
+            db.session.remove()
+            db.drop_all()
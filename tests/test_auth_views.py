@@ -1,6 +1,27 @@
 import unittest
 import json
-from app import create_app, db
+import datetime
+import secrets
+from calendar import timegm
+from app import create_app, db, outbox, tokens
+from app.models.recipeAuth import ExpiredToken, RecipeApp
+from app.models.outbox import OutboxMessage
+from app.revocation import RevocationCache
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+
+class RecordingHandler(object):
+    """aiosmtpd handler that keeps every message it receives"""
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return '250 OK'
 
 
 class TestRecipeApp(unittest.TestCase):
@@ -40,6 +61,226 @@ class TestRecipeApp(unittest.TestCase):
             headers=dict(Authorization="Bearer " + access_token))
         self.assertEqual(res.status_code, 200)
 
+    def test_logged_out_token_is_rejected(self):
+        """Test API rejects a token after the user logs out"""
+        self.test_register()
+        result=self.client().post('/api-v1/auth/login', data=self.user_login)
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        res = self.client().get('/api-v1/username', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.client().post('/api-v1/auth/logout', headers=headers)
+        res = self.client().get('/api-v1/username', headers=headers)
+        self.assertEqual(res.status_code, 401)
+        # logging out twice is refused as well
+        res = self.client().post('/api-v1/auth/logout', headers=headers)
+        self.assertEqual(res.status_code, 401)
+
+    def test_prune_expired_tokens(self):
+        """Test only revoked tokens past their exp are pruned"""
+        now = datetime.datetime.utcnow()
+        with self.app.app_context():
+            for minutes in (-5, 5):
+                exp = timegm((now + datetime.timedelta(minutes=minutes)).utctimetuple())
+                ExpiredToken({'jti': secrets.token_hex(16), 'exp': exp}).save()
+            self.assertEqual(ExpiredToken.prune(), 1)
+            self.assertEqual(ExpiredToken.query.count(), 1)
+
+    def test_revocation_sync_sees_late_commits(self):
+        """Test a worker picks up a revocation committed after a later one it already synced"""
+        now = datetime.datetime.utcnow()
+        exp = timegm((now + datetime.timedelta(minutes=5)).utctimetuple())
+        cache = RevocationCache(overlap=30)
+        with self.app.app_context():
+            late, early = ExpiredToken({'jti': 'a' * 32, 'exp': exp}), ExpiredToken({'jti': 'b' * 32, 'exp': exp})
+            late.token_id, late.expired_on = 10, now
+            db.session.add(late)
+            db.session.commit()
+            cache.sync(db.session)
+            # a lower id whose transaction started earlier but committed later
+            early.token_id, early.expired_on = 5, now - datetime.timedelta(seconds=2)
+            db.session.add(early)
+            db.session.commit()
+            cache.sync(db.session)
+        self.assertEqual(sorted(cache.revoked), ['a' * 32, 'b' * 32])
+
+    def test_refresh_rotates_tokens(self):
+        """Test a refresh token gets a new token pair once and only once"""
+        self.test_register()
+        result = self.client().post('/api-v1/auth/login', data=self.user_login)
+        login = json.loads(result.data.decode())
+        self.assertEqual(login['expires_in'], 15 * 60)
+        res = self.client().post('/api-v1/auth/refresh', data={'refresh_token': login['refresh_token']})
+        self.assertEqual(res.status_code, 200)
+        refreshed = json.loads(res.data.decode())
+        res = self.client().get('/api-v1/username',
+                                headers=dict(Authorization="Bearer " + refreshed['access_token']))
+        self.assertEqual(res.status_code, 200)
+        # the used refresh token is revoked
+        res = self.client().post('/api-v1/auth/refresh', data={'refresh_token': login['refresh_token']})
+        self.assertEqual(res.status_code, 401)
+        # and an access token isn't a refresh token, nor the other way round
+        res = self.client().post('/api-v1/auth/refresh', data={'refresh_token': login['access_token']})
+        self.assertEqual(res.status_code, 401)
+        res = self.client().get('/api-v1/username',
+                                headers=dict(Authorization="Bearer " + refreshed['refresh_token']))
+        self.assertEqual(res.status_code, 401)
+
+    def test_refresh_replayed_on_another_worker(self):
+        """Test a refresh token used on another worker is refused before this one syncs"""
+        self.test_register()
+        result = self.client().post('/api-v1/auth/login', data=self.user_login)
+        login = json.loads(result.data.decode())
+        headers = dict(Authorization="Bearer " + login['access_token'])
+        self.assertEqual(self.client().get('/api-v1/username', headers=headers).status_code, 200)
+        with self.app.app_context():
+            claims = tokens.service().verify(login['refresh_token'], tokens.REFRESH)
+            # revoked through the table only, as the other worker's refresh would
+            db.session.add(ExpiredToken(claims))
+            db.session.commit()
+        res = self.client().post('/api-v1/auth/refresh', data={'refresh_token': login['refresh_token']})
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(json.loads(res.data.decode())['message'], 'Expired token. Please login.')
+
+    def test_logout_revokes_refresh_token(self):
+        """Test logging out with the refresh token revokes it too"""
+        self.test_register()
+        result = self.client().post('/api-v1/auth/login', data=self.user_login)
+        login = json.loads(result.data.decode())
+        res = self.client().post('/api-v1/auth/logout', data={'refresh_token': login['refresh_token']},
+                                 headers=dict(Authorization="Bearer " + login['access_token']))
+        self.assertEqual(res.status_code, 200)
+        res = self.client().post('/api-v1/auth/refresh', data={'refresh_token': login['refresh_token']})
+        self.assertEqual(res.status_code, 401)
+
+    def test_key_rotation(self):
+        """Test tokens signed with a retired key verify until the key is dropped"""
+        with self.app.app_context():
+            service = tokens.service()
+            old = tokens.TokenService(tokens.KeyRing.parse('2017:old-secret'), service.lifetimes)
+            token = old.issue(1, tokens.ACCESS)
+            rotated = tokens.TokenService(tokens.KeyRing.parse('2018:new-secret,2017:old-secret'),
+                                          service.lifetimes)
+            self.assertEqual(rotated.verify(token, tokens.ACCESS)['sub'], 1)
+            self.assertEqual(rotated.keyring.signing_kid, '2018')
+            dropped = tokens.TokenService(tokens.KeyRing.parse('2018:new-secret'), service.lifetimes)
+            with self.assertRaises(tokens.jwt.InvalidTokenError):
+                dropped.verify(token, tokens.ACCESS)
+            # the same kid with a different secret fails the signature check
+            forged = tokens.TokenService(tokens.KeyRing.parse('2018:forged'), service.lifetimes)
+            with self.assertRaises(tokens.jwt.InvalidTokenError):
+                rotated.verify(forged.issue(1, tokens.ACCESS), tokens.ACCESS)
+        with self.assertRaises(ValueError):
+            tokens.KeyRing.parse('no-kid-here')
+        with self.assertRaises(ValueError):
+            tokens.TokenService.from_config(dict(self.app.config, JWT_KEYS=None))
+
+    def test_reset_password_requires_reset_token(self):
+        """Test a password is only reset with a reset token, and only once"""
+        self.test_register()
+        result = self.client().post('/api-v1/auth/login', data=self.user_login)
+        access_token = json.loads(result.data.decode())['access_token']
+        data = {'email': self.user['email'], 'new_password': 'rememberedit',
+                'confirm_new_password': 'rememberedit'}
+        res = self.client().post('/api-v1/auth/reset_password', data=data,
+                                 headers=dict(Authorization="Bearer " + access_token))
+        self.assertEqual(res.status_code, 401)
+        with self.app.app_context():
+            reset_token = RecipeApp.query.first().generate_token(tokens.RESET)
+        headers = dict(Authorization="Bearer " + reset_token)
+        res = self.client().post('/api-v1/auth/reset_password', data=dict(data, email='other@gela.com'),
+                                 headers=headers)
+        self.assertEqual(res.status_code, 401)
+        refresh_token = json.loads(result.data.decode())['refresh_token']
+        res = self.client().post('/api-v1/auth/reset_password', data=data, headers=headers)
+        self.assertEqual(res.status_code, 201)
+        res = self.client().post('/api-v1/auth/reset_password', data=data, headers=headers)
+        self.assertEqual(res.status_code, 401)
+        # refresh tokens issued before the reset are revoked with the old password
+        res = self.client().post('/api-v1/auth/refresh', data={'refresh_token': refresh_token})
+        self.assertEqual(res.status_code, 401)
+        res = self.client().post('/api-v1/auth/login',
+                                 data={'email': self.user['email'], 'password': 'rememberedit'})
+        self.assertEqual(res.status_code, 200)
+        res = self.client().post('/api-v1/auth/refresh', data={
+            'refresh_token': json.loads(res.data.decode())['refresh_token']})
+        self.assertEqual(res.status_code, 200)
+
+    def test_login_rehashes_outdated_password(self):
+        """Test login upgrades a password hash when the work factor changes"""
+        self.test_register()
+        self.app.config['BCRYPT_LOG_ROUNDS'] = 5
+        res = self.client().post('/api-v1/auth/login', data=self.user_login)
+        self.assertEqual(res.status_code, 200)
+        with self.app.app_context():
+            user = RecipeApp.query.filter_by(email=self.user['email']).first()
+            self.assertTrue(user.password.startswith('$2b$05$'))
+            self.assertTrue(user.password_is_valid(self.user['password']))
+
+    def test_send_email_is_queued(self):
+        """Test the reset password email is queued instead of sent inline"""
+        self.test_register()
+        res = self.client().post('/api-v1/auth/send_email', data={'email': self.user['email']})
+        self.assertEqual(res.status_code, 201)
+        res = self.client().post('/api-v1/auth/send_email', data={'email': self.user['email']})
+        with self.app.app_context():
+            messages = OutboxMessage.query.all()
+            self.assertEqual([m.recipient for m in messages], [self.user['email']] * 2)
+            self.assertEqual(set(m.status for m in messages), {'pending'})
+
+    @unittest.skipIf(Controller is None, 'aiosmtpd is not installed')
+    def test_outbox_worker_delivers_over_smtp(self):
+        """Test the outbox worker sends queued messages over one connection"""
+        handler = RecordingHandler()
+        controller = Controller(handler, hostname='127.0.0.1', port=8025)
+        controller.start()
+        self.app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=8025, MAIL_USE_SSL=False,
+                               MAIL_USERNAME=None)
+        try:
+            with self.app.app_context():
+                for recipient in ('a@gela.com', 'b@gela.com'):
+                    outbox.enqueue(recipient, 'Hello', '<p>Hi</p>')
+                mailer = outbox.Mailer(self.app.config)
+                self.assertEqual(outbox.deliver_pending(mailer), 2)
+                mailer.close()
+                self.assertEqual(set(m.status for m in OutboxMessage.query.all()), {'sent'})
+        finally:
+            controller.stop()
+        self.assertEqual([m.rcpt_tos for m in handler.messages], [['a@gela.com'], ['b@gela.com']])
+
+    def test_outbox_retries_failed_messages(self):
+        """Test a message that can't be sent is retried later"""
+        # nothing listens on port 1
+        self.app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=1, MAIL_USE_SSL=False)
+        with self.app.app_context():
+            outbox.enqueue('a@gela.com', 'Hello', '<p>Hi</p>')
+            mailer = outbox.Mailer(self.app.config)
+            outbox.deliver_pending(mailer)
+            message = OutboxMessage.query.first()
+            self.assertEqual((message.status, message.attempts), ('pending', 1))
+            self.assertGreater(message.next_attempt_at, datetime.datetime.utcnow())
+            # not due yet, so the next run leaves it alone
+            self.assertEqual(outbox.deliver_pending(mailer), 0)
+
+    def test_outbox_records_each_delivery(self):
+        """Test messages sent before the worker dies aren't sent again"""
+        class DyingMailer(object):
+            def __init__(self):
+                self.sent = []
+
+            def send(self, message):
+                if self.sent:
+                    raise RuntimeError('worker killed')
+                self.sent.append(message.recipient)
+        with self.app.app_context():
+            for recipient in ('a@gela.com', 'b@gela.com'):
+                outbox.enqueue(recipient, 'Hello', '<p>Hi</p>')
+            with self.assertRaises(RuntimeError):
+                outbox.deliver_pending(DyingMailer())
+            db.session.rollback()
+            statuses = dict((m.recipient, m.status) for m in OutboxMessage.query.all())
+            self.assertEqual(statuses, {'a@gela.com': 'sent', 'b@gela.com': 'pending'})
+
     def tearDown(self):
         """teardown all initialized variables."""
         with self.app.app_context():
@@ -0,0 +1,185 @@
+import unittest
+import json
+from unittest import mock
+from app import create_app, db
+from app.batch import views as batch_views
+from app.ratelimit import ConcurrencyLimiter
+from app.models.changelog import ChangeLog
+from app.models.ingredient import RecipeIngredient
+
+
+class TestBatch(unittest.TestCase):
+    """Multi-gets by ids and the POST /batch envelope"""
+    def setUp(self):
+        """Define test variables and initialize app"""
+        self.app = create_app(config_name="testing")
+        self.client = self.app.test_client
+
+        # binds the app to the current context
+        with self.app.app_context():
+            # create all tables
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+
+        user = {'email': 'Gela@gela.com',
+                'username': 'Gela',
+                'password': '1234567',
+                'confirm_password': '1234567'}
+        self.client().post('/api-v1/auth/register', data=user)
+        result = self.client().post('/api-v1/auth/login', data=user)
+        access_token = json.loads(result.data.decode())['access_token']
+        self.headers = dict(Authorization="Bearer " + access_token)
+        self.category_ids = [self.post('/api-v1/categories/', {'category_name': name})['category_id']
+                             for name in ('Stews', 'Salads')]
+        self.recipe_ids = [self.post(self.recipes_url(0), {'recipe_name': name, 'directions': 'Stir.',
+                                                           'ingredients': 'beef, onions'})['recipe_id']
+                           for name in ('Beef Stew', 'Lamb Stew')]
+
+    def recipes_url(self, index):
+        return '/api-v1/categories/{}/recipes/'.format(self.category_ids[index])
+
+    def post(self, url, data):
+        return json.loads(self.client().post(url, headers=self.headers, data=data).data.decode())
+
+    def get(self, url):
+        res = self.client().get(url, headers=self.headers)
+        return res.status_code, json.loads(res.data.decode())
+
+    def test_recipes_by_id(self):
+        """Test recipes can be fetched by ids, in the order asked for"""
+        status, data = self.get('/api-v1/recipes?ids={},{},999'.format(*reversed(self.recipe_ids)))
+        self.assertEqual(status, 200)
+        self.assertEqual([r['recipe_name'] for r in data['results']], ['Lamb Stew', 'Beef Stew'])
+        self.assertEqual(data['results'][0]['directions'], 'Stir.')
+        self.assertEqual(data['missing'], [999])
+        status, data = self.get('/api-v1/recipes?ids={}&fields=recipe_name'.format(self.recipe_ids[0]))
+        self.assertEqual(data['results'], [{'recipe_id': self.recipe_ids[0], 'recipe_name': 'Beef Stew'}])
+        self.assertEqual(self.get('/api-v1/recipes')[0], 400)
+        self.assertEqual(self.get('/api-v1/recipes?ids=1,x')[0], 400)
+        self.assertEqual(self.get('/api-v1/recipes?ids=1&fields=calories')[0], 400)
+        too_many = ','.join(str(i) for i in range(1, self.app.config['BATCH_MAX_IDS'] + 2))
+        self.assertEqual(self.get('/api-v1/recipes?ids=' + too_many)[0], 400)
+
+    def test_categories_by_id(self):
+        """Test categories can be fetched by ids"""
+        status, data = self.get('/api-v1/categories/?ids={},{}'.format(self.category_ids[1], 999))
+        self.assertEqual(status, 200)
+        self.assertEqual([c['category_name'] for c in data['results']], ['Salads'])
+        self.assertTrue(data['results'][0]['recipes'].endswith(self.recipes_url(1)))
+        self.assertEqual(data['missing'], [999])
+
+    def test_other_users_recipes(self):
+        """Test a multi-get and a batch only see the user's own rows"""
+        other = {'email': 'other@gela.com', 'username': 'Other',
+                 'password': '1234567', 'confirm_password': '1234567'}
+        self.client().post('/api-v1/auth/register', data=other)
+        result = self.client().post('/api-v1/auth/login', data=other)
+        headers = dict(Authorization="Bearer " + json.loads(result.data.decode())['access_token'])
+        res = self.client().get('/api-v1/recipes?ids={}'.format(self.recipe_ids[0]), headers=headers)
+        self.assertEqual(json.loads(res.data.decode())['missing'], [self.recipe_ids[0]])
+        res = self.client().post('/api-v1/batch', headers=headers, data=json.dumps({'requests': [
+            {'path': self.recipes_url(0) + str(self.recipe_ids[0])}, {'path': '/api-v1/categories/'}]}),
+            content_type='application/json')
+        self.assertEqual([r['status'] for r in json.loads(res.data.decode())['responses']], [404, 404])
+
+    def test_batch(self):
+        """Test a batch answers every request as the endpoint itself would"""
+        paths = [self.recipes_url(0) + str(self.recipe_ids[1]),
+                 '/api-v1/categories/{}'.format(self.category_ids[0]),
+                 self.recipes_url(1) + str(self.recipe_ids[0]),
+                 self.recipes_url(0) + '?per_page=1',
+                 '/api-v1/username',
+                 '/api-v1/nothing',
+                 '/api-v1/export']
+        res = self.client().post('/api-v1/batch', headers=self.headers, data=json.dumps(
+            {'requests': [{'method': 'GET', 'path': path} for path in paths] + [
+                {'method': 'DELETE', 'path': paths[0]}, {'method': 'GET'}]}),
+            content_type='application/json')
+        self.assertEqual(res.status_code, 200)
+        responses = json.loads(res.data.decode())['responses']
+        self.assertEqual([r['status'] for r in responses], [200, 201, 404, 200, 200, 404, 400, 405, 400])
+        for response, path in zip(responses[:5], paths):
+            self.assertEqual(response['path'], path)
+            self.assertEqual(response['body'], self.get(path)[1])
+        self.assertEqual(responses[2]['body'], {'message': 'No recipe found'})
+
+    def test_batch_limits(self):
+        """Test a batch needs a list of requests, and at most BATCH_MAX_REQUESTS"""
+        res = self.client().post('/api-v1/batch', headers=self.headers, data=json.dumps({}),
+                                 content_type='application/json')
+        self.assertEqual(res.status_code, 400)
+        requests = [{'path': '/api-v1/username'}] * (self.app.config['BATCH_MAX_REQUESTS'] + 1)
+        res = self.client().post('/api-v1/batch', headers=self.headers,
+                                 data=json.dumps({'requests': requests}), content_type='application/json')
+        self.assertEqual(res.status_code, 413)
+        res = self.client().post('/api-v1/batch', data=json.dumps({'requests': requests[:1]}),
+                                 content_type='application/json')
+        self.assertEqual(res.status_code, 401)
+
+    def test_batch_rate_limit(self):
+        """Test every request of a batch is charged to the user's rate limit of its endpoint"""
+        self.app.extensions['rate_limiter'].limits['api'] = (2, 60)
+        requests = [{'path': '/api-v1/categories/{}'.format(self.category_ids[0])}] * 3 + [
+            {'path': '/api-v1/username'}]
+        res = self.client().post('/api-v1/batch', headers=self.headers,
+                                 data=json.dumps({'requests': requests}), content_type='application/json')
+        self.assertEqual([r['status'] for r in json.loads(res.data.decode())['responses']],
+                         [201, 201, 429, 200])
+        status, data = self.get('/api-v1/categories/{}'.format(self.category_ids[0]))
+        self.assertEqual(status, 429)
+
+    def test_batch_holds_concurrency_slot(self):
+        """Test a batch keeps its MAX_CONCURRENT_REQUESTS slot until the batch itself ends"""
+        limiter = ConcurrencyLimiter(1, {})
+        self.app.extensions['concurrency_limiter'] = limiter
+        free = []
+
+        def run_subrequest(user_id, path):
+            result = run(user_id, path)
+            free.append(limiter.total.acquire(False))
+            return result
+        run = batch_views.run_subrequest
+        requests = [{'path': '/api-v1/username'}] * 3
+        with mock.patch.object(batch_views, 'run_subrequest', run_subrequest):
+            res = self.client().post('/api-v1/batch', headers=self.headers,
+                                     data=json.dumps({'requests': requests}), content_type='application/json')
+        self.assertEqual([r['status'] for r in json.loads(res.data.decode())['responses']], [200] * 3)
+        self.assertEqual(free, [False] * 3)
+        self.assertTrue(limiter.total.acquire(False))
+
+    def test_delete_categories(self):
+        """Test categories and all their recipes are deleted by ids at once"""
+        res = self.client().delete('/api-v1/categories/?ids={},999'.format(self.category_ids[0]),
+                                   headers=self.headers)
+        self.assertEqual(json.loads(res.data.decode()), {'deleted': [self.category_ids[0]], 'missing': [999]})
+        status, data = self.get('/api-v1/categories/?ids={},{}'.format(*self.category_ids))
+        self.assertEqual(data['missing'], [self.category_ids[0]])
+        status, data = self.get('/api-v1/recipes?ids={},{}'.format(*self.recipe_ids))
+        self.assertEqual(data['missing'], self.recipe_ids)
+        with self.app.app_context():
+            self.assertEqual(sorted((c.entity, c.entity_id) for c in ChangeLog.query),
+                             [('category', self.category_ids[0])] + [('recipe', i) for i in self.recipe_ids])
+            self.assertEqual(RecipeIngredient.query.count(), 0)
+        res = self.client().delete('/api-v1/categories/?ids=', headers=self.headers)
+        self.assertEqual(res.status_code, 400)
+
+    def test_delete_recipes(self):
+        """Test recipes are deleted by ids at once, and cached reads see it"""
+        recipe_url = self.recipes_url(0) + str(self.recipe_ids[0])
+        self.assertEqual(self.get(recipe_url)[0], 200)
+        res = self.client().delete('/api-v1/recipes?ids={},999'.format(self.recipe_ids[0]),
+                                   headers=self.headers)
+        self.assertEqual(json.loads(res.data.decode()), {'deleted': [self.recipe_ids[0]], 'missing': [999]})
+        self.assertEqual(self.get(recipe_url)[0], 404)
+        self.assertEqual(self.get(self.recipes_url(0))[1]['total'], 1)
+        with self.app.app_context():
+            self.assertEqual([(c.entity, c.entity_id) for c in ChangeLog.query],
+                             [('recipe', self.recipe_ids[0])])
+
+    def tearDown(self):
+        """teardown all initialized variables."""
+        with self.app.app_context():
+            # drop all tables
+            db.session.remove()
+            db.drop_all()
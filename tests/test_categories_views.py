@@ -185,3 +185,77 @@ class TestCategory(unittest.TestCase):
             '/api-v1/categories/?page=1&per_page=5',
             headers=dict(Authorization="Bearer " + access_token))
         self.assertEqual(res.status_code, 200)
+        for page in ('0', '-1'):
+            res = self.client().get(
+                '/api-v1/categories/?page=' + page,
+                headers=dict(Authorization="Bearer " + access_token))
+            self.assertEqual(res.status_code, 400)
+
+    def test_cursor_pagination(self):
+        """Test API can page through categories with a cursor"""
+        self.register_user()
+        result=self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        for name in ('Stews', 'Soups', 'Sauces'):
+            self.client().post('/api-v1/categories/', headers=headers, data={'category_name': name})
+
+        res = self.client().get('/api-v1/categories/?cursor=&per_page=2&include_total=true', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        page = json.loads(res.data.decode())
+        self.assertEqual([c['category_name'] for c in page['results']], ['Stews', 'Soups'])
+        self.assertEqual(page['total'], 3)
+
+        res = self.client().get(
+            '/api-v1/categories/?per_page=2&cursor=' + page['next_cursor'], headers=headers)
+        page = json.loads(res.data.decode())
+        self.assertEqual([c['category_name'] for c in page['results']], ['Sauces'])
+        self.assertIsNone(page['next_cursor'])
+        self.assertNotIn('total', page)
+
+        res = self.client().get('/api-v1/categories/?cursor=not-a-cursor', headers=headers)
+        self.assertEqual(res.status_code, 400)
+        for per_page in ('0', '101', 'ten'):
+            res = self.client().get('/api-v1/categories/?cursor=&per_page=' + per_page, headers=headers)
+            self.assertEqual(res.status_code, 400)
+
+    def test_cached_category_is_invalidated_on_edit(self):
+        """Test a cached category is served with an ETag and refreshed after an edit"""
+        self.register_user()
+        result=self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        rv = self.client().post('/api-v1/categories/', headers=headers, data=self.category)
+        url = '/api-v1/categories/{}'.format(json.loads(rv.data.decode())['category_id'])
+
+        res = self.client().get(url, headers=headers)
+        etag = res.headers['ETag']
+        res = self.client().get(url, headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(res.status_code, 304)
+
+        self.client().put(url, headers=headers, data={'category_name': 'Soups'})
+        res = self.client().get(url, headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertNotEqual(res.status_code, 304)
+        self.assertIn('Soups', str(res.data))
+        res = self.client().get('/api-v1/categories/', headers=headers)
+        self.assertIn('Soups', str(res.data))
+
+    def test_duplicate_category(self):
+        """Test API refuses a second category with the same name"""
+        self.register_user()
+        result=self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        res = self.client().post('/api-v1/categories/', headers=headers, data=self.category)
+        self.assertEqual(res.status_code, 201)
+        res = self.client().post('/api-v1/categories/', headers=headers, data=self.category)
+        self.assertEqual(res.status_code, 409)
+
+        # renaming another category to an existing name is refused as well
+        res = self.client().post('/api-v1/categories/', headers=headers, data={'category_name': 'Soups'})
+        res = self.client().put(
+            '/api-v1/categories/{}'.format(json.loads(res.data.decode())['category_id']),
+            headers=headers, data=self.category)
+        self.assertEqual(res.status_code, 409)
+        res = self.client().get('/api-v1/categories/', headers=headers)
+        self.assertIn('Soups', str(res.data))
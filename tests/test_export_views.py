@@ -0,0 +1,65 @@
+import unittest
+import json
+from app import create_app, db
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        """Define test variables and initialize app"""
+        self.app = create_app(config_name="testing")
+        self.client = self.app.test_client
+
+        # binds the app to the current context
+        with self.app.app_context():
+            # create all tables
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+
+    def login_user(self):
+        """Helper method to register and login a test user"""
+        user = {'email': 'Gela@gela.com',
+                'username': 'Gela',
+                'password': '1234567',
+                'confirm_password': '1234567'}
+        self.client().post('/api-v1/auth/register', data=user)
+        result = self.client().post('/api-v1/auth/login', data=user)
+        access_token = json.loads(result.data.decode())['access_token']
+        return dict(Authorization="Bearer " + access_token)
+
+    def create_recipe_book(self, headers):
+        """Helper method to create two categories, the second with two recipes"""
+        ids = []
+        for name in ('Soups', 'Stews'):
+            res = self.client().post('/api-v1/categories/', headers=headers, data={'category_name': name})
+            ids.append(json.loads(res.data.decode())['category_id'])
+        for name in ('Beef Stew', 'Chicken Stew'):
+            self.client().post('/api-v1/categories/{}/recipes/'.format(ids[1]),
+                               headers=headers, data={'recipe_name': name})
+
+    def test_export_ndjson(self):
+        """Test API can export a recipe book as NDJSON"""
+        headers = self.login_user()
+        self.create_recipe_book(headers)
+        res = self.client().get('/api-v1/export', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        lines = [json.loads(line) for line in res.data.decode().splitlines()]
+        self.assertEqual([(line['type'], line.get('category_name') or line['recipe_name']) for line in lines],
+                         [('category', 'Soups'), ('category', 'Stews'),
+                          ('recipe', 'Beef Stew'), ('recipe', 'Chicken Stew')])
+
+    def test_export_json(self):
+        """Test API can export a recipe book as nested JSON"""
+        headers = self.login_user()
+        self.create_recipe_book(headers)
+        res = self.client().get('/api-v1/export?format=json', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        categories = json.loads(res.data.decode())['categories']
+        self.assertEqual([len(category['recipes']) for category in categories], [0, 2])
+        self.assertEqual(categories[1]['recipes'][0]['recipe_name'], 'Beef Stew')
+
+    def test_export_unknown_format(self):
+        """Test API rejects unknown export formats"""
+        headers = self.login_user()
+        res = self.client().get('/api-v1/export?format=xml', headers=headers)
+        self.assertEqual(res.status_code, 400)
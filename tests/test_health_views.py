@@ -0,0 +1,32 @@
+import unittest
+import json
+from unittest import mock
+from sqlalchemy import exc
+from app import create_app, db
+
+
+class TestHealth(unittest.TestCase):
+    def setUp(self):
+        """Initialize app"""
+        self.app = create_app(config_name="testing")
+        self.client = self.app.test_client
+
+    def test_health(self):
+        """Test API reports the database and connection pool state"""
+        res = self.client().get('/api-v1/health')
+        self.assertEqual(res.status_code, 200)
+        result = json.loads(res.data.decode())
+        self.assertEqual(result['database'], 'ok')
+        self.assertIn('pid', result['pool'])
+        self.assertGreaterEqual(result['pool']['checkouts'], 1)
+
+    def test_health_hides_database_errors(self):
+        """Test API reports an unreachable database without the driver's error"""
+        error = exc.OperationalError('SELECT 1', {}, Exception('could not connect to db.internal as admin'))
+        with self.app.app_context(), mock.patch.object(db.session, 'execute', side_effect=error), \
+                mock.patch.object(self.app.logger, 'exception') as log:
+            res = self.client().get('/api-v1/health')
+        self.assertEqual(res.status_code, 503)
+        self.assertNotIn('db.internal', res.data.decode())
+        self.assertEqual(json.loads(res.data.decode())['database'], 'unavailable')
+        log.assert_called_once()
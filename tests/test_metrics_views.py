@@ -0,0 +1,61 @@
+import unittest
+import json
+from app import create_app, db
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        """Define test variables and initialize app"""
+        self.app = create_app(config_name="testing")
+        self.client = self.app.test_client
+        self.user = {'email': 'Gela@gela.com',
+                     'username': 'Gela',
+                     'password': '1234567',
+                     'confirm_password': '1234567'}
+        with self.app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+
+    def login(self):
+        self.client().post('/api-v1/auth/register', data=self.user)
+        result = self.client().post('/api-v1/auth/login', data=self.user)
+        return dict(Authorization="Bearer " + json.loads(result.data.decode())['access_token'])
+
+    def test_metrics(self):
+        """Test /metrics reports latency, SQL statements and phases per route"""
+        headers = self.login()
+        self.client().post('/api-v1/categories/', headers=headers, data={'category_name': 'Stews'})
+        self.client().get('/api-v1/categories/', headers=headers)
+        self.client().get('/api-v1/categories/', headers=headers)
+
+        res = self.client().get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.content_type.startswith('text/plain'))
+        text = res.data.decode()
+        self.assertIn('# TYPE yummy_http_request_duration_seconds histogram', text)
+        self.assertIn('yummy_http_request_duration_seconds_count'
+                      '{method="GET",route="/api-v1/categories/",status="200"} 2', text)
+        # the first listing runs one statement, the repeat is cached
+        self.assertIn('yummy_http_request_queries_bucket'
+                      '{method="GET",route="/api-v1/categories/",le="0"} 1', text)
+        self.assertIn('yummy_http_request_queries_sum{method="GET",route="/api-v1/categories/"} 1', text)
+        for phase in ('sql', 'bcrypt', 'jwt'):
+            self.assertIn('{{method="POST",route="/api-v1/auth/login",phase="{}"}}'.format(phase), text)
+        self.assertIn('route="/api-v1/categories/",phase="serialize"', text)
+
+    def test_server_timing(self):
+        """Test the Server-Timing header breaks down the request when enabled"""
+        res = self.client().get('/api-v1/health')
+        self.assertNotIn('Server-Timing', res.headers)
+        self.app.config['METRICS_SERVER_TIMING'] = True
+        res = self.client().get('/api-v1/health')
+        self.assertRegex(res.headers['Server-Timing'], r'^sql;dur=[\d.]+;desc="1 queries", total;dur=[\d.]+$')
+
+    def test_metrics_token(self):
+        """Test /metrics requires METRICS_TOKEN when it's set"""
+        self.app.config['METRICS_TOKEN'] = 'scraper'
+        res = self.client().get('/metrics')
+        self.assertEqual(res.status_code, 401)
+        res = self.client().get('/metrics', headers=dict(Authorization='Bearer scraper'))
+        self.assertEqual(res.status_code, 200)
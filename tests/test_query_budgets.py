@@ -0,0 +1,121 @@
+import unittest
+import json
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import create_app, db
+
+
+@contextmanager
+def count_queries(app):
+    """Records every SQL statement the app runs inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # connection pre-pings are pool upkeep, not queries made by the endpoint
+        if not context.execution_options.get('pre_ping'):
+            statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+class TestQueryBudgets(unittest.TestCase):
+    """Every endpoint has a budget of SQL statements it may run per request."""
+
+    def setUp(self):
+        """Define test variables and initialize app"""
+        self.app = create_app(config_name="testing")
+        self.client = self.app.test_client
+
+        # binds the app to the current context
+        with self.app.app_context():
+            # create all tables
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+
+        user = {'email': 'Gela@gela.com',
+                'username': 'Gela',
+                'password': '1234567',
+                'confirm_password': '1234567'}
+        self.client().post('/api-v1/auth/register', data=user)
+        result = self.client().post('/api-v1/auth/login', data=user)
+        access_token = json.loads(result.data.decode())['access_token']
+        self.headers = dict(Authorization="Bearer " + access_token)
+        res = self.client().post('/api-v1/categories/', headers=self.headers,
+                                 data={'category_name': 'Stews'})
+        self.category_id = json.loads(res.data.decode())['category_id']
+        res = self.client().post(self.recipes_url(), headers=self.headers,
+                                 data={'recipe_name': 'Beef Stew'})
+        self.recipe_id = json.loads(res.data.decode())['recipe_id']
+
+    def recipes_url(self):
+        return '/api-v1/categories/{}/recipes/'.format(self.category_id)
+
+    def assertWithinBudget(self, budget, method, url, **kwargs):
+        """Runs one request and fails if it ran more than `budget` statements"""
+        with count_queries(self.app) as statements:
+            res = getattr(self.client(), method)(url, headers=self.headers, **kwargs)
+        self.assertLess(res.status_code, 300, res.data)
+        self.assertLessEqual(
+            len(statements), budget,
+            '{} {} ran {} statements:\n{}'.format(
+                method.upper(), url, len(statements), '\n'.join(statements)))
+
+    def test_category_budgets(self):
+        """Test category endpoints stay within their query budgets"""
+        category_url = '/api-v1/categories/{}'.format(self.category_id)
+        self.assertWithinBudget(3, 'post', '/api-v1/categories/', data={'category_name': 'Soups'})
+        self.assertWithinBudget(2, 'get', '/api-v1/categories/')
+        self.assertWithinBudget(1, 'get', '/api-v1/categories/?cursor=')
+        self.assertWithinBudget(1, 'get', category_url)
+        self.assertWithinBudget(3, 'put', category_url, data={'category_name': 'Hot Stews'})
+        self.assertWithinBudget(1, 'get', '/api-v1/username')
+        self.assertWithinBudget(7, 'delete', category_url)
+
+    def test_recipe_budgets(self):
+        """Test recipe endpoints stay within their query budgets"""
+        recipe_url = '{}{}'.format(self.recipes_url(), self.recipe_id)
+        self.assertWithinBudget(5, 'post', self.recipes_url(), data={'recipe_name': 'Fish Stew'})
+        self.assertWithinBudget(2, 'get', self.recipes_url())
+        self.assertWithinBudget(1, 'get', self.recipes_url() + '?cursor=')
+        self.assertWithinBudget(1, 'get', recipe_url)
+        self.assertWithinBudget(3, 'put', recipe_url, data={'recipe_name': 'Lamb Stew'})
+        self.assertWithinBudget(6, 'delete', recipe_url)
+
+    def test_batch_budgets(self):
+        """Test multi-gets and batches run one IN query per model"""
+        self.client().post(self.recipes_url(), headers=self.headers, data={'recipe_name': 'Fish Stew'})
+        self.assertWithinBudget(1, 'get', '/api-v1/recipes?ids=1,2,3')
+        self.assertWithinBudget(1, 'get', '/api-v1/categories/?ids=1,2')
+        requests = [{'path': '/api-v1/categories/{}'.format(self.category_id)}] + [
+            {'path': '{}{}'.format(self.recipes_url(), recipe_id)} for recipe_id in (1, 2, 3)]
+        self.assertWithinBudget(2, 'post', '/api-v1/batch', data=json.dumps({'requests': requests}),
+                                content_type='application/json')
+
+    def test_bulk_delete_budgets(self):
+        """Test bulk deletes run a fixed number of statements, however many rows"""
+        for name in ('Fish Stew', 'Lamb Stew', 'Bean Stew'):
+            self.client().post(self.recipes_url(), headers=self.headers,
+                               data={'recipe_name': name, 'ingredients': 'salt'})
+        self.assertWithinBudget(6, 'delete', '/api-v1/recipes?ids=1,2')
+        self.assertWithinBudget(7, 'delete', '/api-v1/categories/?ids={}'.format(self.category_id))
+
+    def test_sync_budget(self):
+        """Test a sync reads the clock and each kind of row once"""
+        res = self.client().get('/api-v1/sync', headers=self.headers)
+        self.assertWithinBudget(3, 'get', '/api-v1/sync')
+        self.assertWithinBudget(4, 'get', '/api-v1/sync?since=' + json.loads(res.data.decode())['next'])
+
+    def test_cached_read_runs_no_queries(self):
+        """Test a repeated read is served without touching the database"""
+        category_url = '/api-v1/categories/{}'.format(self.category_id)
+        self.client().get(category_url, headers=self.headers)
+        self.assertWithinBudget(0, 'get', category_url)
@@ -0,0 +1,88 @@
+import unittest
+import json
+from unittest import mock
+
+from app import create_app, db
+from app.ratelimit import MemoryBackend, ConcurrencyLimiter
+
+
+class TestRateLimit(unittest.TestCase):
+    def setUp(self):
+        """Define test variables and initialize app"""
+        self.app = create_app(config_name="testing")
+        self.client = self.app.test_client
+        self.limiter = self.app.extensions['rate_limiter']
+        self.user = {'email': 'Gela@gela.com',
+                     'username': 'Gela',
+                     'password': '1234567',
+                     'confirm_password': '1234567'}
+        with self.app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+
+    def test_token_bucket(self):
+        """Test a bucket allows a burst, then refills at its rate"""
+        backend = MemoryBackend()
+        with mock.patch('app.ratelimit.time.time', return_value=1000.0):
+            self.assertEqual([backend.take('k', 0.5, 2) for _ in range(3)], [0, 0, 2.0])
+        with mock.patch('app.ratelimit.time.time', return_value=1002.0):
+            self.assertEqual(backend.take('k', 0.5, 2), 0)
+            self.assertEqual(backend.take('other', 0.5, 2), 0)
+
+    def test_login_rate_limit(self):
+        """Test API throttles login attempts per client with a Retry-After"""
+        self.limiter.limits['login'] = (2, 60)
+        self.client().post('/api-v1/auth/register', data=self.user)
+        login = {'email': 'Gela@gela.com', 'password': 'wrong password'}
+        for _ in range(2):
+            res = self.client().post('/api-v1/auth/login', data=login)
+            self.assertEqual(res.status_code, 403)
+        res = self.client().post('/api-v1/auth/login', data=login)
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(res.headers['Retry-After'], '30')
+        # another client has its own bucket
+        res = self.client().post('/api-v1/auth/login', data=login,
+                                 environ_base={'REMOTE_ADDR': '10.0.0.2'})
+        self.assertEqual(res.status_code, 403)
+
+    def test_send_email_rate_limit(self):
+        """Test API limits reset emails to one address whichever client asks"""
+        self.limiter.limits['send_email_to'] = (1, 3600)
+        self.client().post('/api-v1/auth/register', data=self.user)
+        res = self.client().post('/api-v1/auth/send_email', data={'email': 'Gela@gela.com'})
+        self.assertEqual(res.status_code, 201)
+        res = self.client().post('/api-v1/auth/send_email', data={'email': 'gela@gela.com '},
+                                 environ_base={'REMOTE_ADDR': '10.0.0.2'})
+        self.assertEqual(res.status_code, 429)
+
+    def test_api_rate_limit_per_user_and_route(self):
+        """Test API limits each user on each route separately"""
+        self.limiter.limits['api'] = (1, 60)
+        self.client().post('/api-v1/auth/register', data=self.user)
+        result = self.client().post('/api-v1/auth/login', data=self.user)
+        headers = dict(Authorization="Bearer " + json.loads(result.data.decode())['access_token'])
+        res = self.client().post('/api-v1/categories/', headers=headers, data={'category_name': 'Stews'})
+        self.assertEqual(res.status_code, 201)
+        res = self.client().post('/api-v1/categories/', headers=headers, data={'category_name': 'Soups'})
+        self.assertEqual(res.status_code, 429)
+        res = self.client().get('/api-v1/username', headers=headers)
+        self.assertEqual(res.status_code, 200)
+
+    def test_load_shedding(self):
+        """Test API sheds requests beyond its concurrency caps with a 503"""
+        limiter = ConcurrencyLimiter(1, {'password_hash': 1})
+        self.app.extensions['concurrency_limiter'] = limiter
+        # a request to an expensive endpoint already holds its only slot
+        limiter.slots['password_hash'].acquire()
+        res = self.client().post('/api-v1/auth/register', data=self.user)
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.headers['Retry-After'], '1')
+        # the other endpoints keep working, and free their slot afterwards
+        for _ in range(2):
+            res = self.client().get('/api-v1/health')
+            self.assertEqual(res.status_code, 200)
+        # until the worker as a whole is full
+        limiter.total.acquire()
+        res = self.client().get('/api-v1/health')
+        self.assertEqual(res.status_code, 503)
@@ -1,9 +1,13 @@
 import unittest
 import os
 import json
+from unittest import mock
+from sqlalchemy.exc import IntegrityError
 from app import create_app, db
+from app.recipes import views as recipe_views
 from app.models.category import Category
 from app.models.recipeAuth import RecipeApp
+from app.models.ingredient import Ingredient, parse_ingredients
 
 class TestRecipe(unittest.TestCase):
     def setUp(self):
@@ -231,3 +235,192 @@ class TestRecipe(unittest.TestCase):
             headers=dict(Authorization="Bearer " + access_token),
             data=self.category)
         self.assertEqual(res.status_code, 200)
+
+    def test_search_ingredients_and_directions(self):
+        """Test API searches recipe ingredients and directions as well as names"""
+        self.register_user()
+        result=self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+
+        category_res = self.client().post('/api-v1/categories/', headers=headers, data=self.category)
+        category_id = json.loads(category_res.data.decode())['category_id']
+        url = '/api-v1/categories/{}/recipes/'.format(category_id)
+        self.client().post(url, headers=headers, data={
+            'recipe_name': 'Beef Stew', 'ingredients': 'beef, carrots', 'directions': 'Simmer slowly'})
+        self.client().post(url, headers=headers, data={
+            'recipe_name': 'Chicken Stew', 'ingredients': 'chicken, onions', 'directions': 'Boil'})
+
+        res = self.client().get(url + '?q=carrot', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        results = json.loads(res.data.decode())['results']
+        self.assertEqual([r['recipe_name'] for r in results], ['Beef Stew'])
+
+        res = self.client().get(url + '?q=simmer', headers=headers)
+        self.assertIn('Beef Stew', str(res.data))
+        self.assertNotIn('Chicken Stew', str(res.data))
+
+        res = self.client().get(url + '?q=stew', headers=headers)
+        results = json.loads(res.data.decode())['results']
+        self.assertEqual(len(results), 2)
+
+    def test_bulk_import(self):
+        """Test API can import recipes in bulk from NDJSON and CSV"""
+        self.register_user()
+        result=self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        category_res = self.client().post('/api-v1/categories/', headers=headers, data=self.category)
+        category_id = json.loads(category_res.data.decode())['category_id']
+        self.client().post('/api-v1/categories/{}/recipes/'.format(category_id),
+                           headers=headers, data=self.recipe)
+        url = '/api-v1/categories/{}/recipes/bulk'.format(category_id)
+
+        body = '\n'.join([json.dumps({'recipe_name': 'Beef Stew', 'ingredients': 'beef'}),
+                          json.dumps({'recipe_name': 'chicken stew'}),
+                          json.dumps({'ingredients': 'no name'}),
+                          json.dumps({'recipe_name': 'beef stew'})])
+        res = self.client().post(url, headers=headers, data=body, content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, 200)
+        report = json.loads(res.data.decode())
+        self.assertEqual(report['counts'], {'created': 1, 'duplicate': 2, 'invalid': 1, 'failed': 0})
+        self.assertEqual([r['status'] for r in report['results']],
+                         ['created', 'duplicate', 'invalid', 'duplicate'])
+
+        body = 'recipe_name,ingredients,directions\nFish Stew,"fish, tomatoes",Simmer\n'
+        res = self.client().post(url, headers=headers, data=body, content_type='text/csv')
+        self.assertEqual(json.loads(res.data.decode())['counts']['created'], 1)
+
+        # rows that aren't UTF-8 are reported rather than failing the import
+        body = b'{"recipe_name": "Caf\xe9 Stew"}\n' + json.dumps({'recipe_name': 'Lamb Stew'}).encode()
+        res = self.client().post(url, headers=headers, data=body, content_type='application/x-ndjson')
+        report = json.loads(res.data.decode())
+        self.assertEqual([r['status'] for r in report['results']], ['invalid', 'created'])
+        body = b'recipe_name\nPea Soup\nCaf\xe9 Soup\nBean Soup\n'
+        res = self.client().post(url, headers=headers, data=body, content_type='text/csv')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data.decode())['counts'], {'created': 1, 'duplicate': 0, 'invalid': 1, 'failed': 0})
+
+        res = self.client().get('/api-v1/categories/{}/recipes/?fields=ingredients'.format(category_id),
+                                headers=headers)
+        self.assertEqual(json.loads(res.data.decode())['total'], 5)
+        self.assertIn('fish, tomatoes', str(res.data))
+
+    def test_bulk_import_concurrent_conflict(self):
+        """Test a chunk that keeps losing the race with another request is reported, not a 500"""
+        self.app.config['BULK_IMPORT_CHUNK_SIZE'] = 2
+        self.register_user()
+        result=self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        category_res = self.client().post('/api-v1/categories/', headers=headers, data=self.category)
+        url = '/api-v1/categories/{}/recipes/bulk'.format(json.loads(category_res.data.decode())['category_id'])
+        insert = recipe_views.insert_chunk
+
+        def insert_chunk(user_id, category_id, chunk, seen, report):
+            if chunk[0]['recipe_name'] == 'Beef Stew':
+                report.extend({'row': row['row'], 'status': 'created'} for row in chunk)
+                raise IntegrityError('INSERT INTO recipes', {}, Exception('unique constraint'))
+            insert(user_id, category_id, chunk, seen, report)
+        body = '\n'.join(json.dumps({'recipe_name': name}) for name in ('Beef Stew', 'Lamb Stew', 'Fish Stew'))
+        with mock.patch.object(recipe_views, 'insert_chunk', insert_chunk):
+            res = self.client().post(url, headers=headers, data=body, content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, 200)
+        report = json.loads(res.data.decode())
+        self.assertEqual(report['counts'], {'created': 1, 'duplicate': 0, 'invalid': 0, 'failed': 2})
+        self.assertEqual([r['status'] for r in report['results']], ['failed', 'failed', 'created'])
+
+    def test_duplicate_recipe(self):
+        """Test API refuses a second recipe with the same name"""
+        self.register_user()
+        result=self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        category_res = self.client().post('/api-v1/categories/', headers=headers, data=self.category)
+        url = '/api-v1/categories/{}/recipes/'.format(json.loads(category_res.data.decode())['category_id'])
+        res = self.client().post(url, headers=headers, data=self.recipe)
+        self.assertEqual(res.status_code, 201)
+        res = self.client().post(url, headers=headers, data={'recipe_name': 'chicken stew'})
+        self.assertEqual(res.status_code, 409)
+
+    def test_cook_from_pantry(self):
+        """Test API ranks recipes by how much of them the pantry covers"""
+        self.register_user()
+        result=self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        category_res = self.client().post('/api-v1/categories/', headers=headers, data=self.category)
+        category_id = json.loads(category_res.data.decode())['category_id']
+        url = '/api-v1/categories/{}/recipes/'.format(category_id)
+        self.client().post(url, headers=headers, data={
+            'recipe_name': 'Pancakes', 'ingredients': '2 eggs, 1 cup Flour, 300ml milk'})
+        self.client().post(url, headers=headers, data={
+            'recipe_name': 'Omelette', 'ingredients': 'eggs, salt'})
+        body = json.dumps({'recipe_name': 'Fish Stew', 'ingredients': 'fish; tomatoes'})
+        self.client().post(url + 'bulk', headers=headers, data=body, content_type='application/x-ndjson')
+
+        res = self.client().get('/api-v1/recipes/cook?pantry=Eggs,flour,fish', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        results = json.loads(res.data.decode())['results']
+        self.assertEqual([(r['recipe_name'], r['have'], r['missing']) for r in results],
+                         [('Pancakes', 2, ['milk']), ('Omelette', 1, ['salt']),
+                          ('Fish Stew', 1, ['tomatoes'])])
+
+        # editing the ingredients re-links the recipe
+        omelette = [r for r in results if r['recipe_name'] == 'Omelette'][0]
+        self.client().put(url + str(omelette['recipe_id']), headers=headers, data={
+            'recipe_name': 'Omelette', 'ingredients': 'eggs'})
+        res = self.client().get('/api-v1/recipes/cook?pantry=eggs', headers=headers)
+        results = json.loads(res.data.decode())['results']
+        self.assertEqual(results[0]['recipe_name'], 'Omelette')
+        self.assertEqual(results[0]['coverage'], 1.0)
+
+        res = self.client().get('/api-v1/recipes/cook?pantry=caviar', headers=headers)
+        self.assertEqual(res.status_code, 422)
+        res = self.client().get('/api-v1/recipes/cook', headers=headers)
+        self.assertEqual(res.status_code, 400)
+
+    def test_ingredients_added_concurrently(self):
+        """Test a name another request inserted first doesn't keep the others from being added"""
+        with self.app.app_context():
+            Ingredient.insert(['salt'], db.session)
+            # as if 'salt' had been missing when this request looked it up
+            Ingredient.insert(['pepper', 'salt', 'thyme'], db.session)
+            db.session.commit()
+            self.assertEqual(sorted(Ingredient.ids_for(['pepper', 'salt', 'thyme'])),
+                             ['pepper', 'salt', 'thyme'])
+            self.assertEqual(Ingredient.query.count(), 3)
+
+    def test_long_text_and_fields(self):
+        """Test listings leave out the long text unless asked, single recipes keep it"""
+        self.register_user()
+        result=self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        category_res = self.client().post('/api-v1/categories/', headers=headers, data=self.category)
+        url = '/api-v1/categories/{}/recipes/'.format(json.loads(category_res.data.decode())['category_id'])
+        directions = 'Stir the pot and wait. ' * 100
+        res = self.client().post(url, headers=headers, data={
+            'recipe_name': 'Slow Stew', 'ingredients': 'beef, carrots', 'directions': directions})
+        self.assertEqual(res.status_code, 201)
+        recipe_id = json.loads(res.data.decode())['recipe_id']
+
+        res = self.client().get(url, headers=headers)
+        recipe = json.loads(res.data.decode())['results'][0]
+        self.assertNotIn('directions', recipe)
+        self.assertNotIn('ingredients', recipe)
+        self.assertEqual(recipe['recipe_name'], 'Slow Stew')
+
+        res = self.client().get(url + '?cursor=&fields=recipe_name,directions', headers=headers)
+        recipe = json.loads(res.data.decode())['results'][0]
+        self.assertEqual(sorted(recipe), ['directions', 'recipe_id', 'recipe_name'])
+        self.assertEqual(recipe['directions'], directions)
+
+        res = self.client().get(url + '?fields=calories', headers=headers)
+        self.assertEqual(res.status_code, 400)
+
+        res = self.client().get(url + str(recipe_id), headers=headers)
+        self.assertEqual(json.loads(res.data.decode())['directions'], directions)
+
+        # a long comma-free ingredient is indexed under a name that fits the column
+        self.assertEqual([len(name) for name in parse_ingredients('salt, ' + 'x' * 300)], [4, 255])
@@ -0,0 +1,88 @@
+import unittest
+import json
+
+from app import create_app, db
+from app.models.category import Category
+from app.models.stats import UserStats
+
+
+class TestStats(unittest.TestCase):
+    """The per user counters, GET /stats and the listing totals read from them"""
+    def setUp(self):
+        """Define test variables and initialize app"""
+        self.app = create_app(config_name="testing")
+        self.client = self.app.test_client
+
+        # binds the app to the current context
+        with self.app.app_context():
+            # create all tables
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+
+        user = {'email': 'Gela@gela.com',
+                'username': 'Gela',
+                'password': '1234567',
+                'confirm_password': '1234567'}
+        self.client().post('/api-v1/auth/register', data=user)
+        result = self.client().post('/api-v1/auth/login', data=user)
+        access_token = json.loads(result.data.decode())['access_token']
+        self.headers = dict(Authorization="Bearer " + access_token)
+
+    def request(self, method, url, **kwargs):
+        res = getattr(self.client(), method)(url, headers=self.headers, **kwargs)
+        return json.loads(res.data.decode())
+
+    def stats(self):
+        return self.request('get', '/api-v1/stats')
+
+    def test_counts_follow_writes(self):
+        """Test every insert and delete path keeps the counts in step"""
+        self.assertEqual(self.stats(), {'categories': 0, 'recipes': 0})
+        ids = [self.request('post', '/api-v1/categories/', data={'category_name': name})['category_id']
+               for name in ('Stews', 'Salads', 'Pies')]
+        self.request('post', '/api-v1/categories/', data={'category_name': 'Stews'})
+        url = '/api-v1/categories/{}/recipes/'.format(ids[0])
+        recipe_id = self.request('post', url, data={'recipe_name': 'Beef Stew'})['recipe_id']
+        self.request('post', url, data={'recipe_name': 'Beef Stew'})
+        body = '\n'.join(json.dumps({'recipe_name': name}) for name in ('Fish Stew', 'Lamb Stew', 'Bean Stew'))
+        self.client().post(url + 'bulk', headers=self.headers, data=body, content_type='application/x-ndjson')
+        self.request('post', '/api-v1/categories/{}/recipes/'.format(ids[1]), data={'recipe_name': 'Greek Salad'})
+        self.assertEqual(self.stats(), {'categories': 3, 'recipes': 5})
+        self.assertEqual(self.request('get', url + '?per_page=2')['total'], 4)
+
+        self.request('delete', url + str(recipe_id))
+        self.assertEqual(self.stats(), {'categories': 3, 'recipes': 4})
+        self.request('delete', '/api-v1/recipes?ids={},999'.format(recipe_id + 1))
+        self.assertEqual(self.stats(), {'categories': 3, 'recipes': 3})
+        self.assertEqual(self.request('get', url + '?cursor=&per_page=1&include_total=true')['total'], 2)
+        self.request('delete', '/api-v1/categories/{}'.format(ids[1]))
+        self.assertEqual(self.stats(), {'categories': 2, 'recipes': 2})
+        self.request('delete', '/api-v1/categories/?ids={},{}'.format(ids[0], ids[2]))
+        self.assertEqual(self.stats(), {'categories': 0, 'recipes': 0})
+
+    def test_totals_read_counters(self):
+        """Test listing totals come from the counters, which reconcile rebuilds"""
+        for name in ('Stews', 'Salads', 'Pies'):
+            self.request('post', '/api-v1/categories/', data={'category_name': name})
+        with self.app.app_context():
+            # a drifted counter, e.g. rows written around the models
+            UserStats.query.update({UserStats.category_count: 7})
+            Category.query.update({Category.recipe_count: 5})
+            db.session.commit()
+        self.assertEqual(self.request('get', '/api-v1/categories/?per_page=2')['total'], 7)
+        # searches still COUNT what they match
+        self.assertEqual(self.request('get', '/api-v1/categories/?per_page=1&q=stews')['total'], 1)
+        with self.app.app_context():
+            self.assertEqual(UserStats.reconcile(), 1)
+            self.assertEqual(Category.query.filter(Category.recipe_count != 0).count(), 0)
+        # a new page, the cached one keeps the old total until it expires
+        self.assertEqual(self.request('get', '/api-v1/categories/?per_page=1')['total'], 3)
+        self.assertEqual(self.stats(), {'categories': 3, 'recipes': 0})
+
+    def tearDown(self):
+        """teardown all initialized variables."""
+        with self.app.app_context():
+            # drop all tables
+            db.session.remove()
+            db.drop_all()
@@ -0,0 +1,149 @@
+import unittest
+import json
+from datetime import datetime, timedelta
+
+from app import create_app, db
+from app.models.category import Category
+from app.models.changelog import ChangeLog
+from app.models.recipe import Recipe
+from app.models.ingredient import RecipeIngredient
+from app.sync.views import encode_token, TIMESTAMP
+
+
+class TestSync(unittest.TestCase):
+    """GET /sync, rows changed since a token and tombstones of deleted ones"""
+    def setUp(self):
+        """Define test variables and initialize app"""
+        self.app = create_app(config_name="testing")
+        # no re-reading, so a sync right after another returns nothing
+        self.app.config['SYNC_OVERLAP_SECONDS'] = 0
+        self.client = self.app.test_client
+
+        # binds the app to the current context
+        with self.app.app_context():
+            # create all tables
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+
+        user = {'email': 'Gela@gela.com',
+                'username': 'Gela',
+                'password': '1234567',
+                'confirm_password': '1234567'}
+        self.client().post('/api-v1/auth/register', data=user)
+        result = self.client().post('/api-v1/auth/login', data=user)
+        access_token = json.loads(result.data.decode())['access_token']
+        self.headers = dict(Authorization="Bearer " + access_token)
+        self.category_ids = [self.post('/api-v1/categories/', {'category_name': name})['category_id']
+                             for name in ('Stews', 'Salads')]
+        self.recipe_ids = [self.post(self.recipes_url(index), {'recipe_name': name})['recipe_id']
+                           for index, name in ((0, 'Beef Stew'), (1, 'Greek Salad'))]
+        self.backdate(Category, Recipe)
+
+    def recipes_url(self, index):
+        return '/api-v1/categories/{}/recipes/'.format(self.category_ids[index])
+
+    def post(self, url, data):
+        return json.loads(self.client().post(url, headers=self.headers, data=data).data.decode())
+
+    def backdate(self, *models):
+        """Moves every row's timestamp an hour back, as if written before the last sync"""
+        with self.app.app_context():
+            for model in models:
+                column = model.deleted_at if model is ChangeLog else model.date_modified
+                model.query.update({column: datetime.utcnow() - timedelta(hours=1)},
+                                   synchronize_session=False)
+            db.session.commit()
+
+    def sync(self, since=None, status=200):
+        url = '/api-v1/sync' + ('?since=' + since if since is not None else '')
+        res = self.client().get(url, headers=self.headers)
+        self.assertEqual(res.status_code, status, res.data)
+        return json.loads(res.data.decode())
+
+    def test_full_then_delta(self):
+        """Test a sync returns only what changed since the previous one"""
+        data = self.sync()
+        self.assertEqual(sorted(c['category_id'] for c in data['categories']), self.category_ids)
+        self.assertEqual(sorted(r['recipe_id'] for r in data['recipes']), self.recipe_ids)
+        self.assertEqual(data['deleted'], {'categories': [], 'recipes': []})
+        self.assertFalse(data['has_more'])
+
+        data = self.sync(data['next'])
+        self.assertEqual((data['categories'], data['recipes']), ([], []))
+
+        self.client().put(self.recipes_url(0) + str(self.recipe_ids[0]), headers=self.headers,
+                          data={'recipe_name': 'Lamb Stew', 'directions': 'Stir.'})
+        self.client().delete('/api-v1/categories/{}'.format(self.category_ids[1]), headers=self.headers)
+        delta = self.sync(data['next'])
+        self.assertEqual([(r['recipe_name'], r['directions']) for r in delta['recipes']],
+                         [('Lamb Stew', 'Stir.')])
+        self.assertEqual(delta['categories'], [])
+        self.assertEqual(delta['deleted'], {'categories': [self.category_ids[1]],
+                                            'recipes': [self.recipe_ids[1]]})
+
+    def test_reindex_is_not_a_change(self):
+        """Test rebuilding the ingredient index doesn't send every recipe again"""
+        data = self.sync()
+        with self.app.app_context():
+            RecipeIngredient.reindex(self.app.config['BULK_IMPORT_CHUNK_SIZE'])
+        data = self.sync(data['next'])
+        self.assertEqual((data['categories'], data['recipes']), ([], []))
+
+    def test_paging(self):
+        """Test a round is paged through with has_more until every row is sent"""
+        self.app.config['SYNC_PAGE_SIZE'] = 1
+        self.post(self.recipes_url(0), {'recipe_name': 'Fish Stew'})
+        categories, recipes, pages, token = [], [], 0, None
+        while True:
+            data = self.sync(token)
+            categories += [c['category_id'] for c in data['categories']]
+            recipes += [r['recipe_id'] for r in data['recipes']]
+            pages, token = pages + 1, data['next']
+            if not data['has_more']:
+                break
+        self.assertEqual(sorted(categories), self.category_ids)
+        self.assertEqual(len(recipes), 3)
+        self.assertEqual(len(set(recipes)), 3)
+        self.assertEqual(pages, 3)
+
+    def test_other_users_rows(self):
+        """Test a sync only returns the user's own rows and tombstones"""
+        token = self.sync()['next']
+        other = {'email': 'other@gela.com', 'username': 'Other',
+                 'password': '1234567', 'confirm_password': '1234567'}
+        self.client().post('/api-v1/auth/register', data=other)
+        result = self.client().post('/api-v1/auth/login', data=other)
+        headers = dict(Authorization="Bearer " + json.loads(result.data.decode())['access_token'])
+        res = self.client().post('/api-v1/categories/', headers=headers, data={'category_name': 'Pies'})
+        self.client().delete('/api-v1/categories/{}'.format(json.loads(res.data.decode())['category_id']),
+                             headers=headers)
+        data = self.sync(token)
+        self.assertEqual((data['categories'], data['deleted']['categories']), ([], []))
+
+    def test_invalid_and_expired_tokens(self):
+        """Test a bad token gets a 400 and one older than the tombstones a 410"""
+        self.sync('nonsense', status=400)
+        self.sync(encode_token({'since': 'yesterday'}), status=400)
+        self.sync(encode_token({'since': None, 'recipes': ['x', 1]}), status=400)
+        expired = datetime.utcnow() - timedelta(days=self.app.config['SYNC_TOMBSTONE_DAYS'] + 1)
+        data = self.sync(encode_token({'since': expired.strftime(TIMESTAMP)}), status=410)
+        self.assertEqual(data['message'], 'Sync token expired, sync again without since.')
+
+    def test_prune(self):
+        """Test tombstones older than SYNC_TOMBSTONE_DAYS are pruned"""
+        self.client().delete(self.recipes_url(0) + str(self.recipe_ids[0]), headers=self.headers)
+        self.client().delete(self.recipes_url(1) + str(self.recipe_ids[1]), headers=self.headers)
+        with self.app.app_context():
+            ChangeLog.query.filter(ChangeLog.entity_id == self.recipe_ids[0]).update(
+                {ChangeLog.deleted_at: datetime.utcnow() - timedelta(days=40)}, synchronize_session=False)
+            db.session.commit()
+            self.assertEqual(ChangeLog.prune(self.app.config['SYNC_TOMBSTONE_DAYS']), 1)
+            self.assertEqual([c.entity_id for c in ChangeLog.query], [self.recipe_ids[1]])
+
+    def tearDown(self):
+        """teardown all initialized variables."""
+        with self.app.app_context():
+            # drop all tables
+            db.session.remove()
+            db.drop_all()